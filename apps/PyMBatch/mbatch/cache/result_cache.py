@@ -0,0 +1,221 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Copyright (c) 2011-2024 University of Texas MD Anderson Cancer Center
+
+This program is free software: you can redistribute it and/or modify it under the terms of the
+GNU General Public License as published by the Free Software Foundation, either version 2 of
+the License, or (at your option) any later version.
+
+This program is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY;
+without even the implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+See the GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License along with this program.
+If not, see <https://www.gnu.org/licenses/>.
+
+MD Anderson Cancer Center Bioinformatics on GitHub <https://github.com/MD-Anderson-Bioinformatics>
+MD Anderson Cancer Center Bioinformatics at MDA <https://www.mdanderson.org/research/departments-labs-institutes/departments-divisions/bioinformatics-and-computational-biology.html>
+@author: Tod Casasent
+"""
+
+from typing import Callable, List, Optional, Tuple
+import typing
+import hashlib
+import os
+import shutil
+import tempfile
+import numpy
+import pandas
+import scipy.sparse
+
+
+# default size limit for a ResultCache directory (4 GB)
+DEFAULT_CACHE_BYTES: int = 4 * 2**30
+
+
+def hash_update(the_hasher: 'hashlib._Hash', the_part: typing.Any) -> None:
+    """
+    Add one value to a hash, with its type and shape, so different values give different keys.
+    Handles numpy arrays (numeric or string), scipy.sparse matrices, pandas DataFrame and Series,
+    lists, tuples, dicts, and scalars (str, int, float, bool, None).
+    Numeric arrays are hashed as C-order bytes, so the same values in C or Fortran order give the same key.
+    :param the_hasher: hashlib object to update
+    :param the_part: value to add
+    :return: nothing
+    """
+    if isinstance(the_part, pandas.DataFrame):
+        the_hasher.update(b'DataFrame')
+        hash_update(the_hasher, the_part.index.to_numpy())
+        hash_update(the_hasher, the_part.columns.to_numpy())
+        hash_update(the_hasher, the_part.to_numpy())
+    elif isinstance(the_part, pandas.Series):
+        the_hasher.update(b'Series')
+        hash_update(the_hasher, the_part.index.to_numpy())
+        hash_update(the_hasher, the_part.to_numpy())
+    elif scipy.sparse.issparse(the_part):
+        csr: scipy.sparse.csr_matrix = scipy.sparse.csr_matrix(the_part)
+        csr.sort_indices()
+        the_hasher.update(b'sparse')
+        hash_update(the_hasher, csr.shape)
+        hash_update(the_hasher, csr.data)
+        hash_update(the_hasher, csr.indices)
+        hash_update(the_hasher, csr.indptr)
+    elif isinstance(the_part, numpy.ndarray):
+        the_hasher.update(f'ndarray{the_part.shape}'.encode('utf-8'))
+        if the_part.dtype.kind in ('O', 'U', 'S'):
+            # object arrays hold pointers, so hash the strings
+            the_hasher.update(b'str')
+            the_hasher.update('\0'.join([str(elem) for elem in the_part.ravel(order='C')]).encode('utf-8'))
+        else:
+            the_hasher.update(the_part.dtype.str.encode('utf-8'))
+            the_hasher.update(memoryview(numpy.ascontiguousarray(the_part)).cast('B'))
+    elif isinstance(the_part, (list, tuple)):
+        the_hasher.update(f'{type(the_part).__name__}{len(the_part)}'.encode('utf-8'))
+        elem: typing.Any
+        for elem in the_part:
+            hash_update(the_hasher, elem)
+    elif isinstance(the_part, dict):
+        the_hasher.update(f'dict{len(the_part)}'.encode('utf-8'))
+        key: str
+        for key in sorted(the_part.keys()):
+            hash_update(the_hasher, key)
+            hash_update(the_hasher, the_part[key])
+    else:
+        # scalars, type name keeps 1 and '1' and True apart
+        the_hasher.update(f'{type(the_part).__name__}:{the_part!r}\0'.encode('utf-8'))
+
+
+def make_cache_key(*the_parts: typing.Any) -> str:
+    """
+    Content address for a calculation: hash of its inputs and parameters (see hash_update).
+    Put the calculation name and a version first, so changed code does not use old results.
+    :param the_parts: values to hash, in order
+    :return: hex digest string
+    """
+    hasher: 'hashlib._Hash' = hashlib.blake2b(digest_size=32)
+    part: typing.Any
+    for part in the_parts:
+        hash_update(hasher, part)
+    return hasher.hexdigest()
+
+
+def get_dir_size(the_dir: str) -> int:
+    """
+    Total size of files under directory
+    :param the_dir: directory to check
+    :return: size in bytes
+    """
+    total: int = 0
+    root: str
+    files: List[str]
+    for root, _, files in os.walk(the_dir):
+        file_name: str
+        for file_name in files:
+            total += os.path.getsize(os.path.join(root, file_name))
+    return total
+
+
+class ResultCache:
+    """
+    On-disk cache of calculation results, one directory per content address (see make_cache_key).
+    Entries are written to a temporary directory and renamed into place, so an entry is complete if it exists.
+    Using an entry updates its modification time, and when the cache is larger than m_max_bytes
+    the least recently used entries are removed.
+    MEMBER VALUES
+    m_cache_dir: str - directory holding cache entries
+    m_max_bytes: int - size limit for cache directory
+    """
+    # do not set method variables, as they should be initialized in the init function
+    m_cache_dir: str
+    m_max_bytes: int
+
+    def __init__(self: 'ResultCache', the_cache_dir: str, the_max_bytes: int = DEFAULT_CACHE_BYTES) -> None:
+        """
+        init and create cache directory if needed.
+        Members described at class level
+        :param the_cache_dir: directory holding cache entries
+        :param the_max_bytes: size limit for cache directory
+        """
+        super().__init__()
+        self.m_cache_dir = the_cache_dir
+        self.m_max_bytes = the_max_bytes
+        os.makedirs(self.m_cache_dir, exist_ok=True)
+
+    def entry_dir(self: 'ResultCache', the_key: str) -> str:
+        """
+        Directory for cache entry
+        :param the_key: key from make_cache_key
+        :return: full path to entry directory (may not exist)
+        """
+        return os.path.join(self.m_cache_dir, the_key)
+
+    def fetch(self: 'ResultCache', the_key: str) -> Optional[str]:
+        """
+        Find cache entry, and mark it as recently used
+        :param the_key: key from make_cache_key
+        :return: full path to entry directory, or None if not cached
+        """
+        entry: str = self.entry_dir(the_key)
+        if not os.path.isdir(entry):
+            print(f"ResultCache::fetch miss {the_key}", flush=True)
+            return None
+        try:
+            os.utime(entry)
+        except FileNotFoundError:
+            # removed by another process
+            return None
+        print(f"ResultCache::fetch hit {the_key}", flush=True)
+        return entry
+
+    def store(self: 'ResultCache', the_key: str, the_writer: Callable[[str], None]) -> str:
+        """
+        Add cache entry, then remove least recently used entries if over size limit.
+        If another process stored the same key first, that entry is kept.
+        :param the_key: key from make_cache_key
+        :param the_writer: function that writes result files into the directory it is given
+        :return: full path to entry directory
+        """
+        entry: str = self.entry_dir(the_key)
+        temp_dir: str = tempfile.mkdtemp(prefix='tmp-', dir=self.m_cache_dir)
+        try:
+            the_writer(temp_dir)
+            os.rename(temp_dir, entry)
+            print(f"ResultCache::store {the_key}", flush=True)
+        except OSError:
+            if not os.path.isdir(entry):
+                raise
+        finally:
+            if os.path.isdir(temp_dir):
+                shutil.rmtree(temp_dir, ignore_errors=True)
+        self.evict(the_key)
+        return entry
+
+    def evict(self: 'ResultCache', the_keep_key: Optional[str] = None) -> int:
+        """
+        Remove least recently used entries until cache is within m_max_bytes
+        :param the_keep_key: key of entry not to remove (such as the one just stored)
+        :return: number of entries removed
+        """
+        entries: List[Tuple[float, int, str]] = []
+        total: int = 0
+        dir_entry: os.DirEntry
+        for dir_entry in os.scandir(self.m_cache_dir):
+            # skip temporary directories being written
+            if dir_entry.is_dir() and (not dir_entry.name.startswith('tmp-')):
+                size: int = get_dir_size(dir_entry.path)
+                total += size
+                if dir_entry.name != the_keep_key:
+                    entries.append((dir_entry.stat().st_mtime, size, dir_entry.path))
+        entries.sort()
+        removed: int = 0
+        mtime: float
+        path: str
+        for mtime, size, path in entries:
+            if total <= self.m_max_bytes:
+                break
+            print(f"ResultCache::evict {path} last used {mtime}", flush=True)
+            shutil.rmtree(path, ignore_errors=True)
+            total -= size
+            removed += 1
+        return removed
@@ -20,12 +20,14 @@ MD Anderson Cancer Center Bioinformatics at MDA <https://www.mdanderson.org/rese
 """
 
 import os
-from typing import Dict, List
+from typing import Dict, List, Union
 from mbatch.pipeline.std_data import StandardizedData, build_std_pipeline_index
-from mbatch.pipeline.std_data import find_historical_standardized_data, write_std_pipeline_index
+from mbatch.pipeline.std_data import find_historical_standardized_data
+from mbatch.pipeline.index_store import PipelineIndexStore, recover_std_pipeline_index
 from mbatch.visualindex.visual_index_base import VisualIndexBase, VisualIndexElementBase
 from mbatch.visualindex.visual_index_dsc import VisualIndexDsc, VisualIndexElementDsc
 from mbatch.pipeline.job import create_job, queue_job
+from mbatch.pipeline.job_status import DEFAULT_STATUS_WORKERS, poll_job_status
 from mbatch.test.common import add_error, delete_from_dirs
 from mbatch.test.test_index import create_index_archive
 
@@ -45,7 +47,8 @@ def extract_batch(the_analysis_path: str) -> str:
 # pylint: disable=too-many-arguments,too-many-locals,too-many-statements,too-many-nested-blocks,too-many-branches,unused-argument
 def continue_correct(the_input_dir: str, the_output_dir: str, the_index_file: str, the_util_dir: str,
                      the_bei_url: str, the_bei_dir: str, the_run_version: str, the_run_source: str,
-                     the_base_dir: str, the_sample_column_name: str) -> None:
+                     the_base_dir: str, the_sample_column_name: str,
+                     the_status_workers: int = DEFAULT_STATUS_WORKERS, the_status_rate: float = 0.0) -> None:
     """
     Check the pipeline for correctable datasets, running MBatch on any unprocessed datasets
     :param the_input_dir: full directory path containing standardized data ZIP files (uses Standardized Data std_archive path)
@@ -58,6 +61,8 @@ def continue_correct(the_input_dir: str, the_output_dir: str, the_index_file: st
     :param the_run_source: string source, GDC or MWB
     :param the_base_dir: string detailing Docker internal path like /DAPI_MQA/DATA
     :param the_sample_column_name: column string for samples in batch (different for GDC vs MWB)
+    :param the_status_workers: number of concurrent BEI job status requests
+    :param the_status_rate: maximum BEI job status requests per second, zero for no limit
     :return: nothing
     """
     # TODO: code is partially duplicated in check_correct
@@ -73,8 +78,14 @@ def continue_correct(the_input_dir: str, the_output_dir: str, the_index_file: st
     # vik: VisualIndexKwd = VisualIndexKwd(kwd_index_file, the_base_dir)
     # vik.populate_index()
     # process pipeline
+    recover_std_pipeline_index(the_index_file)
     std_list: List[StandardizedData] = build_std_pipeline_index(the_input_dir, the_index_file, False)
+    # job changes are saved per entry to the index store, and the TSV exported at the end
+    store: PipelineIndexStore = PipelineIndexStore(the_index_file)
+    store.replace_entries(std_list)
     print('*************************************************', flush=True)
+    # poll BEI for unfinished jobs concurrently, statuses are applied in index order below
+    job_statuses: Dict[str, Union[str, Exception]] = poll_job_status(std_list, the_bei_url, the_status_workers, the_status_rate)
     my_std: StandardizedData
     for my_std in std_list:
         if my_std.job_id == '':
@@ -83,7 +94,7 @@ def continue_correct(the_input_dir: str, the_output_dir: str, the_index_file: st
             if my_std.job_id != 'no-processing':
                 # status_job -> created, queued, running, succeeded, failed, no-processing
                 # call returns and *updates* instance status
-                changed: bool = my_std.status_job(the_bei_url)
+                changed: bool = my_std.status_job(the_bei_url, job_statuses)
                 job_status: str = my_std.job_status
                 if changed & ('succeeded' == job_status):
                     # Handle succeeded Job
@@ -120,9 +131,9 @@ def continue_correct(the_input_dir: str, the_output_dir: str, the_index_file: st
                     # Handle queued Job
                     print(f'Queued {my_std.version} {my_std.std_archive}', flush=True)
                 if changed:
-                    # write index file update
-                    print(f"write updated index {the_index_file}", flush=True)
-                    write_std_pipeline_index(the_index_file, std_list)
+                    # save index entry update
+                    store.save_entry(my_std)
+    store.finish()
     print('*************************************************', flush=True)
 # pylint: enable=too-many-arguments,too-many-locals,too-many-statements,too-many-nested-blocks,too-many-branches,unused-argument
 
@@ -159,7 +170,11 @@ def initiate_correct(the_input_dir: str, the_output_dir: str, the_index_file: st
     # vik: VisualIndexKwd = VisualIndexKwd(kwd_index_file, the_base_dir)
     # vik.populate_index()
     # process pipeline
+    recover_std_pipeline_index(the_index_file)
     std_list: List[StandardizedData] = build_std_pipeline_index(the_input_dir, the_index_file, False)
+    # new jobs are saved per entry to the index store, and the TSV exported at the end
+    store: PipelineIndexStore = PipelineIndexStore(the_index_file)
+    store.replace_entries(std_list)
     ##########################################################################
     # collect DSC correctable datasets
     ##########################################################################
@@ -233,9 +248,8 @@ def initiate_correct(the_input_dir: str, the_output_dir: str, the_index_file: st
                 queue_job(my_std, the_bei_url)
                 # add my_std entry to std_list to track progress
                 std_list.append(my_std)
-                # write index file update
-                print(f"write updated index {the_index_file}", flush=True)
-                write_std_pipeline_index(the_index_file, std_list)
+                # save index entry update
+                store.save_entry(my_std)
     ##########################################################################
     # run KWD corrections
     ##########################################################################
@@ -260,6 +274,7 @@ def initiate_correct(the_input_dir: str, the_output_dir: str, the_index_file: st
     #             # write index file update
     #             print(f"write updated index {the_index_file}", flush=True)
     #             write_std_pipeline_index(the_index_file, std_list)
+    store.finish()
     print('*************************************************', flush=True)
 # pylint: enable=too-many-arguments,too-many-locals,too-many-statements,too-many-nested-blocks,too-many-branches,unused-argument
 
@@ -0,0 +1,194 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Copyright (c) 2011-2024 University of Texas MD Anderson Cancer Center
+
+This program is free software: you can redistribute it and/or modify it under the terms of the
+GNU General Public License as published by the Free Software Foundation, either version 2 of
+the License, or (at your option) any later version.
+
+This program is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY;
+without even the implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+See the GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License along with this program.
+If not, see <https://www.gnu.org/licenses/>.
+
+MD Anderson Cancer Center Bioinformatics on GitHub <https://github.com/MD-Anderson-Bioinformatics>
+MD Anderson Cancer Center Bioinformatics at MDA <https://www.mdanderson.org/research/departments-labs-institutes/departments-divisions/bioinformatics-and-computational-biology.html>
+@author: Tod Casasent
+"""
+
+from typing import Optional, List
+import os
+import numpy
+from mbatch.cache.result_cache import ResultCache, make_cache_key, DEFAULT_CACHE_BYTES
+from mbatch.dsc.dsc_info import DscInfo, write_dsc_info_list, read_dsc_info_list
+from mbatch.dsc.dsc_pvalue import DscPvalue
+from mbatch.dsc.dsc_calc import dsc_calc, dsc_calc_codes
+from mbatch.dsc.dsc_perm import dsc_perm_pvalue, dsc_perm_calc_count, dsc_perm_calc_count_codes
+
+
+# change when DSC results change, so old cache entries are not used
+DSC_CACHE_VERSION: str = 'dsc-1'
+
+
+# pylint: disable=too-many-arguments
+def dsc_calc_cached(the_cache_dir: str, the_matrix: numpy.ndarray, the_batches: numpy.ndarray,
+                    the_time_flag: bool = False, the_engine: str = 'loop',
+                    the_cache_bytes: int = DEFAULT_CACHE_BYTES) -> DscInfo:
+    """
+    dsc_calc with results kept in a ResultCache, keyed on matrix values, batches, and engine.
+    On a cache hit, the stored DscInfo is returned without calculation.
+    :param the_cache_dir: directory for ResultCache
+    :param the_matrix: samples across the top, features down the side (see dsc_calc)
+    :param the_batches: list of strings with batch ids for samples
+    :param the_time_flag: true to write time string (only used when calculating)
+    :param the_engine: 'loop' or 'vector' (see dsc_calc)
+    :param the_cache_bytes: size limit for cache directory
+    :return: DscInfo object contain results of DSC calculation
+    """
+    cache: ResultCache = ResultCache(the_cache_dir, the_cache_bytes)
+    key: str = make_cache_key('dsc_calc', DSC_CACHE_VERSION, the_matrix, numpy.asarray(the_batches), the_engine)
+    entry: Optional[str] = cache.fetch(key)
+    result: DscInfo = DscInfo()
+    if entry is not None:
+        result.read_from_binary(os.path.join(entry, 'dsc_info.npy'))
+    else:
+        result = dsc_calc(the_matrix, the_batches, the_time_flag, the_engine)
+        cache.store(key, lambda the_dir: result.write_to_binary(os.path.join(the_dir, 'dsc_info.npy')))
+    return result
+# pylint: enable=too-many-arguments
+
+
+# pylint: disable=too-many-arguments
+def dsc_perm_pvalue_cached(the_cache_dir: str, the_df: numpy.ndarray, the_batches: numpy.ndarray,
+                           the_seed: int, the_perms: int, the_threads: int,
+                           the_null_flag: bool = False, the_engine: str = 'loop', the_exceed_limit: int = 0,
+                           the_cache_bytes: int = DEFAULT_CACHE_BYTES) -> DscPvalue:
+    """
+    dsc_perm_pvalue with results kept in a ResultCache, keyed on matrix values, batches,
+    seed, permutations, and options. Threads are not part of the key, since results
+    for a seed are the same for any number of cores.
+    On a cache hit, the stored DscPvalue is returned without permutations.
+    :param the_cache_dir: directory for ResultCache
+    :param the_df: matrix to permute
+    :param the_batches: batches for samples
+    :param the_seed: seed for random number generator
+    :param the_perms: number of permutations to do
+    :param the_threads: number of threads/cores to use
+    :param the_null_flag: if True, keep overall DSC of each permutation
+    :param the_engine: DSC engine, 'loop' or 'vector', passed to dsc_calc
+    :param the_exceed_limit: if greater than zero, stop early after this many exceedances
+    :param the_cache_bytes: size limit for cache directory
+    :return: DscPvalue with counts and p-values
+    """
+    cache: ResultCache = ResultCache(the_cache_dir, the_cache_bytes)
+    key: str = make_cache_key('dsc_perm_pvalue', DSC_CACHE_VERSION, numpy.asarray(the_df), numpy.asarray(the_batches),
+                              the_seed, the_perms, the_null_flag, the_engine, the_exceed_limit)
+    entry: Optional[str] = cache.fetch(key)
+    result: DscPvalue
+    if entry is not None:
+        result = DscPvalue(DscInfo(), the_null_flag)
+        result.read_from_binary(os.path.join(entry, 'dsc_pvalue.npz'))
+    else:
+        result = dsc_perm_pvalue(the_df, the_batches, the_seed, the_perms, the_threads,
+                                 the_null_flag, the_engine, the_exceed_limit)
+        cache.store(key, lambda the_dir: result.write_to_binary(os.path.join(the_dir, 'dsc_pvalue.npz')))
+    return result
+# pylint: enable=too-many-arguments
+
+
+# pylint: disable=too-many-arguments
+def dsc_perm_calc_count_cached(the_cache_dir: str, the_df: numpy.ndarray, the_batches: numpy.ndarray,
+                               the_seed: int, the_perms: int, the_threads: int,
+                               the_shared_flag: bool = False, the_engine: str = 'loop',
+                               the_cache_bytes: int = DEFAULT_CACHE_BYTES) -> List[DscInfo]:
+    """
+    dsc_perm_calc_count with results kept in a ResultCache, keyed on matrix values, batches,
+    seed, permutations, and options. Threads are not part of the key, since permutations
+    for a seed are drawn in the same order for any number of cores.
+    On a cache hit, the stored list of DscInfo is returned without permutations.
+    :param the_cache_dir: directory for ResultCache
+    :param the_df: matrix to permute
+    :param the_batches: batches for samples
+    :param the_seed: seed for random number generator
+    :param the_perms: number of permutations to do
+    :param the_threads: number of threads/cores to use
+    :param the_shared_flag: if True, use shared memory and seed-spawned workers (DscPerm.perm_dsc_shared)
+    :param the_engine: DSC engine, 'loop' or 'vector', passed to dsc_calc
+    :param the_cache_bytes: size limit for cache directory
+    :return: list of DscInfo of permuted matrix
+    """
+    cache: ResultCache = ResultCache(the_cache_dir, the_cache_bytes)
+    key: str = make_cache_key('dsc_perm_calc_count', DSC_CACHE_VERSION, numpy.asarray(the_df), numpy.asarray(the_batches),
+                              the_seed, the_perms, the_shared_flag, the_engine)
+    entry: Optional[str] = cache.fetch(key)
+    result: List[DscInfo]
+    if entry is not None:
+        result = read_dsc_info_list(os.path.join(entry, 'dsc_perms.npy'), False)
+    else:
+        result = dsc_perm_calc_count(the_df, the_batches, the_seed, the_perms, the_threads, the_shared_flag, the_engine)
+        cache.store(key, lambda the_dir: write_dsc_info_list(result, os.path.join(the_dir, 'dsc_perms.npy')))
+    return result
+# pylint: enable=too-many-arguments
+
+
+# pylint: disable=too-many-arguments
+def dsc_calc_codes_cached(the_cache_dir: str, the_matrix: numpy.ndarray, the_codes: numpy.ndarray, the_levels: numpy.ndarray,
+                          the_time_flag: bool = False, the_cache_bytes: int = DEFAULT_CACHE_BYTES) -> DscInfo:
+    """
+    dsc_calc_codes with results kept in a ResultCache, keyed on matrix values, batch codes, and levels.
+    Matrix and codes are used as given for the key and the calculation, so a Fortran-ordered matrix from R is not converted.
+    :param the_cache_dir: directory for ResultCache
+    :param the_matrix: float64 matrix, samples across the top, features down the side, C or Fortran order
+    :param the_codes: integer batch code for each sample, 0 based index into the_levels
+    :param the_levels: batch ids
+    :param the_time_flag: true to write time string (only used when calculating)
+    :param the_cache_bytes: size limit for cache directory
+    :return: DscInfo object contain results of DSC calculation
+    """
+    cache: ResultCache = ResultCache(the_cache_dir, the_cache_bytes)
+    key: str = make_cache_key('dsc_calc_codes', DSC_CACHE_VERSION, the_matrix, the_codes, numpy.asarray(the_levels))
+    entry: Optional[str] = cache.fetch(key)
+    result: DscInfo = DscInfo()
+    if entry is not None:
+        result.read_from_binary(os.path.join(entry, 'dsc_info.npy'))
+    else:
+        result = dsc_calc_codes(the_matrix, the_codes, the_levels, the_time_flag)
+        cache.store(key, lambda the_dir: result.write_to_binary(os.path.join(the_dir, 'dsc_info.npy')))
+    return result
+# pylint: enable=too-many-arguments
+
+
+# pylint: disable=too-many-arguments
+def dsc_perm_calc_count_codes_cached(the_cache_dir: str, the_matrix: numpy.ndarray, the_codes: numpy.ndarray,
+                                     the_levels: numpy.ndarray, the_seed: int, the_perms: int, the_threads: int,
+                                     the_shared_flag: bool = False,
+                                     the_cache_bytes: int = DEFAULT_CACHE_BYTES) -> List[DscInfo]:
+    """
+    dsc_perm_calc_count_codes with results kept in a ResultCache, keyed as dsc_perm_calc_count_cached
+    but on batch codes and levels. Threads are not part of the key.
+    :param the_cache_dir: directory for ResultCache
+    :param the_matrix: float64 matrix to permute, samples across the top, features down the side, C or Fortran order
+    :param the_codes: integer batch code for each sample, 0 based index into the_levels
+    :param the_levels: batch ids
+    :param the_seed: seed for random number generator
+    :param the_perms: number of permutations to do
+    :param the_threads: number of threads/cores to use
+    :param the_shared_flag: if True, use shared memory and seed-spawned workers (DscPerm.perm_dsc_shared)
+    :param the_cache_bytes: size limit for cache directory
+    :return: list of DscInfo of permuted matrix
+    """
+    cache: ResultCache = ResultCache(the_cache_dir, the_cache_bytes)
+    key: str = make_cache_key('dsc_perm_calc_count_codes', DSC_CACHE_VERSION, the_matrix, the_codes, numpy.asarray(the_levels),
+                              the_seed, the_perms, the_shared_flag)
+    entry: Optional[str] = cache.fetch(key)
+    result: List[DscInfo]
+    if entry is not None:
+        result = read_dsc_info_list(os.path.join(entry, 'dsc_perms.npy'), False)
+    else:
+        result = dsc_perm_calc_count_codes(the_matrix, the_codes, the_levels, the_seed, the_perms, the_threads, the_shared_flag)
+        cache.store(key, lambda the_dir: write_dsc_info_list(result, os.path.join(the_dir, 'dsc_perms.npy')))
+    return result
+# pylint: enable=too-many-arguments
@@ -19,15 +19,19 @@ MD Anderson Cancer Center Bioinformatics at MDA <https://www.mdanderson.org/rese
 @author: Tod Casasent
 """
 
-from typing import List
+from typing import List, Tuple, Dict
+import typing
 import math
 import time
 import numpy
-from mbatch.dsc.dsc_info import DscInfo, epsilon_zero_check_value
+import scipy.sparse
+from mbatch.dsc.dsc_info import DscInfo, epsilon_zero_check_value, epsilon_zero_check_array
+from mbatch.stddata.stddata import StdData
 
 
 # pylint: disable=too-many-locals,too-many-statements
-def dsc_calc(the_matrix: numpy.ndarray, the_batches: numpy.ndarray, the_time_flag: bool = False) -> DscInfo:
+def dsc_calc(the_matrix: numpy.ndarray, the_batches: numpy.ndarray, the_time_flag: bool = False,
+             the_engine: str = 'loop') -> DscInfo:
     """
     Perform DSC calculations for the given data.
     For more details see: https://bioinformatics.mdanderson.org/public-software/tcga-batch-effects/#the-dsc-metric
@@ -36,10 +40,17 @@ def dsc_calc(the_matrix: numpy.ndarray, the_batches: numpy.ndarray, the_time_fla
     Db can roughly be viewed as the average distance between batch centroids and global mean.
     Same three values are also calculated and returned for each feature.
     :param the_matrix: samples across the top, features down the side, Decimal values
+                       (scipy.sparse CSR/CSC matrix uses dsc_calc_sparse, for either engine)
     :param the_batches: list of strings with batch ids for samples
     :param the_time_flag: true to write time string (defaults to False)
+    :param the_engine: 'loop' for per-feature calculation, 'vector' for whole-matrix calculation (see dsc_calc_vector)
     :return: DscInfo object contain results of DSC calculation
     """
+    assert the_engine in ('loop', 'vector'), "DSC engine should be 'loop' or 'vector'"
+    if scipy.sparse.issparse(the_matrix):
+        return dsc_calc_sparse(the_matrix, the_batches, the_time_flag)
+    if 'vector' == the_engine:
+        return dsc_calc_vector(the_matrix, the_batches, the_time_flag)
     # print("*******************start******************", flush=True)
     start: float = time.time()
     # check if the_batches is a dataframe -- the way R passes value
@@ -200,3 +211,422 @@ def dsc_calc(the_matrix: numpy.ndarray, the_batches: numpy.ndarray, the_time_fla
         print(f"dsc_calc time to run={(finish-start)} seconds", flush=True)
     return result_info
 # pylint: enable=too-many-locals,too-many-statements
+
+
+def factorize_batches(the_batches: numpy.ndarray) -> Tuple[numpy.ndarray, numpy.ndarray]:
+    """
+    Convert batch ids for samples into integer codes, done once per batch vector
+    :param the_batches: list of strings with batch ids for samples
+    :return: tuple of integer code per sample and sorted unique batch ids (levels), code is index into levels
+    """
+    levels: numpy.ndarray
+    codes: numpy.ndarray
+    levels, codes = numpy.unique(the_batches, return_inverse=True)
+    # newer numpy returns inverse in shape of input
+    codes = codes.reshape(-1)
+    return codes, levels
+
+
+def batch_indicator(the_codes: numpy.ndarray, the_levels_cnt: int, the_dtype: type = numpy.float64) -> numpy.ndarray:
+    """
+    Build samples x batches indicator matrix (1.0 if sample is in batch), used to get group sums with a matrix product
+    :param the_codes: integer batch code for each sample
+    :param the_levels_cnt: number of batches (levels)
+    :param the_dtype: dtype for indicator matrix
+    :return: numpy.ndarray samples x batches
+    """
+    indicator: numpy.ndarray = numpy.zeros((the_codes.size, the_levels_cnt), dtype=the_dtype)
+    indicator[numpy.arange(the_codes.size), the_codes] = 1.0
+    return indicator
+
+
+def dsc_group_stats(the_matrix: numpy.ndarray, the_codes: numpy.ndarray,
+                    the_levels_cnt: int) -> Tuple[numpy.ndarray, numpy.ndarray, numpy.ndarray]:
+    """
+    Compute per-feature, per-batch sufficient statistics for DSC for the whole matrix at once.
+    Sum of squares is centered on the batch mean (sum of squared deviations), which avoids
+    the cancellation of the raw sum of squares and can still be combined between sample sets.
+    Non-finite values make the statistics for their batch NaN, the same as dsc_calc.
+    :param the_matrix: samples across the top, features down the side, Decimal values
+    :param the_codes: integer batch code for each sample (see factorize_batches)
+    :param the_levels_cnt: number of batches (levels)
+    :return: tuple of counts (batches), sums (features x batches), and sums of squared deviations (features x batches)
+    """
+    indicator: numpy.ndarray = batch_indicator(the_codes, the_levels_cnt)
+    counts: numpy.ndarray = numpy.bincount(the_codes, minlength=the_levels_cnt).astype(numpy.float64)
+    values: numpy.ndarray = the_matrix
+    # matrix product would spread a NaN to every batch, so zero non-finite values and mark their batches
+    bad_batches: typing.Optional[numpy.ndarray] = None
+    finite_mask: numpy.ndarray = numpy.isfinite(the_matrix)
+    if not finite_mask.all():
+        values = numpy.where(finite_mask, the_matrix, 0.0)
+        bad_batches = ((~finite_mask) @ indicator) > 0
+    sums: numpy.ndarray = values @ indicator
+    if bad_batches is not None:
+        sums[bad_batches] = float('nan')
+    # batches with no samples (when levels come from elsewhere) have NaN means, which are never used
+    with numpy.errstate(divide='ignore', invalid='ignore'):
+        batch_means: numpy.ndarray = sums / counts
+    deviations: numpy.ndarray = values - batch_means[:, the_codes]
+    if bad_batches is not None:
+        deviations[bad_batches[:, the_codes]] = 0.0
+    numpy.multiply(deviations, deviations, out=deviations)
+    sum_squares: numpy.ndarray = deviations @ indicator
+    if bad_batches is not None:
+        sum_squares[bad_batches] = float('nan')
+    return counts, sums, sum_squares
+
+
+def dsc_feature_terms(the_counts: numpy.ndarray, the_sums: numpy.ndarray,
+                      the_sum_squares: numpy.ndarray) -> Tuple[numpy.ndarray, numpy.ndarray]:
+    """
+    Squared within and between batch dispersion by feature, from per-batch sufficient statistics (see dsc_group_stats).
+    Overall Dw and Db are the square roots of the sums of these over features.
+    :param the_counts: number of samples in each batch
+    :param the_sums: features x batches sums of values
+    :param the_sum_squares: features x batches sums of squared deviations from batch mean
+    :return: tuple of squared Dw by feature and squared Db by feature
+    """
+    sample_cnt: int = int(the_counts.sum())
+    # numpy warnings are for NaN features (and empty batches), which are expected to be NaN
+    with numpy.errstate(divide='ignore', invalid='ignore'):
+        batch_means: numpy.ndarray = the_sums / the_counts
+        feature_means: numpy.ndarray = the_sums.sum(axis=1) / sample_cnt
+        centroid_diff: numpy.ndarray = batch_means - feature_means[:, numpy.newaxis]
+        # (count-1)/samples * sample variance is sum of squared deviations / samples
+        # single sample batches have no variance, even if their value is NaN
+        dw_feature: numpy.ndarray = numpy.where(the_counts > 1, the_sum_squares, 0.0).sum(axis=1) / sample_cnt
+        db_feature: numpy.ndarray = numpy.where(the_counts > 0, the_counts * centroid_diff * centroid_diff, 0.0).sum(axis=1) / sample_cnt
+    return dw_feature, db_feature
+
+
+def dsc_from_feature_terms(the_dw_feature: numpy.ndarray, the_db_feature: numpy.ndarray, the_sample_cnt: int,
+                           the_dw_total: typing.Optional[float] = None, the_db_total: typing.Optional[float] = None) -> DscInfo:
+    """
+    Perform DSC calculations from squared dispersion by feature (see dsc_feature_terms).
+    :param the_dw_feature: squared Dw by feature
+    :param the_db_feature: squared Db by feature
+    :param the_sample_cnt: number of samples
+    :param the_dw_total: sum of the_dw_feature, if already accumulated (such as by blocks of features)
+    :param the_db_total: sum of the_db_feature, if already accumulated (such as by blocks of features)
+    :return: DscInfo object contain results of DSC calculation
+    """
+    result_info: DscInfo = DscInfo()
+    if the_dw_total is None:
+        the_dw_total = float(the_dw_feature.sum())
+    if the_db_total is None:
+        the_db_total = float(the_db_feature.sum())
+    with numpy.errstate(divide='ignore', invalid='ignore'):
+        dw_value: float = math.sqrt(the_dw_total)
+        db_value: float = math.sqrt(the_db_total)
+        dw_feature: numpy.ndarray = epsilon_zero_check_array(numpy.sqrt(the_dw_feature))
+        db_feature: numpy.ndarray = numpy.sqrt(the_db_feature)
+        dsc_feature: numpy.ndarray = numpy.where(0.0 == dw_feature, float('Inf'),
+                                                 numpy.where(0.0 == epsilon_zero_check_array(db_feature), 0.0,
+                                                             db_feature / dw_feature))
+    dsc_value: float = float('nan')
+    if dw_value > 0:
+        dsc_value = db_value / dw_value
+    dsc_feature = epsilon_zero_check_array(dsc_feature)
+    db_feature = epsilon_zero_check_array(db_feature)
+    # handle too few samples case
+    if the_sample_cnt < 2:
+        # makes an array of 0.0 that is sample_cnt long
+        dsc_feature = numpy.zeros(the_sample_cnt, numpy.float64)
+        db_feature = numpy.zeros(the_sample_cnt, numpy.float64)
+        dsc_value = 0.0
+        db_value = 0.0
+    result_info.m_dsc = epsilon_zero_check_value(dsc_value)
+    result_info.m_db = epsilon_zero_check_value(db_value)
+    result_info.m_dw = epsilon_zero_check_value(dw_value)
+    result_info.m_feature_dsc = dsc_feature
+    result_info.m_feature_db = db_feature
+    result_info.m_feature_dw = dw_feature
+    return result_info
+
+
+def dsc_from_group_stats(the_counts: numpy.ndarray, the_sums: numpy.ndarray, the_sum_squares: numpy.ndarray) -> DscInfo:
+    """
+    Perform DSC calculations from per-batch sufficient statistics (see dsc_group_stats).
+    Results match dsc_calc within floating point tolerance.
+    :param the_counts: number of samples in each batch
+    :param the_sums: features x batches sums of values
+    :param the_sum_squares: features x batches sums of squared deviations from batch mean
+    :return: DscInfo object contain results of DSC calculation
+    """
+    dw_feature: numpy.ndarray
+    db_feature: numpy.ndarray
+    dw_feature, db_feature = dsc_feature_terms(the_counts, the_sums, the_sum_squares)
+    return dsc_from_feature_terms(dw_feature, db_feature, int(the_counts.sum()))
+
+
+def dsc_calc_vector(the_matrix: numpy.ndarray, the_batches: numpy.ndarray, the_time_flag: bool = False) -> DscInfo:
+    """
+    Perform DSC calculations for the given data, whole-matrix version of dsc_calc.
+    Batches are factorized once and per-batch count, sum, and sum of squares
+    are computed for all features with matrix products, instead of looping over features.
+    :param the_matrix: samples across the top, features down the side, Decimal values
+    :param the_batches: list of strings with batch ids for samples
+    :param the_time_flag: true to write time string (defaults to False)
+    :return: DscInfo object contain results of DSC calculation
+    """
+    start: float = time.time()
+    # NOTE: assumes samples in StdData and batches are in the same order
+    assert the_matrix.shape[1] == the_batches.size, "Number of batches should match number of samples (columns)"
+    codes: numpy.ndarray
+    levels: numpy.ndarray
+    codes, levels = factorize_batches(the_batches)
+    counts: numpy.ndarray
+    sums: numpy.ndarray
+    sum_squares: numpy.ndarray
+    counts, sums, sum_squares = dsc_group_stats(numpy.asarray(the_matrix, dtype=numpy.float64), codes, levels.size)
+    result_info: DscInfo = dsc_from_group_stats(counts, sums, sum_squares)
+    finish: float = time.time()
+    if the_time_flag:
+        print(f"dsc_calc_vector time to run={(finish-start)} seconds", flush=True)
+    return result_info
+
+
+def dsc_group_stats_sparse(the_matrix: scipy.sparse.spmatrix, the_codes: numpy.ndarray,
+                           the_levels_cnt: int) -> Tuple[numpy.ndarray, numpy.ndarray, numpy.ndarray]:
+    """
+    dsc_group_stats for a scipy.sparse matrix, using sparse products with a sparse indicator matrix,
+    so work is in proportion to the non-zero values (plus features x batches for the results).
+    Sum of squared deviations is sum of squares minus count times squared mean,
+    since centering would make the matrix dense, so features with a large mean relative to
+    their spread lose precision compared to dsc_group_stats.
+    Non-finite values make the statistics for their batch NaN, the same as dsc_calc.
+    :param the_matrix: scipy.sparse matrix, samples across the top, features down the side
+    :param the_codes: integer batch code for each sample (see factorize_batches)
+    :param the_levels_cnt: number of batches (levels)
+    :return: tuple of counts (batches), sums (features x batches), and sums of squared deviations (features x batches)
+    """
+    values: scipy.sparse.csr_matrix = scipy.sparse.csr_matrix(the_matrix, dtype=numpy.float64)
+    indicator: scipy.sparse.csr_matrix = scipy.sparse.csr_matrix(
+        (numpy.ones(the_codes.size), (numpy.arange(the_codes.size), the_codes)), shape=(the_codes.size, the_levels_cnt))
+    counts: numpy.ndarray = numpy.bincount(the_codes, minlength=the_levels_cnt).astype(numpy.float64)
+    # products would spread a NaN to every batch, so zero non-finite values and mark their batches
+    bad_batches: typing.Optional[numpy.ndarray] = None
+    finite_mask: numpy.ndarray = numpy.isfinite(values.data)
+    if not finite_mask.all():
+        bad_values: scipy.sparse.csr_matrix = values.copy()
+        bad_values.data = (~finite_mask).astype(numpy.float64)
+        bad_batches = (bad_values @ indicator).toarray() > 0
+        values = values.copy()
+        values.data[~finite_mask] = 0.0
+    sums: numpy.ndarray = (values @ indicator).toarray()
+    raw_squares: numpy.ndarray = (values.multiply(values) @ indicator).toarray()
+    with numpy.errstate(divide='ignore', invalid='ignore'):
+        sum_squares: numpy.ndarray = numpy.maximum(raw_squares - numpy.where(counts > 0, sums * sums / counts, 0.0), 0.0)
+    if bad_batches is not None:
+        sums[bad_batches] = float('nan')
+        sum_squares[bad_batches] = float('nan')
+    return counts, sums, sum_squares
+
+
+def dsc_calc_sparse(the_matrix: scipy.sparse.spmatrix, the_batches: numpy.ndarray, the_time_flag: bool = False) -> DscInfo:
+    """
+    Perform DSC calculations for a scipy.sparse (CSR or CSC) matrix, such as mutation counts or scRNA data,
+    without making it dense (see dsc_group_stats_sparse).
+    :param the_matrix: scipy.sparse matrix, samples across the top, features down the side
+    :param the_batches: list of strings with batch ids for samples
+    :param the_time_flag: true to write time string (defaults to False)
+    :return: DscInfo object contain results of DSC calculation
+    """
+    start: float = time.time()
+    # NOTE: assumes samples in StdData and batches are in the same order
+    assert the_matrix.shape[1] == the_batches.size, "Number of batches should match number of samples (columns)"
+    codes: numpy.ndarray
+    levels: numpy.ndarray
+    codes, levels = factorize_batches(the_batches)
+    counts: numpy.ndarray
+    sums: numpy.ndarray
+    sum_squares: numpy.ndarray
+    counts, sums, sum_squares = dsc_group_stats_sparse(the_matrix, codes, levels.size)
+    result_info: DscInfo = dsc_from_group_stats(counts, sums, sum_squares)
+    finish: float = time.time()
+    if the_time_flag:
+        print(f"dsc_calc_sparse time to run={(finish-start)} seconds", flush=True)
+    return result_info
+
+
+def dsc_calc_codes(the_matrix: numpy.ndarray, the_codes: numpy.ndarray, the_levels: numpy.ndarray,
+                   the_time_flag: bool = False) -> DscInfo:
+    """
+    Perform DSC calculations (as dsc_calc_vector) with batches already integer coded,
+    for callers such as R that already have a numeric matrix and a factor.
+    Matrix and codes are used as given, without copying or converting, so the matrix can be
+    Fortran-ordered (column-major, as R stores a matrix, and as reticulate passes it without a copy).
+    From R, use np_array(theMatrix, dtype="float64", order="F") and
+    np_array(as.integer(theFactor) - 1L, dtype="int32") with np_array(levels(theFactor)).
+    :param the_matrix: float64 matrix, samples across the top, features down the side, C or Fortran order
+    :param the_codes: integer batch code for each sample, 0 based index into the_levels
+    :param the_levels: batch ids, only the count is used for the calculation
+    :param the_time_flag: true to write time string (defaults to False)
+    :return: DscInfo object contain results of DSC calculation
+    """
+    start: float = time.time()
+    assert (2 == the_matrix.ndim) and (numpy.float64 == the_matrix.dtype), "Matrix should be two dimensional float64"
+    assert numpy.issubdtype(the_codes.dtype, numpy.integer), "Batch codes should be integers"
+    assert the_matrix.shape[1] == the_codes.size, "Number of batch codes should match number of samples (columns)"
+    assert (the_codes.size == 0) or ((the_codes.min() >= 0) and (the_codes.max() < the_levels.size)), \
+        "Batch codes should be 0 based indexes into levels"
+    counts: numpy.ndarray
+    sums: numpy.ndarray
+    sum_squares: numpy.ndarray
+    counts, sums, sum_squares = dsc_group_stats(the_matrix, the_codes, the_levels.size)
+    result_info: DscInfo = dsc_from_group_stats(counts, sums, sum_squares)
+    finish: float = time.time()
+    if the_time_flag:
+        print(f"dsc_calc_codes time to run={(finish-start)} seconds", flush=True)
+    return result_info
+
+
+def dsc_group_stats_multi(the_matrix: numpy.ndarray, the_codes_list: List[numpy.ndarray],
+                          the_levels_cnts: List[int]) -> List[Tuple[numpy.ndarray, numpy.ndarray, numpy.ndarray]]:
+    """
+    dsc_group_stats for several batch vectors (batch types) with one traversal of the matrix.
+    Features are centered on their mean once, then sums and sums of squares for every batch of every
+    batch type come from one product with the stacked indicator matrices.
+    Sums returned are of centered values, which gives the same DSC (DSC does not change with a shift of a feature).
+    :param the_matrix: samples across the top, features down the side, Decimal values
+    :param the_codes_list: for each batch type, integer batch code for each sample
+    :param the_levels_cnts: for each batch type, number of batches (levels)
+    :return: for each batch type, tuple of counts, centered sums, and sums of squared deviations (see dsc_group_stats)
+    """
+    indicator: numpy.ndarray = numpy.hstack([batch_indicator(codes, levels_cnt)
+                                             for codes, levels_cnt in zip(the_codes_list, the_levels_cnts)])
+    finite_mask: numpy.ndarray = numpy.isfinite(the_matrix)
+    all_finite: bool = bool(finite_mask.all())
+    centered: numpy.ndarray
+    bad_batches: typing.Optional[numpy.ndarray] = None
+    with numpy.errstate(invalid='ignore'):
+        if all_finite:
+            centered = the_matrix - the_matrix.mean(axis=1, keepdims=True)
+        else:
+            # zero non-finite values and mark their batches, as in dsc_group_stats
+            centered = numpy.where(finite_mask, the_matrix, 0.0)
+            finite_cnt: numpy.ndarray = finite_mask.sum(axis=1, keepdims=True)
+            centered -= numpy.where(finite_cnt > 0, centered.sum(axis=1, keepdims=True) / numpy.maximum(finite_cnt, 1), 0.0)
+            centered[~finite_mask] = 0.0
+            bad_batches = ((~finite_mask) @ indicator) > 0
+    sums: numpy.ndarray = centered @ indicator
+    numpy.multiply(centered, centered, out=centered)
+    raw_squares: numpy.ndarray = centered @ indicator
+    del centered
+    counts: numpy.ndarray = indicator.sum(axis=0)
+    with numpy.errstate(divide='ignore', invalid='ignore'):
+        # centering on feature mean keeps this subtraction well conditioned
+        sum_squares: numpy.ndarray = numpy.maximum(raw_squares - numpy.where(counts > 0, sums * sums / counts, 0.0), 0.0)
+    if bad_batches is not None:
+        sums[bad_batches] = float('nan')
+        sum_squares[bad_batches] = float('nan')
+    results: List[Tuple[numpy.ndarray, numpy.ndarray, numpy.ndarray]] = []
+    start: int = 0
+    levels_cnt: int
+    for levels_cnt in the_levels_cnts:
+        results.append((counts[start:start + levels_cnt], sums[:, start:start + levels_cnt], sum_squares[:, start:start + levels_cnt]))
+        start += levels_cnt
+    return results
+
+
+def dsc_calc_all_types(the_std_data: StdData, the_time_flag: bool = False) -> Dict[str, DscInfo]:
+    """
+    Perform DSC calculations for every batch type in the StdData batches,
+    with one traversal of the matrix (see dsc_group_stats_multi), instead of one dsc_calc per batch type.
+    Results match dsc_calc for each batch type within floating point tolerance.
+    :param the_std_data: StdData with matrix and batches read, batches rows in same order as matrix samples
+    :param the_time_flag: true to write time string (defaults to False)
+    :return: dictionary of batch type to DscInfo
+    """
+    start: float = time.time()
+    # first column is Sample, not a batch type
+    batch_types: List[str] = the_std_data.m_columns[1:].tolist()
+    codes_list: List[numpy.ndarray] = []
+    levels_cnts: List[int] = []
+    batch_type: str
+    for batch_type in batch_types:
+        # StdData batches are already integer coded
+        codes: numpy.ndarray = the_std_data.get_batch_data_for_column(batch_type)
+        assert the_std_data.m_matrix.shape[1] == codes.size, "Number of batches should match number of samples (columns)"
+        codes_list.append(codes)
+        levels_cnts.append(the_std_data.get_batch_levels_for_column(batch_type).size)
+    stats_list: List[Tuple[numpy.ndarray, numpy.ndarray, numpy.ndarray]] = \
+        dsc_group_stats_multi(numpy.asarray(the_std_data.m_matrix, dtype=numpy.float64), codes_list, levels_cnts)
+    results: Dict[str, DscInfo] = {}
+    stats: Tuple[numpy.ndarray, numpy.ndarray, numpy.ndarray]
+    for batch_type, stats in zip(batch_types, stats_list):
+        results[batch_type] = dsc_from_group_stats(*stats)
+    finish: float = time.time()
+    if the_time_flag:
+        print(f"dsc_calc_all_types time to run={(finish-start)} seconds", flush=True)
+    return results
+
+
+def dsc_pairwise_from_group_stats(the_counts: numpy.ndarray, the_sums: numpy.ndarray,
+                                  the_sum_squares: numpy.ndarray) -> Tuple[numpy.ndarray, numpy.ndarray, numpy.ndarray]:
+    """
+    Perform DSC calculations for every pair of batches from per-batch sufficient statistics (see dsc_group_stats).
+    For batches i and j with n = ni + nj, Db^2 = ni * nj / n^2 * |mean i - mean j|^2
+    and Dw^2 = (Wi + Wj) / n, where W is the sum over features of squared deviations (0 for single sample batches),
+    so all pairs come from one batches x batches product of the batch means.
+    Results match dsc_calc on the columns of the two batches within floating point tolerance.
+    Diagonal and pairs with an empty batch are NaN.
+    :param the_counts: number of samples in each batch
+    :param the_sums: features x batches sums of values
+    :param the_sum_squares: features x batches sums of squared deviations from batch mean
+    :return: tuple of batches x batches DSC, Db, and Dw
+    """
+    levels_cnt: int = the_counts.size
+    with numpy.errstate(divide='ignore', invalid='ignore'):
+        batch_means: numpy.ndarray = the_sums / the_counts
+        # center means on the mean of finite batch means, to keep the Gram matrix subtraction well conditioned
+        finite_means: numpy.ndarray = numpy.isfinite(batch_means)
+        finite_cnt: numpy.ndarray = finite_means.sum(axis=1, keepdims=True)
+        center: numpy.ndarray = numpy.where(finite_means, batch_means, 0.0).sum(axis=1, keepdims=True) / numpy.maximum(finite_cnt, 1)
+        batch_means = batch_means - center
+        # batches x batches Gram matrix, a NaN only reaches the pairs using its batch
+        gram: numpy.ndarray = batch_means.T @ batch_means
+        norms: numpy.ndarray = numpy.diag(gram)
+        distance: numpy.ndarray = numpy.maximum(norms[:, numpy.newaxis] + norms[numpy.newaxis, :] - 2.0 * gram, 0.0)
+        pair_counts: numpy.ndarray = the_counts[:, numpy.newaxis] + the_counts[numpy.newaxis, :]
+        db_matrix: numpy.ndarray = numpy.sqrt(the_counts[:, numpy.newaxis] * the_counts[numpy.newaxis, :] * distance) / pair_counts
+        # single sample batches have no variance, even if their value is NaN
+        within: numpy.ndarray = numpy.where(the_counts > 1, the_sum_squares, 0.0).sum(axis=0)
+        dw_matrix: numpy.ndarray = numpy.sqrt((within[:, numpy.newaxis] + within[numpy.newaxis, :]) / pair_counts)
+        dsc_matrix: numpy.ndarray = numpy.where(dw_matrix > 0, db_matrix / dw_matrix, float('nan'))
+    unused: numpy.ndarray = numpy.eye(levels_cnt, dtype=bool) | (the_counts[:, numpy.newaxis] < 1) | (the_counts[numpy.newaxis, :] < 1)
+    dsc_matrix[unused] = float('nan')
+    db_matrix[unused] = float('nan')
+    dw_matrix[unused] = float('nan')
+    return epsilon_zero_check_array(dsc_matrix), epsilon_zero_check_array(db_matrix), epsilon_zero_check_array(dw_matrix)
+
+
+def dsc_pairwise(the_matrix: numpy.ndarray, the_batches: numpy.ndarray,
+                 the_time_flag: bool = False) -> Tuple[numpy.ndarray, numpy.ndarray, numpy.ndarray, numpy.ndarray]:
+    """
+    Perform DSC calculations for every pair of batches (DSCij), from one set of per-batch statistics,
+    instead of one dsc_calc per pair of batches.
+    :param the_matrix: samples across the top, features down the side, Decimal values
+    :param the_batches: list of strings with batch ids for samples
+    :param the_time_flag: true to write time string (defaults to False)
+    :return: tuple of sorted batch ids (levels), and batches x batches DSC, Db, and Dw in levels order
+    """
+    start: float = time.time()
+    # NOTE: assumes samples in StdData and batches are in the same order
+    assert the_matrix.shape[1] == the_batches.size, "Number of batches should match number of samples (columns)"
+    codes: numpy.ndarray
+    levels: numpy.ndarray
+    codes, levels = factorize_batches(the_batches)
+    counts: numpy.ndarray
+    sums: numpy.ndarray
+    sum_squares: numpy.ndarray
+    counts, sums, sum_squares = dsc_group_stats(numpy.asarray(the_matrix, dtype=numpy.float64), codes, levels.size)
+    dsc_matrix: numpy.ndarray
+    db_matrix: numpy.ndarray
+    dw_matrix: numpy.ndarray
+    dsc_matrix, db_matrix, dw_matrix = dsc_pairwise_from_group_stats(counts, sums, sum_squares)
+    finish: float = time.time()
+    if the_time_flag:
+        print(f"dsc_pairwise time to run={(finish-start)} seconds", flush=True)
+    return levels, dsc_matrix, db_matrix, dw_matrix
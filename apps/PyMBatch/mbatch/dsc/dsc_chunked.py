@@ -0,0 +1,164 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Copyright (c) 2011-2024 University of Texas MD Anderson Cancer Center
+
+This program is free software: you can redistribute it and/or modify it under the terms of the
+GNU General Public License as published by the Free Software Foundation, either version 2 of
+the License, or (at your option) any later version.
+
+This program is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY;
+without even the implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+See the GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License along with this program.
+If not, see <https://www.gnu.org/licenses/>.
+
+MD Anderson Cancer Center Bioinformatics on GitHub <https://github.com/MD-Anderson-Bioinformatics>
+MD Anderson Cancer Center Bioinformatics at MDA <https://www.mdanderson.org/research/departments-labs-institutes/departments-divisions/bioinformatics-and-computational-biology.html>
+@author: Tod Casasent
+"""
+
+
+from typing import Iterable, Iterator, Tuple, List
+import time
+import typing
+import numpy
+from mbatch.dsc.dsc_info import DscInfo
+from mbatch.dsc.dsc_calc import factorize_batches, batch_indicator, dsc_group_stats, dsc_feature_terms, dsc_from_feature_terms
+
+
+def iterate_row_blocks(the_matrix: numpy.ndarray, the_block_rows: int) -> Iterator[numpy.ndarray]:
+    """
+    Iterate over blocks of rows (features) of a matrix. For a memory-mapped matrix,
+    only the rows of the current block are read.
+    :param the_matrix: samples across the top, features down the side (may be numpy.memmap)
+    :param the_block_rows: number of rows in each block
+    :return: iterator of row blocks
+    """
+    assert the_block_rows > 0, "Block rows should be positive"
+    start: int
+    for start in range(0, the_matrix.shape[0], the_block_rows):
+        yield the_matrix[start:start + the_block_rows]
+
+
+def neumaier_add(the_total: float, the_compensation: float, the_value: float) -> Tuple[float, float]:
+    """
+    Add a value to a running total with compensated (Neumaier) summation,
+    which keeps the low order bits lost when adding values of different size.
+    :param the_total: running total
+    :param the_compensation: running compensation (add to the_total for the sum)
+    :param the_value: value to add
+    :return: tuple of new total and new compensation
+    """
+    total: float = the_total + the_value
+    if abs(the_total) >= abs(the_value):
+        the_compensation += (the_total - total) + the_value
+    else:
+        the_compensation += (the_value - total) + the_total
+    return total, the_compensation
+
+
+def dsc_group_stats_float32(the_matrix: numpy.ndarray, the_codes: numpy.ndarray,
+                            the_levels_cnt: int) -> Tuple[numpy.ndarray, numpy.ndarray, numpy.ndarray]:
+    """
+    dsc_group_stats with float32 values and products, using half the memory of float64 for the block.
+    Float32 batch means are compensated with the sum of the deviations from them (corrected two-pass),
+    which is zero in exact arithmetic, and the same term corrects the sums of squared deviations.
+    Returned statistics are float64.
+    :param the_matrix: samples across the top, features down the side, Decimal values
+    :param the_codes: integer batch code for each sample (see factorize_batches)
+    :param the_levels_cnt: number of batches (levels)
+    :return: tuple of counts (batches), sums (features x batches), and sums of squared deviations (features x batches)
+    """
+    indicator: numpy.ndarray = batch_indicator(the_codes, the_levels_cnt, numpy.float32)
+    counts: numpy.ndarray = numpy.bincount(the_codes, minlength=the_levels_cnt).astype(numpy.float64)
+    values: numpy.ndarray = numpy.asarray(the_matrix, dtype=numpy.float32)
+    # matrix product would spread a NaN to every batch, so zero non-finite values and mark their batches
+    bad_batches: typing.Optional[numpy.ndarray] = None
+    finite_mask: numpy.ndarray = numpy.isfinite(values)
+    if not finite_mask.all():
+        values = numpy.where(finite_mask, values, numpy.float32(0.0))
+        bad_batches = ((~finite_mask).astype(numpy.float32) @ indicator) > 0
+    with numpy.errstate(divide='ignore', invalid='ignore'):
+        batch_means: numpy.ndarray = ((values @ indicator).astype(numpy.float64) / counts).astype(numpy.float32)
+    deviations: numpy.ndarray = values - batch_means[:, the_codes]
+    if bad_batches is not None:
+        deviations[bad_batches[:, the_codes]] = 0.0
+    # sum of deviations from a rounded mean is the error of that mean, times count
+    residuals: numpy.ndarray = (deviations @ indicator).astype(numpy.float64)
+    numpy.multiply(deviations, deviations, out=deviations)
+    with numpy.errstate(divide='ignore', invalid='ignore'):
+        sums: numpy.ndarray = numpy.where(counts > 0, batch_means.astype(numpy.float64) * counts + residuals, 0.0)
+        sum_squares: numpy.ndarray = numpy.maximum((deviations @ indicator).astype(numpy.float64) -
+                                                   numpy.where(counts > 0, residuals * residuals / counts, 0.0), 0.0)
+    if bad_batches is not None:
+        sums[bad_batches] = float('nan')
+        sum_squares[bad_batches] = float('nan')
+    return counts, sums, sum_squares
+
+
+def dsc_calc_chunked(the_blocks: Iterable[numpy.ndarray], the_batches: numpy.ndarray,
+                     the_float32_flag: bool = False, the_time_flag: bool = False) -> DscInfo:
+    """
+    Perform DSC calculations one block of features (rows) at a time, so only one block is in memory.
+    DSC by feature only needs the row, and overall Dw and Db are sums over features,
+    which are accumulated with compensated summation over blocks.
+    Results match dsc_calc within floating point tolerance (float32 tolerance with the_float32_flag).
+    :param the_blocks: iterable of row blocks, each samples across the top, features down the side
+    :param the_batches: list of strings with batch ids for samples
+    :param the_float32_flag: if True, compute block statistics in float32 (see dsc_group_stats_float32)
+    :param the_time_flag: true to write time string (defaults to False)
+    :return: DscInfo object contain results of DSC calculation
+    """
+    start: float = time.time()
+    codes: numpy.ndarray
+    levels: numpy.ndarray
+    codes, levels = factorize_batches(the_batches)
+    dw_list: List[numpy.ndarray] = []
+    db_list: List[numpy.ndarray] = []
+    dw_total: float = 0.0
+    dw_compensation: float = 0.0
+    db_total: float = 0.0
+    db_compensation: float = 0.0
+    block: numpy.ndarray
+    for block in the_blocks:
+        # NOTE: assumes samples in StdData and batches are in the same order
+        assert block.shape[1] == the_batches.size, "Number of batches should match number of samples (columns)"
+        stats: Tuple[numpy.ndarray, numpy.ndarray, numpy.ndarray]
+        if the_float32_flag:
+            stats = dsc_group_stats_float32(block, codes, levels.size)
+        else:
+            stats = dsc_group_stats(numpy.asarray(block, dtype=numpy.float64), codes, levels.size)
+        dw_feature: numpy.ndarray
+        db_feature: numpy.ndarray
+        dw_feature, db_feature = dsc_feature_terms(*stats)
+        dw_total, dw_compensation = neumaier_add(dw_total, dw_compensation, float(dw_feature.sum()))
+        db_total, db_compensation = neumaier_add(db_total, db_compensation, float(db_feature.sum()))
+        dw_list.append(dw_feature)
+        db_list.append(db_feature)
+    result_info: DscInfo = dsc_from_feature_terms(numpy.concatenate(dw_list) if dw_list else numpy.empty(0),
+                                                  numpy.concatenate(db_list) if db_list else numpy.empty(0),
+                                                  the_batches.size, dw_total + dw_compensation, db_total + db_compensation)
+    finish: float = time.time()
+    if the_time_flag:
+        print(f"dsc_calc_chunked time to run={(finish-start)} seconds", flush=True)
+    return result_info
+
+
+def dsc_calc_npy(the_file: str, the_batches: numpy.ndarray, the_block_rows: int = 4096,
+                 the_float32_flag: bool = False, the_time_flag: bool = False) -> DscInfo:
+    """
+    Perform DSC calculations on a matrix saved with numpy.save (samples across the top, features down the side),
+    memory-mapping the file and reading the_block_rows features at a time (see dsc_calc_chunked).
+    :param the_file: full path to .npy file with matrix
+    :param the_batches: list of strings with batch ids for samples
+    :param the_block_rows: number of features (rows) to process at a time
+    :param the_float32_flag: if True, compute block statistics in float32
+    :param the_time_flag: true to write time string (defaults to False)
+    :return: DscInfo object contain results of DSC calculation
+    """
+    print(f"dsc_calc_npy the_file={the_file}", flush=True)
+    matrix: numpy.ndarray = numpy.load(the_file, mmap_mode='r', allow_pickle=False)
+    assert 2 == matrix.ndim, "Matrix file should be two dimensional"
+    return dsc_calc_chunked(iterate_row_blocks(matrix, the_block_rows), the_batches, the_float32_flag, the_time_flag)
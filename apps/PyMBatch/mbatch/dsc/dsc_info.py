@@ -23,6 +23,7 @@ from typing import List
 from textwrap import dedent
 import math
 import io
+import numpy
 
 
 def convert_to_list(the_string: str) -> List[float]:
@@ -54,24 +55,41 @@ def epsilon_zero_check_value(the_value: float) -> float:
     return the_value
 
 
+def epsilon_zero_check_array(the_values: numpy.ndarray) -> numpy.ndarray:
+    """
+    array version of epsilon_zero_check_value
+    if a value is less than or equal 1x10^-7, use 0.0, otherwise use the value (NaN stays NaN)
+    :param the_values: numpy.ndarray of values to test
+    :return: new numpy.ndarray with near-zero values set to 0.0
+    """
+    # NaN compares False, so NaN values are kept as-is
+    return numpy.where(numpy.abs(the_values) <= 0.0000001, 0.0, the_values)
+
+
+# binary layout of DscInfo values: rows are DSC, Db, Dw; column 0 is the overall value, other columns by feature
+DSC_BINARY_ROWS: int = 3
+
+
 class DscInfo:
     """
     Class to hold values computed for DSC
     For more details see: https://bioinformatics.mdanderson.org/public-software/tcga-batch-effects/#the-dsc-metric
     Dispersion Separability Criterion
     Higher means more dispersion (more chance of batch effects)
+    Values by feature are kept as float64 numpy arrays,
+    m_list_of_feature_* give (and take) them as lists, for existing callers (including MBatch R code).
     MEMBER VALUES
-    m_list_of_feature_dsc: List[float] - dispersion by feature
-    m_list_of_feature_db: List[float] - dispersion between batches by feature
-    m_list_of_feature_dw: List[float] - dispersion within batches by feature
+    m_feature_dsc: numpy.ndarray - dispersion by feature
+    m_feature_db: numpy.ndarray - dispersion between batches by feature
+    m_feature_dw: numpy.ndarray - dispersion within batches by feature
     m_dsc: float - dispersion for dataset
     m_db: float - dispersion between batches
     m_dw: float - dispersion within batches
     """
     # do not set method variables, as they should be initialized in the init function
-    m_list_of_feature_dsc: List[float]
-    m_list_of_feature_db: List[float]
-    m_list_of_feature_dw: List[float]
+    m_feature_dsc: numpy.ndarray
+    m_feature_db: numpy.ndarray
+    m_feature_dw: numpy.ndarray
     m_dsc: float
     m_db: float
     m_dw: float
@@ -82,13 +100,61 @@ class DscInfo:
         Members described at class level
         """
         super().__init__()
-        self.m_list_of_feature_dsc = []
-        self.m_list_of_feature_db = []
-        self.m_list_of_feature_dw = []
+        self.m_feature_dsc = numpy.empty(0, numpy.float64)
+        self.m_feature_db = numpy.empty(0, numpy.float64)
+        self.m_feature_dw = numpy.empty(0, numpy.float64)
         self.m_dsc = float('nan')
         self.m_db = float('nan')
         self.m_dw = float('nan')
 
+    @property
+    def m_list_of_feature_dsc(self: 'DscInfo') -> List[float]:
+        """
+        dispersion by feature, as list
+        :return: list of float
+        """
+        return self.m_feature_dsc.tolist()
+
+    @m_list_of_feature_dsc.setter
+    def m_list_of_feature_dsc(self: 'DscInfo', the_values: List[float]) -> None:
+        """
+        set dispersion by feature from list (or array)
+        :param the_values: list of float
+        """
+        self.m_feature_dsc = numpy.asarray(the_values, dtype=numpy.float64)
+
+    @property
+    def m_list_of_feature_db(self: 'DscInfo') -> List[float]:
+        """
+        dispersion between batches by feature, as list
+        :return: list of float
+        """
+        return self.m_feature_db.tolist()
+
+    @m_list_of_feature_db.setter
+    def m_list_of_feature_db(self: 'DscInfo', the_values: List[float]) -> None:
+        """
+        set dispersion between batches by feature from list (or array)
+        :param the_values: list of float
+        """
+        self.m_feature_db = numpy.asarray(the_values, dtype=numpy.float64)
+
+    @property
+    def m_list_of_feature_dw(self: 'DscInfo') -> List[float]:
+        """
+        dispersion within batches by feature, as list
+        :return: list of float
+        """
+        return self.m_feature_dw.tolist()
+
+    @m_list_of_feature_dw.setter
+    def m_list_of_feature_dw(self: 'DscInfo', the_values: List[float]) -> None:
+        """
+        set dispersion within batches by feature from list (or array)
+        :param the_values: list of float
+        """
+        self.m_feature_dw = numpy.asarray(the_values, dtype=numpy.float64)
+
     def __str__(self: 'DscInfo') -> str:
         """
         tostring makes a string with data
@@ -110,11 +176,9 @@ class DscInfo:
         self.m_dsc = epsilon_zero_check_value(self.m_dsc)
         self.m_db = epsilon_zero_check_value(self.m_db)
         self.m_dw = epsilon_zero_check_value(self.m_dw)
-        # use this method (rather than list/map), this keeps type checking properly
-        value: float
-        self.m_list_of_feature_dsc = [epsilon_zero_check_value(value) for value in self.m_list_of_feature_dsc]
-        self.m_list_of_feature_db = [epsilon_zero_check_value(value) for value in self.m_list_of_feature_db]
-        self.m_list_of_feature_dw = [epsilon_zero_check_value(value) for value in self.m_list_of_feature_dw]
+        self.m_feature_dsc = epsilon_zero_check_array(self.m_feature_dsc)
+        self.m_feature_db = epsilon_zero_check_array(self.m_feature_db)
+        self.m_feature_dw = epsilon_zero_check_array(self.m_feature_dw)
 
     def __eq__(self: 'DscInfo', the_other: 'DscInfo') -> bool:
         """
@@ -129,17 +193,18 @@ class DscInfo:
             is_equal = False
         elif self.m_dw != the_other.m_dw:
             is_equal = False
-        elif self.m_list_of_feature_dsc != the_other.m_list_of_feature_dsc:
+        elif not numpy.array_equal(self.m_feature_dsc, the_other.m_feature_dsc):
             is_equal = False
-        elif self.m_list_of_feature_db != the_other.m_list_of_feature_db:
+        elif not numpy.array_equal(self.m_feature_db, the_other.m_feature_db):
             is_equal = False
-        elif self.m_list_of_feature_dw != the_other.m_list_of_feature_dw:
+        elif not numpy.array_equal(self.m_feature_dw, the_other.m_feature_dw):
             is_equal = False
         return is_equal
 
     def write_to_file(self: 'DscInfo', the_file: str, the_open_flag: str = 'w') -> str:
         """
         Write object to disk file, in manner comparable between runs
+        This text format is kept as an export, see write_to_binary for storage
         :param the_file: full path to File to which to write this DscInfo object
         :param the_open_flag: flag to 'w' truncate or 'a' append, argument to open
         :return: the_file (file written)
@@ -185,3 +250,101 @@ class DscInfo:
                     self.m_list_of_feature_dw = convert_to_list(line)
                 count += 1
         return the_file
+
+    def to_binary_array(self: 'DscInfo') -> numpy.ndarray:
+        """
+        Values as one float64 array in DSC binary layout (see DSC_BINARY_ROWS)
+        :return: numpy.ndarray 3 x (1 + features)
+        """
+        result: numpy.ndarray = numpy.empty((DSC_BINARY_ROWS, 1 + self.m_feature_dsc.size), numpy.float64)
+        result[:, 0] = [self.m_dsc, self.m_db, self.m_dw]
+        result[0, 1:] = self.m_feature_dsc
+        result[1, 1:] = self.m_feature_db
+        result[2, 1:] = self.m_feature_dw
+        return result
+
+    def from_binary_array(self: 'DscInfo', the_values: numpy.ndarray) -> None:
+        """
+        Populate self from one array in DSC binary layout.
+        Values by feature are views of the_values (not copies), so a memory-mapped array stays on disk.
+        :param the_values: numpy.ndarray 3 x (1 + features)
+        :return: nothing
+        """
+        assert DSC_BINARY_ROWS == the_values.shape[0], "Binary DscInfo should have rows for DSC, Db, and Dw"
+        self.m_dsc = float(the_values[0, 0])
+        self.m_db = float(the_values[1, 0])
+        self.m_dw = float(the_values[2, 0])
+        self.m_feature_dsc = the_values[0, 1:]
+        self.m_feature_db = the_values[1, 1:]
+        self.m_feature_dw = the_values[2, 1:]
+
+    def write_to_binary(self: 'DscInfo', the_file: str) -> str:
+        """
+        Write object to disk file, as numpy .npy (see write_dsc_info_list)
+        :param the_file: full path to file to which to write this DscInfo object (should end in .npy)
+        :return: the_file (file written)
+        """
+        return write_dsc_info_list([self], the_file)
+
+    def read_from_binary(self: 'DscInfo', the_file: str) -> str:
+        """
+        Read file written by write_to_binary, populate self from that file
+        :param the_file: full path to file to read
+        :return: the_file (file read)
+        """
+        self.from_binary_array(read_dsc_info_array(the_file, False)[0])
+        return the_file
+
+
+def write_dsc_info_list(the_info_list: List[DscInfo], the_file: str) -> str:
+    """
+    Write DscInfo objects (such as permutation results) to one numpy .npy file,
+    as float64 array of objects x 3 x (1 + features), see DSC_BINARY_ROWS.
+    All objects must have the same number of features.
+    :param the_info_list: list of DscInfo to write
+    :param the_file: full path to file to which to write (should end in .npy)
+    :return: the_file (file written)
+    """
+    feature_cnt: int = the_info_list[0].m_feature_dsc.size if len(the_info_list) > 0 else 0
+    values: numpy.ndarray = numpy.empty((len(the_info_list), DSC_BINARY_ROWS, 1 + feature_cnt), numpy.float64)
+    index: int
+    info: DscInfo
+    for index, info in enumerate(the_info_list):
+        assert info.m_feature_dsc.size == feature_cnt, "All DscInfo objects should have the same number of features"
+        values[index] = info.to_binary_array()
+    out_file: io.BufferedWriter
+    with open(the_file, 'wb') as out_file:
+        numpy.save(out_file, values, allow_pickle=False)
+    return the_file
+
+
+def read_dsc_info_array(the_file: str, the_mmap_flag: bool = True) -> numpy.ndarray:
+    """
+    Read file written by write_dsc_info_list as one array, objects x 3 x (1 + features).
+    Overall DSC of every object is [:, 0, 0], feature DSC is [:, 0, 1:].
+    :param the_file: full path to file to read
+    :param the_mmap_flag: if True, memory-map the file read-only instead of reading it
+    :return: numpy.ndarray of values
+    """
+    print(f"read_dsc_info_array the_file={the_file}", flush=True)
+    values: numpy.ndarray = numpy.load(the_file, mmap_mode='r' if the_mmap_flag else None, allow_pickle=False)
+    assert (3 == values.ndim) and (DSC_BINARY_ROWS == values.shape[1]), "File is not a binary DscInfo list"
+    return values
+
+
+def read_dsc_info_list(the_file: str, the_mmap_flag: bool = True) -> List[DscInfo]:
+    """
+    Read file written by write_dsc_info_list into DscInfo objects.
+    With the_mmap_flag, values by feature are read-only views of the memory-mapped file.
+    :param the_file: full path to file to read
+    :param the_mmap_flag: if True, memory-map the file read-only instead of reading it
+    :return: list of DscInfo
+    """
+    values: numpy.ndarray = read_dsc_info_array(the_file, the_mmap_flag)
+    result: List[DscInfo] = []
+    index: int
+    for index in range(values.shape[0]):
+        info: DscInfo = DscInfo()
+        info.from_binary_array(values[index])
+        result.append(info)
+    return result
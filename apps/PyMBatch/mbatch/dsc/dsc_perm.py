@@ -19,14 +19,107 @@ MD Anderson Cancer Center Bioinformatics at MDA <https://www.mdanderson.org/rese
 @author: Tod Casasent
 """
 
-from typing import List
+from typing import List, Dict, Tuple, Iterator, Optional
+from multiprocessing import shared_memory
+import contextlib
+import typing
 import multiprocessing
 import numpy
 from mbatch.dsc.dsc_info import DscInfo
-from mbatch.dsc.dsc_calc import dsc_calc
+from mbatch.dsc.dsc_calc import dsc_calc, dsc_calc_codes
+from mbatch.dsc.dsc_pvalue import DscPvalue
 from mbatch.test.common import handle_error
 
 
+# per worker process state for DscPerm.shared_pool, set by init_shared_worker
+# keeps the SharedMemory object so the matrix buffer stays valid
+SHARED_WORKER_STATE: Dict[str, typing.Any] = {}
+
+
+def perm_dsc_calc(the_matrix: numpy.ndarray, the_batches: numpy.ndarray,
+                  the_levels: Optional[numpy.ndarray], the_engine: str) -> DscInfo:
+    """
+    DSC calculation for a permuted matrix, with batch ids (dsc_calc) or batch codes and levels (dsc_calc_codes)
+    :param the_matrix: permuted matrix
+    :param the_batches: batch ids for samples, or integer batch codes if the_levels is given
+    :param the_levels: batch ids for integer codes, None if the_batches are batch ids
+    :param the_engine: DSC engine to use, passed to dsc_calc
+    :return: DscInfo with results
+    """
+    if the_levels is None:
+        return dsc_calc(the_matrix, the_batches, False, the_engine)
+    return dsc_calc_codes(the_matrix, the_batches, the_levels)
+
+
+# pylint: disable=too-many-arguments
+def init_shared_worker(the_shm_name: str, the_shape: Tuple[int, int], the_dtype: str, the_order: str,
+                       the_batches: numpy.ndarray, the_levels: Optional[numpy.ndarray], the_engine: str,
+                       the_observed: Optional[DscInfo], the_null_flag: bool) -> None:
+    """
+    Pool initializer for DscPerm.shared_pool. Attach to the base matrix in shared memory.
+    :param the_shm_name: name of SharedMemory block holding base matrix
+    :param the_shape: shape of base matrix
+    :param the_dtype: dtype string of base matrix
+    :param the_order: memory order of base matrix, 'C' or 'F'
+    :param the_batches: one dimensional array of batches for samples (or integer batch codes)
+    :param the_levels: batch ids for integer batch codes, None if the_batches are batch ids
+    :param the_engine: DSC engine to use, passed to dsc_calc
+    :param the_observed: observed DscInfo for perm_dsc_shared_reduce (None if not reducing)
+    :param the_null_flag: for perm_dsc_shared_reduce, if True keep overall DSC null distribution
+    :return: nothing
+    """
+    # pylint: disable=global-variable-not-assigned
+    global SHARED_WORKER_STATE
+    # pylint: enable=global-variable-not-assigned
+    shm: shared_memory.SharedMemory = shared_memory.SharedMemory(name=the_shm_name)
+    SHARED_WORKER_STATE['shm'] = shm
+    SHARED_WORKER_STATE['matrix'] = numpy.ndarray(the_shape, dtype=the_dtype, buffer=shm.buf, order=the_order)
+    SHARED_WORKER_STATE['batches'] = the_batches
+    SHARED_WORKER_STATE['levels'] = the_levels
+    SHARED_WORKER_STATE['engine'] = the_engine
+    SHARED_WORKER_STATE['observed'] = the_observed
+    SHARED_WORKER_STATE['null_flag'] = the_null_flag
+# pylint: enable=too-many-arguments
+
+
+def perm_dsc_shared_once(the_seed_seq: numpy.random.SeedSequence) -> DscInfo:
+    """
+    Worker for DscPerm.perm_dsc_shared. Permute shared base matrix with a generator
+    from the given child seed, and calculate DSC.
+    :param the_seed_seq: child SeedSequence for this permutation
+    :return: DscInfo with results
+    """
+    random_num: numpy.random.Generator = numpy.random.default_rng(the_seed_seq)
+    perm_df: numpy.ndarray = random_num.permuted(SHARED_WORKER_STATE['matrix'], axis=1)
+    return perm_dsc_calc(perm_df, SHARED_WORKER_STATE['batches'], SHARED_WORKER_STATE['levels'], SHARED_WORKER_STATE['engine'])
+
+
+def perm_dsc_shared_reduce(the_seed_seqs: List[numpy.random.SeedSequence]) -> DscPvalue:
+    """
+    Worker for DscPerm.perm_dsc_pvalue. Do one permutation and DSC calculation per child seed,
+    and reduce results locally to counts against the observed DscInfo.
+    :param the_seed_seqs: child SeedSequence for each permutation to do
+    :return: DscPvalue with counts for these permutations
+    """
+    result: DscPvalue = DscPvalue(SHARED_WORKER_STATE['observed'], SHARED_WORKER_STATE['null_flag'])
+    seed_seq: numpy.random.SeedSequence
+    for seed_seq in the_seed_seqs:
+        result.add_perm(perm_dsc_shared_once(seed_seq))
+    return result
+
+
+def split_seeds(the_seeds: List[numpy.random.SeedSequence], the_cores: int) -> List[List[numpy.random.SeedSequence]]:
+    """
+    Split child seeds into consecutive chunks, a few per core, for workers that reduce locally
+    :param the_seeds: list of child SeedSequence
+    :param the_cores: number of cores or threads being used
+    :return: list of chunks, in order
+    """
+    chunk_size: int = max(1, -(-len(the_seeds) // (4 * max(1, the_cores))))
+    index: int
+    return [the_seeds[index:index + chunk_size] for index in range(0, len(the_seeds), chunk_size)]
+
+
 class DscPerm:
     """
     Class to encapsulate doing permutations of DSC values.
@@ -36,21 +129,26 @@ class DscPerm:
     self.m_seed: int = the_seed - random number generator seed
     self.m_random_num: numpy.random.Generator - random number generator
     self.m_matrix: numpy.ndarray = the_matrix - StdData values
-    self.m_batches: numpy.ndarray = the_batches - StdData batches
+    self.m_batches: numpy.ndarray = the_batches - StdData batches (or integer batch codes, if m_levels is set)
+    self.m_levels: Optional[numpy.ndarray] = the_levels - batch ids for integer batch codes (None for batch ids)
     self.m_perms: int = the_perms - number of permutations of data to calculate
     self.m_cores: int = the_threads - number of cores or threads to use
+    self.m_engine: str = the_engine - DSC engine, 'loop' or 'vector', passed to dsc_calc
     """
     # do not set method variables, as they should be initialized in the init function
     m_seed: int
     m_random_num: numpy.random.Generator
     m_matrix: numpy.ndarray
     m_batches: numpy.ndarray
+    m_levels: Optional[numpy.ndarray]
     m_perms: int
     m_cores: int
     m_counter: int
+    m_engine: str
 
     # pylint: disable=too-many-arguments
-    def __init__(self: 'DscPerm', the_matrix: numpy.ndarray, the_batches: numpy.ndarray, the_seed: int, the_perms: int, the_threads: int) -> None:
+    def __init__(self: 'DscPerm', the_matrix: numpy.ndarray, the_batches: numpy.ndarray, the_seed: int, the_perms: int, the_threads: int,
+                 the_engine: str = 'loop', the_levels: Optional[numpy.ndarray] = None) -> None:
         """
         initialize values -- member variables described at class
         :param the_matrix: two-dimensional StdData of values
@@ -58,15 +156,19 @@ class DscPerm:
         :param the_seed: random number generator seed
         :param the_perms: number of permutations of data to calculate
         :param the_threads: number of threads/cores to use
+        :param the_engine: DSC engine, 'loop' or 'vector', passed to dsc_calc
+        :param the_levels: if given, the_batches are integer codes into the_levels, and dsc_calc_codes is used
         """
         super().__init__()
         self.m_seed = the_seed
         self.m_random_num = numpy.random.default_rng(seed=the_seed)
         self.m_matrix = the_matrix
         self.m_batches = the_batches
+        self.m_levels = the_levels
         self.m_perms = the_perms
         self.m_cores = the_threads
         self.m_counter = 0
+        self.m_engine = the_engine
     # pylint: enable=too-many-arguments
 
     def perm_dsc_once(self: 'DscPerm') -> DscInfo:
@@ -76,7 +178,7 @@ class DscPerm:
         :return: DscInfo with results
         """
         perm_df: numpy.ndarray = self.m_random_num.permuted(self.m_matrix, axis=1)
-        info: DscInfo = dsc_calc(perm_df, self.m_batches)
+        info: DscInfo = perm_dsc_calc(perm_df, self.m_batches, self.m_levels, self.m_engine)
         return info
 
     def perm_dsc_multi(self: 'DscPerm') -> List[DscInfo]:
@@ -98,8 +200,8 @@ class DscPerm:
             # arguments within square brackets are also copied into async object at base state (unused)
             # see information about how pickle is used. Use ValueProxy to pass updatable, lockable object
             updated_pools: List[multiprocessing.Pool] = \
-                [pool.apply_async(dsc_calc, [self.m_random_num.permuted(self.m_matrix, axis=1),
-                                             self.m_batches, False],
+                [pool.apply_async(perm_dsc_calc, [self.m_random_num.permuted(self.m_matrix, axis=1),
+                                                  self.m_batches, self.m_levels, self.m_engine],
                                   error_callback=handle_error) for _ in range(self.m_perms)]
             started_proc: multiprocessing.Pool
             for started_proc in updated_pools:
@@ -109,6 +211,109 @@ class DscPerm:
                 info_list.append(info)
         return info_list
 
+    def perm_dsc_shared(self: 'DscPerm') -> List[DscInfo]:
+        """
+        Using member variables, do m_perm number of permutations and DSC calculations.
+        Base matrix is copied once into shared memory, and each worker gets only a child seed
+        (SeedSequence.spawn from m_seed) and does its permutation locally.
+        Results are the same for a given m_seed no matter the number of cores,
+        but differ from perm_dsc_multi, which permutes using one generator in this process.
+        Return results as list of DscInfo
+        :return: list of DscInfo (of permuted matrix)
+        """
+        info_list: List[DscInfo] = []
+        # permutation i always uses child seed i
+        child_seeds: List[numpy.random.SeedSequence] = numpy.random.SeedSequence(self.m_seed).spawn(self.m_perms)
+        pool: multiprocessing.Pool
+        with self.shared_pool() as pool:
+            # imap returns results in order of child seeds
+            info: DscInfo
+            for info in pool.imap(perm_dsc_shared_once, child_seeds):
+                info_list.append(info)
+        return info_list
+
+    def perm_dsc_pvalue(self: 'DscPerm', the_observed: DscInfo, the_null_flag: bool = False) -> DscPvalue:
+        """
+        Using member variables, do m_perm number of permutations and DSC calculations,
+        as perm_dsc_shared, but workers reduce results locally to counts against the_observed,
+        so the DscInfo for each permutation is never kept.
+        Results are the same for a given m_seed no matter the number of cores.
+        :param the_observed: DscInfo from dsc_calc of the non-permuted matrix
+        :param the_null_flag: if True, keep overall DSC of each permutation (in order of child seeds)
+        :return: DscPvalue with counts and p-values
+        """
+        result: DscPvalue = DscPvalue(the_observed, the_null_flag)
+        child_seeds: List[numpy.random.SeedSequence] = numpy.random.SeedSequence(self.m_seed).spawn(self.m_perms)
+        pool: multiprocessing.Pool
+        with self.shared_pool(the_observed, the_null_flag) as pool:
+            partial: DscPvalue
+            for partial in pool.imap(perm_dsc_shared_reduce, split_seeds(child_seeds, self.m_cores)):
+                result.merge(partial)
+        result.calc_pvalues()
+        return result
+
+    # pylint: disable=too-many-arguments
+    def perm_dsc_sequential(self: 'DscPerm', the_observed: DscInfo, the_exceed_limit: int,
+                            the_batch_perms: int = 100, the_null_flag: bool = False) -> DscPvalue:
+        """
+        Sequential (Besag-Clifford style) version of perm_dsc_pvalue.
+        Run permutations in batches of the_batch_perms, and stop once the overall DSC
+        has been exceeded the_exceed_limit times, or m_perms permutations have been done.
+        A large p-value is settled after a few batches, while a small p-value still
+        runs the full m_perms, so decisions like '<0.0005' are unchanged.
+        Stopping is checked between batches, so the p-value is exceed/count over all permutations run.
+        Child seeds continue from one SeedSequence, so the permutations run are the
+        first m_perms of perm_dsc_pvalue, and results do not depend on the number of cores.
+        :param the_observed: DscInfo from dsc_calc of the non-permuted matrix
+        :param the_exceed_limit: stop after this many permutations with DSC >= observed DSC
+        :param the_batch_perms: number of permutations to run between stopping checks
+        :param the_null_flag: if True, keep overall DSC of each permutation (in order of child seeds)
+        :return: DscPvalue with counts and p-values, m_perms is the number of permutations actually run
+        """
+        result: DscPvalue = DscPvalue(the_observed, the_null_flag)
+        seed_seq: numpy.random.SeedSequence = numpy.random.SeedSequence(self.m_seed)
+        pool: multiprocessing.Pool
+        with self.shared_pool(the_observed, the_null_flag) as pool:
+            while (result.m_perms < self.m_perms) & (result.m_overall_exceed < the_exceed_limit):
+                batch_cnt: int = min(the_batch_perms, self.m_perms - result.m_perms)
+                # spawn continues numbering child seeds after those already spawned
+                child_seeds: List[numpy.random.SeedSequence] = seed_seq.spawn(batch_cnt)
+                partial: DscPvalue
+                for partial in pool.imap(perm_dsc_shared_reduce, split_seeds(child_seeds, self.m_cores)):
+                    result.merge(partial)
+                print(f"perm_dsc_sequential perms={result.m_perms} exceed={result.m_overall_exceed}", flush=True)
+        result.calc_pvalues()
+        return result
+    # pylint: enable=too-many-arguments
+
+    @contextlib.contextmanager
+    def shared_pool(self: 'DscPerm', the_observed: Optional[DscInfo] = None, the_null_flag: bool = False) -> Iterator[multiprocessing.Pool]:
+        """
+        Copy base matrix once into shared memory, and yield a process pool whose workers are attached to it.
+        Shared memory is released when done.
+        :param the_observed: observed DscInfo for perm_dsc_shared_reduce workers
+        :param the_null_flag: for perm_dsc_shared_reduce workers, if True keep overall DSC null distribution
+        :return: multiprocessing.Pool with workers initialized by init_shared_worker
+        """
+        base_matrix: numpy.ndarray = numpy.asarray(self.m_matrix)
+        # keep a Fortran-ordered matrix (such as from R) in that order, instead of making a C ordered copy first
+        order: str = 'F' if (base_matrix.flags.f_contiguous and not base_matrix.flags.c_contiguous) else 'C'
+        shm: shared_memory.SharedMemory = shared_memory.SharedMemory(create=True, size=max(1, base_matrix.nbytes))
+        try:
+            shared_matrix: numpy.ndarray = numpy.ndarray(base_matrix.shape, dtype=base_matrix.dtype, buffer=shm.buf, order=order)
+            shared_matrix[...] = base_matrix
+            # release view before closing shared memory
+            del shared_matrix
+            pool: multiprocessing.Pool
+            with multiprocessing.Pool(processes=self.m_cores, initializer=init_shared_worker,
+                                      initargs=(shm.name, base_matrix.shape, base_matrix.dtype.str, order,
+                                                self.m_batches, self.m_levels, self.m_engine,
+                                                the_observed, the_null_flag)) as pool:
+                yield pool
+        finally:
+            shm.close()
+            shm.unlink()
+
     def perm_only(self: 'DscPerm') -> None:
         """
         Just permute the matrix -- no calculations.
@@ -120,7 +325,9 @@ class DscPerm:
         self.m_matrix = self.m_random_num.permuted(self.m_matrix, axis=1)
 
 
-def dsc_perm_calc_count(the_df: numpy.ndarray, the_batches: numpy.ndarray, the_seed: int, the_perms: int, the_threads: int) -> List[DscInfo]:
+# pylint: disable=too-many-arguments
+def dsc_perm_calc_count(the_df: numpy.ndarray, the_batches: numpy.ndarray, the_seed: int, the_perms: int, the_threads: int,
+                        the_shared_flag: bool = False, the_engine: str = 'loop') -> List[DscInfo]:
     """
     This is used to do the_perms number of permutations of the given dataframe,
     do a DSC calculation on each permutation,
@@ -130,6 +337,8 @@ def dsc_perm_calc_count(the_df: numpy.ndarray, the_batches: numpy.ndarray, the_s
     :param the_seed: seed for random number generator
     :param the_perms: number of permutations to do
     :param the_threads: number of threads/cores to use
+    :param the_shared_flag: if True, use shared memory and seed-spawned workers (DscPerm.perm_dsc_shared)
+    :param the_engine: DSC engine, 'loop' or 'vector', passed to dsc_calc
     :return: list of DscInfo of permuted matrix
     """
     # print(f"dsc_perm_calc_count the_df={the_df}", flush=True)
@@ -137,7 +346,121 @@ def dsc_perm_calc_count(the_df: numpy.ndarray, the_batches: numpy.ndarray, the_s
     print(f"dsc_perm_calc_count the_seed={the_seed}", flush=True)
     print(f"dsc_perm_calc_count the_perms={the_perms}", flush=True)
     print(f"dsc_perm_calc_count the_threads={the_threads}", flush=True)
+    print(f"dsc_perm_calc_count the_shared_flag={the_shared_flag}", flush=True)
     # NOT THREAD/MULTI-CORE SAFE
-    dpp: DscPerm = DscPerm(the_df, the_batches, the_seed, the_perms, the_threads)
-    info_list: List[DscInfo] = dpp.perm_dsc_multi()
+    dpp: DscPerm = DscPerm(the_df, the_batches, the_seed, the_perms, the_threads, the_engine)
+    info_list: List[DscInfo]
+    if the_shared_flag:
+        info_list = dpp.perm_dsc_shared()
+    else:
+        info_list = dpp.perm_dsc_multi()
     return info_list
+# pylint: enable=too-many-arguments
+
+
+# pylint: disable=too-many-arguments
+def dsc_perm_calc_count_codes(the_matrix: numpy.ndarray, the_codes: numpy.ndarray, the_levels: numpy.ndarray,
+                              the_seed: int, the_perms: int, the_threads: int,
+                              the_shared_flag: bool = False) -> List[DscInfo]:
+    """
+    dsc_perm_calc_count with batches already integer coded (see dsc_calc_codes),
+    so the matrix and batch codes are used as given. Permutations are the same as from
+    dsc_perm_calc_count for the same seed. Always uses the 'vector' DSC engine.
+    :param the_matrix: float64 matrix to permute, samples across the top, features down the side, C or Fortran order
+    :param the_codes: integer batch code for each sample, 0 based index into the_levels
+    :param the_levels: batch ids
+    :param the_seed: seed for random number generator
+    :param the_perms: number of permutations to do
+    :param the_threads: number of threads/cores to use
+    :param the_shared_flag: if True, use shared memory and seed-spawned workers (DscPerm.perm_dsc_shared)
+    :return: list of DscInfo of permuted matrix
+    """
+    print(f"dsc_perm_calc_count_codes the_seed={the_seed}", flush=True)
+    print(f"dsc_perm_calc_count_codes the_perms={the_perms}", flush=True)
+    print(f"dsc_perm_calc_count_codes the_threads={the_threads}", flush=True)
+    print(f"dsc_perm_calc_count_codes the_shared_flag={the_shared_flag}", flush=True)
+    dpp: DscPerm = DscPerm(the_matrix, the_codes, the_seed, the_perms, the_threads, 'vector', the_levels)
+    info_list: List[DscInfo]
+    if the_shared_flag:
+        info_list = dpp.perm_dsc_shared()
+    else:
+        info_list = dpp.perm_dsc_multi()
+    return info_list
+# pylint: enable=too-many-arguments
+
+
+# pylint: disable=too-many-arguments
+def dsc_perm_pvalue(the_df: numpy.ndarray, the_batches: numpy.ndarray, the_seed: int, the_perms: int, the_threads: int,
+                    the_null_flag: bool = False, the_engine: str = 'loop', the_exceed_limit: int = 0) -> DscPvalue:
+    """
+    Calculate observed DSC, then do the_perms number of permutations of the given dataframe
+    with DSC calculations, and return only the p-value counts (see DscPvalue),
+    rather than a list of DscInfo for each permutation.
+    Like pvalueDSCwithExcerpt in R, if there is only one batch, p-values are 1 with no permutations.
+    :param the_df: matrix to permute
+    :param the_batches: batches for samples
+    :param the_seed: seed for random number generator
+    :param the_perms: number of permutations to do
+    :param the_threads: number of threads/cores to use
+    :param the_null_flag: if True, keep overall DSC of each permutation
+    :param the_engine: DSC engine, 'loop' or 'vector', passed to dsc_calc
+    :param the_exceed_limit: if greater than zero, stop early after this many exceedances (see DscPerm.perm_dsc_sequential)
+    :return: DscPvalue with counts and p-values, m_perms is the number of permutations actually run
+    """
+    print(f"dsc_perm_pvalue the_seed={the_seed}", flush=True)
+    print(f"dsc_perm_pvalue the_perms={the_perms}", flush=True)
+    print(f"dsc_perm_pvalue the_threads={the_threads}", flush=True)
+    print(f"dsc_perm_pvalue the_exceed_limit={the_exceed_limit}", flush=True)
+    the_df = numpy.asarray(the_df)
+    observed: DscInfo = dsc_calc(the_df, the_batches, False, the_engine)
+    result: DscPvalue
+    if numpy.unique(the_batches).size > 1:
+        dpp: DscPerm = DscPerm(the_df, the_batches, the_seed, the_perms, the_threads, the_engine)
+        if the_exceed_limit > 0:
+            result = dpp.perm_dsc_sequential(observed, the_exceed_limit, the_null_flag=the_null_flag)
+        else:
+            result = dpp.perm_dsc_pvalue(observed, the_null_flag)
+    else:
+        result = DscPvalue(observed, the_null_flag)
+        result.m_pvalue = 1.0
+        result.m_list_of_feature_pvalue = [1.0] * observed.m_feature_dsc.size
+    return result
+# pylint: enable=too-many-arguments
+
+
+# pylint: disable=too-many-arguments
+def dsc_perm_pvalue_codes(the_matrix: numpy.ndarray, the_codes: numpy.ndarray, the_levels: numpy.ndarray,
+                          the_seed: int, the_perms: int, the_threads: int,
+                          the_null_flag: bool = False, the_exceed_limit: int = 0) -> DscPvalue:
+    """
+    dsc_perm_pvalue with batches already integer coded (see dsc_calc_codes),
+    so the matrix and batch codes are used as given (a Fortran-ordered matrix stays Fortran-ordered).
+    Always uses the 'vector' DSC engine, which is the engine that works on batch codes.
+    :param the_matrix: float64 matrix to permute, samples across the top, features down the side, C or Fortran order
+    :param the_codes: integer batch code for each sample, 0 based index into the_levels
+    :param the_levels: batch ids
+    :param the_seed: seed for random number generator
+    :param the_perms: number of permutations to do
+    :param the_threads: number of threads/cores to use
+    :param the_null_flag: if True, keep overall DSC of each permutation
+    :param the_exceed_limit: if greater than zero, stop early after this many exceedances (see DscPerm.perm_dsc_sequential)
+    :return: DscPvalue with counts and p-values, m_perms is the number of permutations actually run
+    """
+    print(f"dsc_perm_pvalue_codes the_seed={the_seed}", flush=True)
+    print(f"dsc_perm_pvalue_codes the_perms={the_perms}", flush=True)
+    print(f"dsc_perm_pvalue_codes the_threads={the_threads}", flush=True)
+    print(f"dsc_perm_pvalue_codes the_exceed_limit={the_exceed_limit}", flush=True)
+    observed: DscInfo = dsc_calc_codes(the_matrix, the_codes, the_levels)
+    result: DscPvalue
+    if numpy.count_nonzero(numpy.bincount(the_codes, minlength=the_levels.size)) > 1:
+        dpp: DscPerm = DscPerm(the_matrix, the_codes, the_seed, the_perms, the_threads, 'vector', the_levels)
+        if the_exceed_limit > 0:
+            result = dpp.perm_dsc_sequential(observed, the_exceed_limit, the_null_flag=the_null_flag)
+        else:
+            result = dpp.perm_dsc_pvalue(observed, the_null_flag)
+    else:
+        result = DscPvalue(observed, the_null_flag)
+        result.m_pvalue = 1.0
+        result.m_list_of_feature_pvalue = [1.0] * observed.m_feature_dsc.size
+    return result
+# pylint: enable=too-many-arguments
@@ -0,0 +1,178 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Copyright (c) 2011-2024 University of Texas MD Anderson Cancer Center
+
+This program is free software: you can redistribute it and/or modify it under the terms of the
+GNU General Public License as published by the Free Software Foundation, either version 2 of
+the License, or (at your option) any later version.
+
+This program is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY;
+without even the implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+See the GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License along with this program.
+If not, see <https://www.gnu.org/licenses/>.
+
+MD Anderson Cancer Center Bioinformatics on GitHub <https://github.com/MD-Anderson-Bioinformatics>
+MD Anderson Cancer Center Bioinformatics at MDA <https://www.mdanderson.org/research/departments-labs-institutes/departments-divisions/bioinformatics-and-computational-biology.html>
+@author: Tod Casasent
+"""
+
+from typing import List
+from textwrap import dedent
+import numpy
+from mbatch.dsc.dsc_info import DscInfo
+
+
+class DscPvalue:
+    """
+    Class to accumulate DSC permutation results against an observed DscInfo,
+    keeping only counts (and optionally the overall DSC null distribution)
+    instead of a DscInfo per permutation.
+    Comparisons match pvalueDSCwithExcerpt in MBatch R code:
+    a permutation counts when its DSC and the observed DSC are not NaN,
+    and exceeds when permuted DSC >= observed DSC.
+    MEMBER VALUES
+    m_observed_dsc: float - observed overall DSC
+    m_observed_feature_dsc: numpy.ndarray - observed DSC by feature
+    m_null_flag: bool - if True, keep overall DSC of each permutation in m_null_dsc
+    m_perms: int - number of permutations accumulated
+    m_overall_count: int - permutations where overall DSC could be compared
+    m_overall_exceed: int - permutations where overall DSC >= observed DSC
+    m_feature_count: numpy.ndarray - by feature, permutations where DSC could be compared
+    m_feature_exceed: numpy.ndarray - by feature, permutations where DSC >= observed DSC
+    m_null_dsc: List[float] - overall DSC of each permutation (if m_null_flag)
+    m_pvalue: float - overall p-value (set by calc_pvalues)
+    m_list_of_feature_pvalue: List[float] - p-value by feature (set by calc_pvalues)
+    """
+    # do not set method variables, as they should be initialized in the init function
+    m_observed_dsc: float
+    m_observed_feature_dsc: numpy.ndarray
+    m_null_flag: bool
+    m_perms: int
+    m_overall_count: int
+    m_overall_exceed: int
+    m_feature_count: numpy.ndarray
+    m_feature_exceed: numpy.ndarray
+    m_null_dsc: List[float]
+    m_pvalue: float
+    m_list_of_feature_pvalue: List[float]
+
+    def __init__(self: 'DscPvalue', the_observed: DscInfo, the_null_flag: bool = False) -> None:
+        """
+        init zero counts for the given observed values.
+        Members described at class level
+        :param the_observed: DscInfo from dsc_calc of the non-permuted matrix
+        :param the_null_flag: if True, keep overall DSC of each permutation
+        """
+        super().__init__()
+        self.m_observed_dsc = the_observed.m_dsc
+        self.m_observed_feature_dsc = numpy.asarray(the_observed.m_feature_dsc, dtype=numpy.float64)
+        self.m_null_flag = the_null_flag
+        self.m_perms = 0
+        self.m_overall_count = 0
+        self.m_overall_exceed = 0
+        self.m_feature_count = numpy.zeros(self.m_observed_feature_dsc.size, dtype=numpy.int64)
+        self.m_feature_exceed = numpy.zeros(self.m_observed_feature_dsc.size, dtype=numpy.int64)
+        self.m_null_dsc = []
+        self.m_pvalue = float('nan')
+        self.m_list_of_feature_pvalue = []
+
+    def __str__(self: 'DscPvalue') -> str:
+        """
+        tostring makes a string with data
+        :return: String version of object and its data
+        """
+        return dedent(f"""
+            {super().__str__()}
+            m_perms = {self.m_perms}
+            m_overall_count = {self.m_overall_count}
+            m_overall_exceed = {self.m_overall_exceed}
+            m_pvalue = {self.m_pvalue}
+            m_list_of_feature_pvalue = {self.m_list_of_feature_pvalue[:3]}""")
+
+    def add_perm(self: 'DscPvalue', the_perm: DscInfo) -> None:
+        """
+        Add counts for one permutation result. The DscInfo is not kept.
+        :param the_perm: DscInfo from dsc_calc of a permuted matrix
+        :return: nothing
+        """
+        self.m_perms += 1
+        if self.m_null_flag:
+            self.m_null_dsc.append(the_perm.m_dsc)
+        if (not numpy.isnan(the_perm.m_dsc)) & (not numpy.isnan(self.m_observed_dsc)):
+            self.m_overall_count += 1
+            if the_perm.m_dsc >= self.m_observed_dsc:
+                self.m_overall_exceed += 1
+        perm_feature: numpy.ndarray = numpy.asarray(the_perm.m_feature_dsc, dtype=numpy.float64)
+        compared: numpy.ndarray = ~(numpy.isnan(perm_feature) | numpy.isnan(self.m_observed_feature_dsc))
+        self.m_feature_count += compared
+        self.m_feature_exceed += compared & (perm_feature >= self.m_observed_feature_dsc)
+
+    def merge(self: 'DscPvalue', the_other: 'DscPvalue') -> None:
+        """
+        Add counts from another accumulator for the same observed values
+        (such as one reduced in a worker process). Null distribution of the_other goes after this one.
+        :param the_other: DscPvalue to add to this one
+        :return: nothing
+        """
+        self.m_perms += the_other.m_perms
+        self.m_overall_count += the_other.m_overall_count
+        self.m_overall_exceed += the_other.m_overall_exceed
+        self.m_feature_count += the_other.m_feature_count
+        self.m_feature_exceed += the_other.m_feature_exceed
+        self.m_null_dsc.extend(the_other.m_null_dsc)
+
+    def calc_pvalues(self: 'DscPvalue') -> None:
+        """
+        Set m_pvalue and m_list_of_feature_pvalue from counts.
+        Overall p-value is 0 if no permutations could be compared.
+        Feature p-value is NaN if observed feature DSC is NaN or no permutations could be compared.
+        :return: nothing
+        """
+        self.m_pvalue = 0.0
+        if self.m_overall_count > 0:
+            self.m_pvalue = self.m_overall_exceed / self.m_overall_count
+        with numpy.errstate(divide='ignore', invalid='ignore'):
+            feature_pvalue: numpy.ndarray = self.m_feature_exceed / self.m_feature_count
+        feature_pvalue[numpy.isnan(self.m_observed_feature_dsc)] = float('nan')
+        self.m_list_of_feature_pvalue = feature_pvalue.tolist()
+
+    def write_to_binary(self: 'DscPvalue', the_file: str) -> str:
+        """
+        Write counts, null distribution, and p-values to disk file, as numpy .npz
+        :param the_file: full path to file to which to write (should end in .npz)
+        :return: the_file (file written)
+        """
+        numpy.savez(the_file,
+                    observed_dsc=numpy.float64(self.m_observed_dsc),
+                    observed_feature_dsc=self.m_observed_feature_dsc,
+                    null_flag=numpy.bool_(self.m_null_flag),
+                    counts=numpy.array([self.m_perms, self.m_overall_count, self.m_overall_exceed], dtype=numpy.int64),
+                    feature_count=self.m_feature_count,
+                    feature_exceed=self.m_feature_exceed,
+                    null_dsc=numpy.array(self.m_null_dsc, dtype=numpy.float64),
+                    pvalue=numpy.float64(self.m_pvalue),
+                    feature_pvalue=numpy.array(self.m_list_of_feature_pvalue, dtype=numpy.float64))
+        return the_file
+
+    def read_from_binary(self: 'DscPvalue', the_file: str) -> str:
+        """
+        Read file written by write_to_binary, populate self from that file
+        :param the_file: full path to file to read
+        :return: the_file (file read)
+        """
+        with numpy.load(the_file, allow_pickle=False) as in_file:
+            self.m_observed_dsc = float(in_file['observed_dsc'])
+            self.m_observed_feature_dsc = in_file['observed_feature_dsc']
+            self.m_null_flag = bool(in_file['null_flag'])
+            self.m_perms = int(in_file['counts'][0])
+            self.m_overall_count = int(in_file['counts'][1])
+            self.m_overall_exceed = int(in_file['counts'][2])
+            self.m_feature_count = in_file['feature_count']
+            self.m_feature_exceed = in_file['feature_exceed']
+            self.m_null_dsc = in_file['null_dsc'].tolist()
+            self.m_pvalue = float(in_file['pvalue'])
+            self.m_list_of_feature_pvalue = in_file['feature_pvalue'].tolist()
+        return the_file
@@ -0,0 +1,299 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Copyright (c) 2011-2024 University of Texas MD Anderson Cancer Center
+
+This program is free software: you can redistribute it and/or modify it under the terms of the
+GNU General Public License as published by the Free Software Foundation, either version 2 of
+the License, or (at your option) any later version.
+
+This program is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY;
+without even the implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+See the GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License along with this program.
+If not, see <https://www.gnu.org/licenses/>.
+
+MD Anderson Cancer Center Bioinformatics on GitHub <https://github.com/MD-Anderson-Bioinformatics>
+MD Anderson Cancer Center Bioinformatics at MDA <https://www.mdanderson.org/research/departments-labs-institutes/departments-divisions/bioinformatics-and-computational-biology.html>
+@author: Tod Casasent
+"""
+
+from typing import Tuple
+from textwrap import dedent
+import io
+import os
+import numpy
+from mbatch.dsc.dsc_info import DscInfo
+from mbatch.dsc.dsc_calc import factorize_batches, dsc_group_stats, dsc_from_group_stats, dsc_pairwise_from_group_stats
+from mbatch.test.common import convert_to_filename
+
+
+class DscStats:
+    """
+    Class to hold per-feature, per-batch sufficient statistics for DSC,
+    so DSC can be updated for added or removed samples without the full matrix.
+    Sum of squares is centered on the batch mean (see dsc_group_stats).
+    MEMBER VALUES
+    m_features: numpy.ndarray - feature ids (rows of matrix)
+    m_samples: numpy.ndarray - sample ids included in statistics
+    m_sample_codes: numpy.ndarray - batch code (index into m_levels) for each sample in m_samples
+    m_levels: numpy.ndarray - batch ids
+    m_counts: numpy.ndarray - number of samples for each batch
+    m_sums: numpy.ndarray - features x batches sums of values
+    m_sum_squares: numpy.ndarray - features x batches sums of squared deviations from batch mean
+    """
+    # do not set method variables, as they should be initialized in the init function
+    m_features: numpy.ndarray
+    m_samples: numpy.ndarray
+    m_sample_codes: numpy.ndarray
+    m_levels: numpy.ndarray
+    m_counts: numpy.ndarray
+    m_sums: numpy.ndarray
+    m_sum_squares: numpy.ndarray
+
+    def __init__(self: 'DscStats') -> None:
+        """
+        init empty values.
+        Members described at class level
+        """
+        super().__init__()
+        self.m_features = numpy.empty(0, str)
+        self.m_samples = numpy.empty(0, str)
+        self.m_sample_codes = numpy.empty(0, numpy.int64)
+        self.m_levels = numpy.empty(0, str)
+        self.m_counts = numpy.empty(0, numpy.float64)
+        self.m_sums = numpy.empty((0, 0), numpy.float64)
+        self.m_sum_squares = numpy.empty((0, 0), numpy.float64)
+
+    def __str__(self: 'DscStats') -> str:
+        """
+        tostring makes a string with data
+        :return: String version of object and its data
+        """
+        return dedent(f"""
+            {super().__str__()}
+            m_features = {self.m_features[:3]} ({self.m_features.size})
+            m_samples = {self.m_samples[:3]} ({self.m_samples.size})
+            m_levels = {self.m_levels[:3]} ({self.m_levels.size})
+            m_counts = {self.m_counts[:3]}""")
+
+    @classmethod
+    def from_matrix(cls, the_matrix: numpy.ndarray, the_batches: numpy.ndarray,
+                    the_features: numpy.ndarray, the_samples: numpy.ndarray) -> 'DscStats':
+        """
+        Create a DscStats object from a full matrix
+        :param the_matrix: samples across the top, features down the side, Decimal values
+        :param the_batches: list of strings with batch ids for samples
+        :param the_features: feature ids for rows
+        :param the_samples: sample ids for columns
+        :return: instance of DscStats
+        """
+        assert the_matrix.shape[1] == the_batches.size, "Number of batches should match number of samples (columns)"
+        result: 'DscStats' = cls()
+        result.m_features = numpy.asarray(the_features, dtype=str)
+        result.m_samples = numpy.asarray(the_samples, dtype=str)
+        result.m_sample_codes, result.m_levels = factorize_batches(numpy.asarray(the_batches, dtype=str))
+        result.m_counts, result.m_sums, result.m_sum_squares = \
+            dsc_group_stats(numpy.asarray(the_matrix, dtype=numpy.float64), result.m_sample_codes, result.m_levels.size)
+        return result
+
+    def calc_dsc(self: 'DscStats') -> DscInfo:
+        """
+        Perform DSC calculations from the statistics, same results as dsc_calc on the matrix
+        :return: DscInfo object contain results of DSC calculation
+        """
+        return dsc_from_group_stats(self.m_counts, self.m_sums, self.m_sum_squares)
+
+    def calc_pairwise(self: 'DscStats') -> Tuple[numpy.ndarray, numpy.ndarray, numpy.ndarray]:
+        """
+        Perform DSC calculations for every pair of batches from the statistics (see dsc_pairwise_from_group_stats)
+        :return: tuple of batches x batches DSC, Db, and Dw in m_levels order
+        """
+        return dsc_pairwise_from_group_stats(self.m_counts, self.m_sums, self.m_sum_squares)
+
+    def add_samples(self: 'DscStats', the_matrix: numpy.ndarray, the_batches: numpy.ndarray, the_samples: numpy.ndarray) -> None:
+        """
+        Add sample columns to the statistics. New batch ids are added as new batches.
+        :param the_matrix: added samples across the top, features down the side in m_features order
+        :param the_batches: list of strings with batch ids for added samples
+        :param the_samples: sample ids for added samples (must not already be included)
+        :return: nothing
+        """
+        the_batches = numpy.asarray(the_batches, dtype=str)
+        the_samples = numpy.asarray(the_samples, dtype=str)
+        assert the_matrix.shape == (self.m_features.size, the_batches.size), "Added matrix should be features by added batches"
+        assert not numpy.isin(the_samples, self.m_samples).any(), "Added samples are already in statistics"
+        # extend batch levels with any new batch ids
+        all_levels: numpy.ndarray = numpy.union1d(self.m_levels, the_batches)
+        self.reindex_levels(all_levels)
+        added_codes: numpy.ndarray = numpy.searchsorted(all_levels, the_batches)
+        added_counts: numpy.ndarray
+        added_sums: numpy.ndarray
+        added_sum_squares: numpy.ndarray
+        added_counts, added_sums, added_sum_squares = \
+            dsc_group_stats(numpy.asarray(the_matrix, dtype=numpy.float64), added_codes, all_levels.size)
+        self.m_counts, self.m_sums, self.m_sum_squares = combine_group_stats(
+            (self.m_counts, self.m_sums, self.m_sum_squares), (added_counts, added_sums, added_sum_squares), 1.0)
+        self.m_samples = numpy.concatenate((self.m_samples, the_samples))
+        self.m_sample_codes = numpy.concatenate((self.m_sample_codes, added_codes))
+
+    def remove_samples(self: 'DscStats', the_matrix: numpy.ndarray, the_samples: numpy.ndarray) -> None:
+        """
+        Remove sample columns from the statistics. Batch for each sample comes from the statistics.
+        Batches with no samples left are dropped.
+        If a removed column has non-finite values, those batches stay NaN, and need to be rebuilt from_matrix.
+        :param the_matrix: removed samples across the top, features down the side in m_features order
+        :param the_samples: sample ids for removed samples (must be included)
+        :return: nothing
+        """
+        the_samples = numpy.asarray(the_samples, dtype=str)
+        assert the_matrix.shape == (self.m_features.size, the_samples.size), "Removed matrix should be features by removed samples"
+        keep_mask: numpy.ndarray = ~numpy.isin(self.m_samples, the_samples)
+        assert (self.m_samples.size - numpy.count_nonzero(keep_mask)) == the_samples.size, "Removed samples are not in statistics"
+        sample_index: numpy.ndarray = numpy.argsort(self.m_samples)
+        removed_codes: numpy.ndarray = self.m_sample_codes[sample_index[numpy.searchsorted(self.m_samples, the_samples, sorter=sample_index)]]
+        removed_counts: numpy.ndarray
+        removed_sums: numpy.ndarray
+        removed_sum_squares: numpy.ndarray
+        removed_counts, removed_sums, removed_sum_squares = \
+            dsc_group_stats(numpy.asarray(the_matrix, dtype=numpy.float64), removed_codes, self.m_levels.size)
+        self.m_counts, self.m_sums, self.m_sum_squares = combine_group_stats(
+            (self.m_counts, self.m_sums, self.m_sum_squares), (removed_counts, removed_sums, removed_sum_squares), -1.0)
+        self.m_samples = self.m_samples[keep_mask]
+        self.m_sample_codes = self.m_sample_codes[keep_mask]
+        # drop batches with no samples left
+        self.reindex_levels(self.m_levels[self.m_counts > 0])
+
+    def reindex_levels(self: 'DscStats', the_levels: numpy.ndarray) -> None:
+        """
+        Change batch ids (levels) to the given sorted ids. Missing batches are added empty,
+        batches not in the_levels are dropped (and must be empty).
+        :param the_levels: sorted unique batch ids
+        :return: nothing
+        """
+        old_index: numpy.ndarray = numpy.searchsorted(the_levels, self.m_levels)
+        counts: numpy.ndarray = numpy.zeros(the_levels.size, numpy.float64)
+        sums: numpy.ndarray = numpy.zeros((self.m_features.size, the_levels.size), numpy.float64)
+        sum_squares: numpy.ndarray = numpy.zeros((self.m_features.size, the_levels.size), numpy.float64)
+        kept: numpy.ndarray = numpy.isin(self.m_levels, the_levels)
+        assert (self.m_counts[~kept] == 0).all(), "Only empty batches can be dropped"
+        counts[old_index[kept]] = self.m_counts[kept]
+        sums[:, old_index[kept]] = self.m_sums[:, kept]
+        sum_squares[:, old_index[kept]] = self.m_sum_squares[:, kept]
+        code_map: numpy.ndarray = numpy.full(max(1, self.m_levels.size), -1, numpy.int64)
+        code_map[numpy.flatnonzero(kept)] = old_index[kept]
+        self.m_sample_codes = code_map[self.m_sample_codes]
+        self.m_levels = the_levels
+        self.m_counts = counts
+        self.m_sums = sums
+        self.m_sum_squares = sum_squares
+
+    def write_to_file(self: 'DscStats', the_file: str) -> str:
+        """
+        Write object to disk file, as numpy .npz
+        :param the_file: full path to file to which to write this DscStats object (should end in .npz)
+        :return: the_file (file written)
+        """
+        out_file: io.BufferedWriter
+        with open(the_file, 'wb') as out_file:
+            numpy.savez(out_file, features=self.m_features, samples=self.m_samples,
+                        sample_codes=self.m_sample_codes, levels=self.m_levels, counts=self.m_counts,
+                        sums=self.m_sums, sum_squares=self.m_sum_squares)
+        return the_file
+
+    def read_from_file(self: 'DscStats', the_file: str) -> str:
+        """
+        Read file written by write_to_file, populate self from that file
+        :param the_file: full path to file to read
+        :return: the_file (file read)
+        """
+        print(f"read_from_file the_file={the_file}", flush=True)
+        with numpy.load(the_file, allow_pickle=False) as in_data:
+            self.m_features = in_data['features']
+            self.m_samples = in_data['samples']
+            self.m_sample_codes = in_data['sample_codes']
+            self.m_levels = in_data['levels']
+            self.m_counts = in_data['counts']
+            self.m_sums = in_data['sums']
+            self.m_sum_squares = in_data['sum_squares']
+        return the_file
+
+
+def combine_group_stats(the_stats_a: Tuple[numpy.ndarray, numpy.ndarray, numpy.ndarray],
+                        the_stats_b: Tuple[numpy.ndarray, numpy.ndarray, numpy.ndarray],
+                        the_sign: float) -> Tuple[numpy.ndarray, numpy.ndarray, numpy.ndarray]:
+    """
+    Combine (the_sign 1.0) or remove (the_sign -1.0) group statistics B from group statistics A,
+    using the pairwise update for sums of squared deviations (Chan et al.), so no raw sums of squares are needed.
+    Both must use the same batch levels.
+    :param the_stats_a: tuple of counts, sums, and sums of squared deviations
+    :param the_stats_b: tuple of counts, sums, and sums of squared deviations to add or remove
+    :param the_sign: 1.0 to add B to A, -1.0 to remove B from A
+    :return: tuple of counts, sums, and sums of squared deviations
+    """
+    counts_a: numpy.ndarray
+    sums_a: numpy.ndarray
+    sum_squares_a: numpy.ndarray
+    counts_b: numpy.ndarray
+    sums_b: numpy.ndarray
+    sum_squares_b: numpy.ndarray
+    counts_a, sums_a, sum_squares_a = the_stats_a
+    counts_b, sums_b, sum_squares_b = the_stats_b
+    counts: numpy.ndarray = counts_a + the_sign * counts_b
+    sums: numpy.ndarray = sums_a + the_sign * sums_b
+    correction: numpy.ndarray
+    with numpy.errstate(divide='ignore', invalid='ignore'):
+        if the_sign > 0:
+            # combined M2 = M2a + M2b + (mean b - mean a)^2 * na * nb / n
+            delta: numpy.ndarray = sums_b / counts_b - sums_a / counts_a
+            correction = delta * delta * counts_a * counts_b / counts
+        else:
+            # A is the combined set, so M2a = M2 + M2b + (mean b - mean result)^2 * n * nb / na
+            delta: numpy.ndarray = sums_b / counts_b - sums / counts
+            correction = delta * delta * counts * counts_b / counts_a
+    correction = numpy.where((counts_a > 0) & (counts_b > 0) & (counts > 0), correction, 0.0)
+    sum_squares: numpy.ndarray = sum_squares_a + the_sign * (sum_squares_b + correction)
+    # removing can leave tiny negative values from rounding
+    sum_squares = numpy.where(sum_squares < 0.0, 0.0, sum_squares)
+    sum_squares = numpy.where(counts > 0, sum_squares, 0.0)
+    sums = numpy.where(counts > 0, sums, 0.0)
+    return counts, sums, sum_squares
+
+
+def dsc_stats_file(the_dir: str, the_batch_type: str) -> str:
+    """
+    Path for cached DscStats for a batch type, kept next to the dataset version matrix
+    :param the_dir: directory with dataset version (matrix_data.tsv and batches.tsv)
+    :param the_batch_type: batch type the statistics are for
+    :return: full path to DscStats file
+    """
+    return os.path.join(the_dir, f"DscStats-{convert_to_filename(the_batch_type)}.npz")
+
+
+# pylint: disable=too-many-arguments
+def dsc_update(the_stats_file: str, the_new_stats_file: str,
+               the_added_matrix: numpy.ndarray, the_added_batches: numpy.ndarray, the_added_samples: numpy.ndarray,
+               the_removed_matrix: numpy.ndarray, the_removed_samples: numpy.ndarray) -> DscInfo:
+    """
+    Compute DSC for a new dataset version from cached DscStats of the previous version,
+    plus the added and removed sample columns, without the full matrix.
+    New statistics are written to the_new_stats_file, for the next version.
+    :param the_stats_file: DscStats file for previous version
+    :param the_new_stats_file: DscStats file to write for new version
+    :param the_added_matrix: added samples across the top, features down the side (zero columns if none)
+    :param the_added_batches: batch ids for added samples
+    :param the_added_samples: sample ids for added samples
+    :param the_removed_matrix: removed samples across the top, features down the side (zero columns if none)
+    :param the_removed_samples: sample ids for removed samples
+    :return: DscInfo object contain results of DSC calculation for new version
+    """
+    my_stats: DscStats = DscStats()
+    my_stats.read_from_file(the_stats_file)
+    if the_removed_samples.size > 0:
+        my_stats.remove_samples(the_removed_matrix, the_removed_samples)
+    if the_added_samples.size > 0:
+        my_stats.add_samples(the_added_matrix, the_added_batches, the_added_samples)
+    my_stats.write_to_file(the_new_stats_file)
+    return my_stats.calc_dsc()
+# pylint: enable=too-many-arguments
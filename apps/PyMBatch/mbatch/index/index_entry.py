@@ -20,7 +20,7 @@ MD Anderson Cancer Center Bioinformatics at MDA <https://www.mdanderson.org/rese
 """
 
 
-from typing import List
+from typing import List, Tuple
 import os
 from mbatch.test.common import get_sorted_dirs, next_sub_dir_starts_with, get_sorted_files, read_file_to_string
 
@@ -41,6 +41,7 @@ class MBatchEntry:
     notice: str
     # #####
     volcano_data: str
+    volcano_format: str
     batch_id: str
     batch_type: str
     # #####
@@ -94,6 +95,7 @@ class MBatchEntry:
         self.notice: str = ""
         # volcano
         self.volcano_data = ""
+        self.volcano_format = ""
         self.batch_id = ""
         self.batch_type = ""
         # hierarchy level values
@@ -923,6 +925,37 @@ def make_entry_umap(the_dir: str, the_info_dir: str) -> MBatchEntry:
 # ##################################################################
 
 
+# volcano data file prefix, suffix, and format, in order of preference
+# format is json (one dict per feature), columns (JSON lists), or binary (float32 columns)
+# with -gz added for gzip compressed files
+VOLCANO_DATA_FILES: List[Tuple[str, str, str]] = [
+    ("Volcano-Binary-", ".bin.gz", "binary-gz"),
+    ("Volcano-Binary-", ".bin", "binary"),
+    ("Volcano-Columns-", ".json.gz", "columns-gz"),
+    ("Volcano-Columns-", ".json", "columns"),
+    ("Volcano-Data-", ".json.gz", "json-gz"),
+    ("Volcano-Data-", ".json", "json")
+]
+
+
+def find_volcano_data_file(the_dir: str, the_batch_id: str) -> Tuple[str, str]:
+    """
+    Find volcano data file for batch id, using VOLCANO_DATA_FILES order.
+    If no file is found, use the original Volcano-Data JSON name.
+    :param the_dir: current directory to be investigated
+    :param the_batch_id: batch id from diagram file name
+    :return: tuple of file name (no directory) and format
+    """
+    prefix: str
+    suffix: str
+    data_format: str
+    for prefix, suffix, data_format in VOLCANO_DATA_FILES:
+        file_name: str = f"{prefix}{the_batch_id}{suffix}"
+        if os.path.exists(os.path.join(the_dir, file_name)):
+            return file_name, data_format
+    return f"Volcano-Data-{the_batch_id}.json", "json"
+
+
 def make_entry_volcanoplot_diagram(the_dir: str, the_parent: MBatchEntry, the_info_dir: dir, the_batch_type: str,) -> None:
     """
     Make the diagram entry.
@@ -962,7 +995,11 @@ def make_entry_volcanoplot_diagram(the_dir: str, the_parent: MBatchEntry, the_in
         batch_id: str
         for batch_id in batch_ids:
             next_entry: MBatchEntry = MBatchEntry(batch_id, "", "volcano", the_info_dir)
-            next_entry.volcano_data = f"{dir_path}Volcano-Data-{batch_id}.json"
+            data_file: str
+            data_format: str
+            data_file, data_format = find_volcano_data_file(the_dir, batch_id)
+            next_entry.volcano_data = f"{dir_path}{data_file}"
+            next_entry.volcano_format = data_format
             next_entry.batch_id = batch_id
             next_entry.batch_type = the_batch_type
             next_entry.diagram_image = f'{dir_path}Volcano-Diagram-{batch_id}.png'
@@ -0,0 +1,219 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Copyright (c) 2011-2024 University of Texas MD Anderson Cancer Center
+
+This program is free software: you can redistribute it and/or modify it under the terms of the
+GNU General Public License as published by the Free Software Foundation, either version 2 of
+the License, or (at your option) any later version.
+
+This program is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY;
+without even the implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+See the GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License along with this program.
+If not, see <https://www.gnu.org/licenses/>.
+
+MD Anderson Cancer Center Bioinformatics on GitHub <https://github.com/MD-Anderson-Bioinformatics>
+MD Anderson Cancer Center Bioinformatics at MDA <https://www.mdanderson.org/research/departments-labs-institutes/departments-divisions/bioinformatics-and-computational-biology.html>
+@author: Tod Casasent
+"""
+
+import os
+import sqlite3
+from typing import List, Optional, Tuple
+from mbatch.pipeline.std_data import StandardizedData, STD_HEADERS, write_std_pipeline_index
+
+
+# bump if the table layout changes
+PIPELINE_INDEX_STORE_VERSION: int = 1
+
+
+def get_index_store_file(the_index_file: str) -> str:
+    """
+    Get the SQLite store file kept next to a pipeline index TSV file
+    :param the_index_file: full path including file name to pipeline index TSV file
+    :return: full path to SQLite store file
+    """
+    return f"{the_index_file}.sqlite"
+
+
+class PipelineIndexStore:
+    """
+    SQLite store for pipeline index entries, kept next to the pipeline index TSV.
+    Each job state change is a single row update in its own transaction,
+    instead of a sorted rewrite of the whole TSV.
+    The store is the working copy during a run, and the TSV is exported from it.
+    Rows are identified by StandardizedData.index_row, since corrections add entries
+    with the same std_archive and version as the original job.
+    """
+    # do not set method variables, as they should be initialized in the init function
+    m_index_file: str
+    m_store_file: str
+    m_connection: sqlite3.Connection
+    m_saved: bool
+
+    def __init__(self: 'PipelineIndexStore', the_index_file: str) -> None:
+        """
+        Open (and create if needed) the store for a pipeline index TSV file.
+        :param the_index_file: full path including file name to pipeline index TSV file
+        """
+        super().__init__()
+        self.m_index_file = the_index_file
+        self.m_store_file = get_index_store_file(the_index_file)
+        self.m_saved = False
+        print(f"PipelineIndexStore open {self.m_store_file}", flush=True)
+        self.m_connection = sqlite3.connect(self.m_store_file)
+        self.m_connection.execute("PRAGMA journal_mode=WAL")
+        self.m_connection.execute("PRAGMA synchronous=NORMAL")
+        version: int = self.m_connection.execute("PRAGMA user_version").fetchone()[0]
+        if version != PIPELINE_INDEX_STORE_VERSION:
+            with self.m_connection:
+                self.m_connection.execute("DROP TABLE IF EXISTS pipeline_index")
+                self.m_connection.execute("CREATE TABLE pipeline_index (index_row INTEGER PRIMARY KEY, " +
+                                          ", ".join([f"{header} TEXT NOT NULL" for header in STD_HEADERS]) + ")")
+                self.m_connection.execute("CREATE INDEX pipeline_index_key ON pipeline_index (std_archive, version, job_id)")
+                self.m_connection.execute(f"PRAGMA user_version={PIPELINE_INDEX_STORE_VERSION}")
+
+    def close(self: 'PipelineIndexStore') -> None:
+        """
+        Close the store connection.
+        :return: nothing
+        """
+        self.m_connection.close()
+
+    def __enter__(self: 'PipelineIndexStore') -> 'PipelineIndexStore':
+        """
+        Use store in a with statement.
+        :return: this store
+        """
+        return self
+
+    def __exit__(self: 'PipelineIndexStore', the_type, the_value, the_traceback) -> None:
+        """
+        Close store at end of with statement.
+        :return: nothing
+        """
+        self.close()
+
+    def finish(self: 'PipelineIndexStore') -> None:
+        """
+        End of a run: export the TSV if any entry was saved, then close and remove the store,
+        so later edits of the TSV by other tools are not overwritten by recover_std_pipeline_index.
+        :return: nothing
+        """
+        if self.m_saved:
+            self.export_index()
+        self.close()
+        suffix: str
+        for suffix in ['', '-wal', '-shm']:
+            if os.path.exists(self.m_store_file + suffix):
+                os.remove(self.m_store_file + suffix)
+
+    def count(self: 'PipelineIndexStore') -> int:
+        """
+        Number of entries in the store.
+        :return: count of rows
+        """
+        return self.m_connection.execute("SELECT COUNT(*) FROM pipeline_index").fetchone()[0]
+
+    def read_entries(self: 'PipelineIndexStore') -> List[StandardizedData]:
+        """
+        Read all entries, in the pipeline index TSV sort order.
+        :return: list of StandardizedData, with index_row set
+        """
+        return self.select_entries("", ())
+
+    def find_entries(self: 'PipelineIndexStore', the_std_archive: str, the_version: str,
+                     the_job_id: Optional[str] = None) -> List[StandardizedData]:
+        """
+        Find entries by std_archive and version, and optionally job_id, using the store index.
+        :param the_std_archive: archive sub-path to find
+        :param the_version: data version to find
+        :param the_job_id: job id to find, None for any job
+        :return: list of matching StandardizedData, with index_row set
+        """
+        if the_job_id is None:
+            return self.select_entries(" WHERE std_archive=? AND version=?", (the_std_archive, the_version))
+        return self.select_entries(" WHERE std_archive=? AND version=? AND job_id=?",
+                                   (the_std_archive, the_version, the_job_id))
+
+    def select_entries(self: 'PipelineIndexStore', the_where: str, the_args: Tuple[str, ...]) -> List[StandardizedData]:
+        """
+        Select entries, ordered like write_std_pipeline_index (ties in insertion order).
+        :param the_where: SQL WHERE clause, or empty string
+        :param the_args: arguments for the WHERE clause
+        :return: list of StandardizedData, with index_row set
+        """
+        entries: List[StandardizedData] = []
+        row: tuple
+        for row in self.m_connection.execute(f"SELECT index_row, {', '.join(STD_HEADERS)} FROM pipeline_index" +
+                                             the_where + " ORDER BY std_archive, version, job_id, index_row", the_args):
+            entry: StandardizedData = StandardizedData.from_dict(dict(zip(STD_HEADERS, row[1:])))
+            entry.index_row = row[0]
+            entries.append(entry)
+        return entries
+
+    def save_entry(self: 'PipelineIndexStore', the_entry: StandardizedData) -> None:
+        """
+        Insert or update one entry, committed atomically.
+        Sets the_entry.index_row for new entries.
+        :param the_entry: StandardizedData to store
+        :return: nothing
+        """
+        with self.m_connection:
+            self.write_entry(the_entry)
+        self.m_saved = True
+
+    def replace_entries(self: 'PipelineIndexStore', the_entries: List[StandardizedData]) -> None:
+        """
+        Replace the store contents with the_entries, committed atomically.
+        Sets index_row for every entry.
+        :param the_entries: list of StandardizedData
+        :return: nothing
+        """
+        with self.m_connection:
+            self.m_connection.execute("DELETE FROM pipeline_index")
+            my_entry: StandardizedData
+            for my_entry in the_entries:
+                my_entry.index_row = None
+                self.write_entry(my_entry)
+
+    def write_entry(self: 'PipelineIndexStore', the_entry: StandardizedData) -> None:
+        """
+        Insert or update one entry, within the caller's transaction.
+        :param the_entry: StandardizedData to store
+        :return: nothing
+        """
+        values: List[str] = [getattr(the_entry, attr) for attr in STD_HEADERS]
+        if the_entry.index_row is None:
+            cursor: sqlite3.Cursor = self.m_connection.execute(
+                f"INSERT INTO pipeline_index ({', '.join(STD_HEADERS)}) VALUES ({', '.join(['?'] * len(STD_HEADERS))})",
+                values)
+            the_entry.index_row = cursor.lastrowid
+        else:
+            self.m_connection.execute(
+                f"UPDATE pipeline_index SET {', '.join([f'{attr}=?' for attr in STD_HEADERS])} WHERE index_row=?",
+                values + [the_entry.index_row])
+
+    def export_index(self: 'PipelineIndexStore') -> None:
+        """
+        Write the pipeline index TSV from the store.
+        :return: nothing
+        """
+        write_std_pipeline_index(self.m_index_file, self.read_entries())
+
+
+def recover_std_pipeline_index(the_index_file: str) -> None:
+    """
+    Bring the pipeline index TSV up to date from its store, if one was left by an earlier run.
+    Call before reading the TSV, so job changes committed to the store before a crash are not lost.
+    :param the_index_file: full path including file name to pipeline index TSV file
+    :return: nothing
+    """
+    if os.path.exists(get_index_store_file(the_index_file)):
+        store: PipelineIndexStore
+        with PipelineIndexStore(the_index_file) as store:
+            if store.count() > 0:
+                print(f"recover_std_pipeline_index from {store.m_store_file}", flush=True)
+                store.export_index()
@@ -23,13 +23,13 @@ import os
 import io
 import zipfile
 import json
-from typing import List
+from typing import List, Tuple
 import jsonpickle
 import pandas
 from mbatch.index.index_original_data import object_decoder_from_convert, OriginalData
 from mbatch.pipeline.std_data import StandardizedData
 from mbatch.gdcapi.standardized_data import write_converted_dataframe
-from mbatch.test.common import delete_directory_contents, copy_archive_file_to_regular, get_current_timestamp
+from mbatch.test.common import delete_directory_contents, get_current_timestamp, stage_archive_files
 
 
 def copy_json_original_files(the_zip_file: str, the_source: str, the_version: str, the_out_dir: str) -> None:
@@ -278,25 +278,26 @@ def create_job(the_std_data: StandardizedData, the_bei_url: str, the_bei_dir: st
         # aliquot_barcode example
         the_std_data.make_fake_batch_info(the_input_dir, os.path.join(original_dir, "batches.tsv"), the_sample_column_name)
         batch_types = ['example']
-    copy_archive_file_to_regular(os.path.join(the_input_dir, the_std_data.std_archive), f"versions/DATA_{the_std_data.version}/matrix.tsv", os.path.join(original_dir, "matrix_data.tsv"))
-    copy_archive_file_to_regular(os.path.join(the_input_dir, the_std_data.std_archive), f"versions/DATA_{the_std_data.version}/clinical.tsv", os.path.join(original_dir, "clinical.tsv"))
-    copy_archive_file_to_regular(os.path.join(the_input_dir, the_std_data.std_archive), f"versions/DATA_{the_std_data.version}/mutations.tsv", os.path.join(original_dir, "mutations.tsv"))
-    # below two files only exist for Metabolomics Workbench Data
-    copy_archive_file_to_regular(os.path.join(the_input_dir, the_std_data.std_archive), f"versions/DATA_{the_std_data.version}/ngchm_link_map.tsv", os.path.join(original_dir, "ngchm_link_map.tsv"))
-    copy_archive_file_to_regular(os.path.join(the_input_dir, the_std_data.std_archive), f"versions/DATA_{the_std_data.version}/row_col_types.tsv", os.path.join(original_dir, "row_col_types.tsv"))
-    # copy historical static version of files to Data/original directory
-    # only copies if they exist
+    # copy changeable files and historical static version of files to Data/original directory
+    # only copies if they exist, opening the archive once and decompressing each file once
+    version_dir: str = f"versions/DATA_{the_std_data.version}"
+    copies: List[Tuple[str, List[str]]] = [
+        (f"{version_dir}/matrix.tsv", [os.path.join(original_dir, "matrix_data.tsv"), os.path.join(original_dir, "original_matrix_data.tsv")]),
+        (f"{version_dir}/clinical.tsv", [os.path.join(original_dir, "clinical.tsv"), os.path.join(original_dir, "original_clinical.tsv")]),
+        (f"{version_dir}/mutations.tsv", [os.path.join(original_dir, "mutations.tsv"), os.path.join(original_dir, "original_mutations.tsv")]),
+        # below two files only exist for Metabolomics Workbench Data
+        (f"{version_dir}/ngchm_link_map.tsv", [os.path.join(original_dir, "ngchm_link_map.tsv"), os.path.join(original_dir, "original_ngchm_link_map.tsv")]),
+        (f"{version_dir}/row_col_types.tsv", [os.path.join(original_dir, "row_col_types.tsv"), os.path.join(original_dir, "original_row_col_types.tsv")])
+    ]
     if the_has_batch_info_flag:
-        copy_archive_file_to_regular(os.path.join(the_input_dir, the_std_data.std_archive), f"versions/DATA_{the_std_data.version}/batches.tsv", os.path.join(original_dir, "original_batches.tsv"))
+        copies.append((f"{version_dir}/batches.tsv", [os.path.join(original_dir, "original_batches.tsv")]))
     else:
         # create fake batch info
         the_std_data.make_fake_batch_info(the_input_dir, os.path.join(original_dir, "original_batches.tsv"), the_sample_column_name)
-    copy_archive_file_to_regular(os.path.join(the_input_dir, the_std_data.std_archive), f"versions/DATA_{the_std_data.version}/matrix.tsv", os.path.join(original_dir, "original_matrix_data.tsv"))
-    copy_archive_file_to_regular(os.path.join(the_input_dir, the_std_data.std_archive), f"versions/DATA_{the_std_data.version}/clinical.tsv", os.path.join(original_dir, "original_clinical.tsv"))
-    copy_archive_file_to_regular(os.path.join(the_input_dir, the_std_data.std_archive), f"versions/DATA_{the_std_data.version}/mutations.tsv", os.path.join(original_dir, "original_mutations.tsv"))
-    # below two files only exist for Metabolomics Workbench Data
-    copy_archive_file_to_regular(os.path.join(the_input_dir, the_std_data.std_archive), f"versions/DATA_{the_std_data.version}/ngchm_link_map.tsv", os.path.join(original_dir, "original_ngchm_link_map.tsv"))
-    copy_archive_file_to_regular(os.path.join(the_input_dir, the_std_data.std_archive), f"versions/DATA_{the_std_data.version}/row_col_types.tsv", os.path.join(original_dir, "original_row_col_types.tsv"))
+    staged_bytes: int
+    staged_seconds: float
+    staged_bytes, staged_seconds = stage_archive_files(os.path.join(the_input_dir, the_std_data.std_archive), copies)
+    print(f'create_job staged {staged_bytes} bytes in {staged_seconds:.3f} seconds for {job_id}', flush=True)
     # setup config files
     # default template lives in BatchEffects_clean/BatchEffectsPackage/data/testing_static/PyMBatch/mbatch
     # but is in util directory during pipeline run
@@ -0,0 +1,149 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Copyright (c) 2011-2024 University of Texas MD Anderson Cancer Center
+
+This program is free software: you can redistribute it and/or modify it under the terms of the
+GNU General Public License as published by the Free Software Foundation, either version 2 of
+the License, or (at your option) any later version.
+
+This program is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY;
+without even the implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+See the GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License along with this program.
+If not, see <https://www.gnu.org/licenses/>.
+
+MD Anderson Cancer Center Bioinformatics on GitHub <https://github.com/MD-Anderson-Bioinformatics>
+MD Anderson Cancer Center Bioinformatics at MDA <https://www.mdanderson.org/research/departments-labs-institutes/departments-divisions/bioinformatics-and-computational-biology.html>
+@author: Tod Casasent
+"""
+
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Union
+import requests
+from requests.adapters import HTTPAdapter
+from mbatch.pipeline.std_data import StandardizedData, get_job_status
+
+
+# default number of concurrent BEI status requests
+DEFAULT_STATUS_WORKERS: int = 8
+
+
+# pylint: disable=too-few-public-methods
+class RateLimiter:
+    """
+    Thread-safe limiter spacing requests evenly at a maximum rate.
+    A rate of zero or less does not limit requests.
+    """
+    # do not set method variables, as they should be initialized in the init function
+    m_interval: float
+    m_next: float
+    m_lock: threading.Lock
+
+    def __init__(self: 'RateLimiter', the_requests_per_second: float) -> None:
+        """
+        init and empty/nan values.
+        :param the_requests_per_second: maximum requests per second, zero or less for no limit
+        """
+        super().__init__()
+        self.m_interval = 0.0
+        if the_requests_per_second > 0.0:
+            self.m_interval = 1.0 / the_requests_per_second
+        self.m_next = 0.0
+        self.m_lock = threading.Lock()
+
+    def wait(self: 'RateLimiter') -> None:
+        """
+        Block until the next request is allowed.
+        Slots are reserved under the lock, sleeping happens outside it.
+        :return: nothing
+        """
+        if self.m_interval > 0.0:
+            delay: float
+            with self.m_lock:
+                now: float = time.monotonic()
+                start: float = max(now, self.m_next)
+                self.m_next = start + self.m_interval
+                delay = start - now
+            if delay > 0.0:
+                time.sleep(delay)
+
+
+def make_status_session(the_workers: int) -> requests.Session:
+    """
+    Build a requests Session whose connection pool holds one keep-alive connection per worker.
+    :param the_workers: number of worker threads sharing the session
+    :return: new requests Session
+    """
+    session: requests.Session = requests.Session()
+    adapter: HTTPAdapter = HTTPAdapter(pool_connections=1, pool_maxsize=max(1, the_workers))
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+
+def get_pollable_job_ids(the_std_list: List[StandardizedData]) -> List[str]:
+    """
+    Get the job ids, in list order and without duplicates, whose status can still change.
+    :param the_std_list: list of StandardizedData from the pipeline index
+    :return: list of job ids to poll
+    """
+    job_ids: List[str] = []
+    seen: set = set()
+    my_std: StandardizedData
+    for my_std in the_std_list:
+        if my_std.job_id in ('', 'no-processing'):
+            continue
+        if my_std.job_status in ('succeeded', 'failed'):
+            continue
+        if my_std.job_id not in seen:
+            seen.add(my_std.job_id)
+            job_ids.append(my_std.job_id)
+    return job_ids
+
+
+# pylint: disable=too-many-arguments
+def poll_job_status(the_std_list: List[StandardizedData], the_url: str,
+                    the_workers: int = DEFAULT_STATUS_WORKERS, the_requests_per_second: float = 0.0,
+                    the_timeout: int = 60, the_session: Optional[requests.Session] = None
+                    ) -> Dict[str, Union[str, Exception]]:
+    """
+    Request the BEI status of every unfinished job concurrently.
+    Statuses are only collected here, not applied, so the caller applies
+    them with StandardizedData.status_job in index order, exactly as the serial loop did.
+    A failed request is stored as its exception and raised when that entry is reached.
+    :param the_std_list: list of StandardizedData from the pipeline index
+    :param the_url: BEI URL for make job requests
+    :param the_workers: maximum number of concurrent requests
+    :param the_requests_per_second: maximum request rate, zero or less for no limit
+    :param the_timeout: timeout in seconds for each request
+    :param the_session: optional requests Session to use, otherwise one is created and closed here
+    :return: dictionary of job id to BEI status string or exception
+    """
+    job_ids: List[str] = get_pollable_job_ids(the_std_list)
+    statuses: Dict[str, Union[str, Exception]] = {}
+    if len(job_ids) > 0:
+        workers: int = max(1, min(the_workers, len(job_ids)))
+        limiter: RateLimiter = RateLimiter(the_requests_per_second)
+        session: requests.Session = the_session if the_session is not None else make_status_session(workers)
+
+        def poll_one(the_job_id: str) -> Union[str, Exception]:
+            limiter.wait()
+            try:
+                return get_job_status(the_url, the_job_id, session, the_timeout)
+            # pylint: disable=broad-exception-caught
+            except Exception as my_except:
+                return my_except
+
+        try:
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                results: List[Union[str, Exception]] = list(executor.map(poll_one, job_ids))
+        finally:
+            if the_session is None:
+                session.close()
+        statuses = dict(zip(job_ids, results))
+    print(f"poll_job_status polled {len(statuses)} jobs", flush=True)
+    return statuses
@@ -22,10 +22,13 @@ MD Anderson Cancer Center Bioinformatics at MDA <https://www.mdanderson.org/rese
 import glob
 import os
 import shutil
-from typing import List
+from typing import Dict, List, Union
 from mbatch.pipeline.std_data import StandardizedData, build_std_pipeline_index, build_update_pipeline_index
-from mbatch.pipeline.std_data import write_std_pipeline_index, read_std_pipeline_index
+from mbatch.pipeline.std_data import read_std_pipeline_index
+from mbatch.pipeline.std_data import get_archive_manifest_file, read_archive_manifest, write_archive_manifest
 from mbatch.pipeline.job import create_job, queue_job
+from mbatch.pipeline.job_status import DEFAULT_STATUS_WORKERS, poll_job_status
+from mbatch.pipeline.index_store import PipelineIndexStore, recover_std_pipeline_index
 from mbatch.test.common import add_error, delete_from_dirs, delete_directory_contents, extract_zip_to_dir
 from mbatch.test.test_index import create_index_archive
 from mbatch.visualindex.visual_index_base import VisualIndexBase, VisualIndexElementBase
@@ -37,7 +40,8 @@ from mbatch.visualindex.visual_index_kwd import VisualIndexKwd
 
 def execute_pipeline(the_input_dir: str, the_output_dir: str, the_index_file: str, the_util_dir: str,
                      the_bei_url: str, the_bei_dir: str, the_run_version: str, the_run_source: str,
-                     the_base_dir: str, the_sample_column_name: str, the_update_only_flag: bool) -> None:
+                     the_base_dir: str, the_sample_column_name: str, the_update_only_flag: bool,
+                     the_status_workers: int = DEFAULT_STATUS_WORKERS, the_status_rate: float = 0.0) -> None:
     """
     Execute the pipeline, running MBatch on any unprocessed datasets
     :param the_input_dir: full directory path containing standardized data ZIP files (uses Standardized Data std_archive path)
@@ -51,6 +55,8 @@ def execute_pipeline(the_input_dir: str, the_output_dir: str, the_index_file: st
     :param the_base_dir: string detailing Docker internal path like /DAPI_MQA/DATA
     :param the_sample_column_name: column string for samples in batch (different for GDC vs MWB)
     :param the_update_only_flag: if True, only run the custom update only option of the pipeline, to add new analysis to existing datasets
+    :param the_status_workers: number of concurrent BEI job status requests
+    :param the_status_rate: maximum BEI job status requests per second, zero for no limit
     :return: nothing
     """
     # read index files
@@ -64,6 +70,7 @@ def execute_pipeline(the_input_dir: str, the_output_dir: str, the_index_file: st
     vik: VisualIndexKwd = VisualIndexKwd(kwd_index_file, the_base_dir)
     vik.populate_index()
     # process pipeline
+    recover_std_pipeline_index(the_index_file)
     std_list: List[StandardizedData]
     if the_update_only_flag:
         if os.path.exists(the_index_file):
@@ -72,15 +79,23 @@ def execute_pipeline(the_input_dir: str, the_output_dir: str, the_index_file: st
             std_list = build_update_pipeline_index(the_input_dir, the_index_file, True)
     else:
         std_list = build_std_pipeline_index(the_input_dir, the_index_file, True)
+    # job changes are saved per entry to the index store, and the TSV exported at the end
+    store: PipelineIndexStore = PipelineIndexStore(the_index_file)
+    store.replace_entries(std_list)
+    # matrix probe results are cached in the archive manifest
+    manifest_file: str = get_archive_manifest_file(the_index_file)
+    manifest: Dict[str, dict] = read_archive_manifest(manifest_file)
     my_std: StandardizedData
     # TODO: TMP
     # done_one: bool = False
+    # poll BEI for unfinished jobs concurrently, statuses are applied in index order below
+    job_statuses: Dict[str, Union[str, Exception]] = poll_job_status(std_list, the_bei_url, the_status_workers, the_status_rate)
     print('Pipeline Start Loop', flush=True)
     for my_std in std_list:
         # if not done_one:
         print(f'Standardized Data {my_std.std_archive}', flush=True)
         if my_std.job_id == '':
-            if my_std.has_valid_data_p(the_input_dir):
+            if my_std.has_valid_data_p(the_input_dir, manifest):
                 # Handle Start New Job
                 # done_one = True
                 print(f'Start New Job {my_std.version} {my_std.std_archive}', flush=True)
@@ -93,16 +108,15 @@ def execute_pipeline(the_input_dir: str, the_output_dir: str, the_index_file: st
                 print(f'No-Data for Job {my_std.version} {my_std.std_archive}', flush=True)
                 my_std.job_id = "no-processing"
                 my_std.job_status = "no-processing"
-            # write index file update
-            print(f"write updated index {the_index_file}", flush=True)
-            write_std_pipeline_index(the_index_file, std_list)
+            # save index entry update
+            store.save_entry(my_std)
         else:
             if my_std.job_id == 'no-processing':
                 print(f'No-Processing for {my_std.version} {my_std.std_archive}', flush=True)
             else:
                 # status_job -> created, queued, running, succeeded, failed, no-processing
                 # call returns and *updates* instance status
-                changed: bool = my_std.status_job(the_bei_url)
+                changed: bool = my_std.status_job(the_bei_url, job_statuses)
                 job_status: str = my_std.job_status
                 if changed & ('succeeded' == job_status):
                     # Handle succeeded Job
@@ -141,15 +155,15 @@ def execute_pipeline(the_input_dir: str, the_output_dir: str, the_index_file: st
                     # Handle queued Job
                     print(f'Queued {my_std.version} {my_std.std_archive}', flush=True)
                 if changed:
-                    # write index file update
-                    print(f"write updated index {the_index_file}", flush=True)
-                    write_std_pipeline_index(the_index_file, std_list)
+                    # save index entry update
+                    store.save_entry(my_std)
         if my_std.job_status == 'created':
             # make HTTP call to run job and change job_status to running
             queue_job(my_std, the_bei_url)
-            # write index file update
-            print(f"write updated index {the_index_file}", flush=True)
-            write_std_pipeline_index(the_index_file, std_list)
+            # save index entry update
+            store.save_entry(my_std)
+    store.finish()
+    write_archive_manifest(manifest_file, manifest)
     print('Pipeline After Loop', flush=True)
     # corrections done elsewhere, separately
 
@@ -185,11 +199,14 @@ def check_pipeline(the_input_dir: str, the_output_dir: str, the_index_file: str,
     vik.populate_index()
     # process pipeline
     std_list: List[StandardizedData] = build_std_pipeline_index(the_input_dir, the_index_file, False)
+    # use matrix probe results cached in the archive manifest, but do not write it, this is only a check
+    manifest_file: str = get_archive_manifest_file(the_index_file)
+    manifest: Dict[str, dict] = read_archive_manifest(manifest_file)
     my_std: StandardizedData
     print('*************************************************', flush=True)
     for my_std in std_list:
         if my_std.job_id == '':
-            if my_std.has_valid_data_p(the_input_dir):
+            if my_std.has_valid_data_p(the_input_dir, manifest):
                 # Handle Start New Job
                 print(f'Start New Job {my_std.version} {my_std.std_archive}', flush=True)
             else:
@@ -25,18 +25,85 @@ import csv
 import zipfile
 import hashlib
 import json
-from typing import Optional, Dict, List
+from typing import IO, Optional, Dict, List, Set, Tuple, Union
 import pandas
 import requests
 from mbatch.test.common import write_tsv_list, read_headers
 
 
+# bump if the archive manifest layout changes
+ARCHIVE_MANIFEST_VERSION: int = 1
+
+
 # must be same name as attributes for StandardizedData class
 STD_HEADERS: List[str] = [
     'std_archive', 'version', 'data_archive', 'result_archive', 'job_id', 'job_status'
 ]
 
 
+class JobStatusError(Exception):
+    """
+    BEI JOBstatus request did not return a status (HTTP error response)
+    """
+
+
+def get_job_status(the_url: str, the_job_id: str, the_session: Optional[requests.Session] = None,
+                   the_timeout: int = 60) -> str:
+    """
+    Request the status of a BEI job.
+    :param the_url: BEI URL for make job requests
+    :param the_job_id: BEI job id
+    :param the_session: optional requests Session, to reuse keep-alive connections
+    :param the_timeout: timeout in seconds for the request
+    :return: BEI status string, such as MBATCHRUN_RUNNING_WAIT or MBATCHRUN_END_SUCCESS
+    :raises JobStatusError: if BEI response is not ok
+    """
+    my_url: str = the_url + "JOBstatus?jobId=" + the_job_id
+    response: requests.Response
+    if the_session is None:
+        response = requests.get(my_url, timeout=the_timeout, allow_redirects=True)
+    else:
+        response = the_session.get(my_url, timeout=the_timeout, allow_redirects=True)
+    print(f"status_job response={response} for job_id={the_job_id}", flush=True)
+    # check response code
+    if not response.ok:
+        raise JobStatusError(f"status_job error {response.status_code} for job_id={the_job_id}")
+    # returned JSON. Turn into dict and look at "status"
+    my_status_dict: dict = json.loads(response.text)
+    return my_status_dict['status']
+
+
+def probe_matrix_stream(the_stream: IO[bytes]) -> Dict[str, Optional[int]]:
+    """
+    Check a matrix.tsv stream has more than one sample and more than one feature,
+    reading only the header line and the first two data lines.
+    Counts rows and columns the same way as reading the file with pandas (blank lines are skipped).
+    :param the_stream: binary stream of matrix.tsv
+    :return: dictionary with valid (True if larger than one in both directions), samples (header columns
+    after the feature column) and features (number of data rows, None if not read to the end of file)
+    """
+    probe: Dict[str, Optional[int]] = {'valid': False, 'samples': None, 'features': None}
+    # like pandas, blank lines before the header are skipped
+    line: bytes = the_stream.readline()
+    while (b'' != line) and (b'' == line.rstrip(b'\r\n')):
+        line = the_stream.readline()
+    header: str = line.decode('utf-8').rstrip('\r\n')
+    if '' != header:
+        col: int = len(header.split('\t'))
+        probe['samples'] = col - 1
+        row: int = 0
+        line = the_stream.readline()
+        while (b'' != line) and (row < 2):
+            if b'' != line.rstrip(b'\r\n'):
+                row += 1
+            if row < 2:
+                line = the_stream.readline()
+        if row < 2:
+            probe['features'] = row
+        probe['valid'] = (col > 1) and (row > 1)
+    return probe
+
+
 # pylint: disable=too-many-instance-attributes,too-few-public-methods,too-many-arguments
 class StandardizedData:
     """
@@ -55,6 +122,7 @@ class StandardizedData:
             running - job is currently running
             succeeded - job completed successfully
             failed - job completed unsuccessfully
+    self.index_row: Optional[int] is the row id in the pipeline index store, None if not stored yet
     """
     # declare but do not set member attributes
     std_archive: str
@@ -63,6 +131,7 @@ class StandardizedData:
     result_archive: str
     job_id: str
     job_status: str
+    index_row: Optional[int]
 
     @classmethod
     def from_dict(cls, the_dict: Optional[Dict[str, str]]) -> 'StandardizedData':
@@ -96,6 +165,8 @@ class StandardizedData:
         self.job_id: str = the_job_id
         # created, queued, running, succeeded, failed
         self.job_status: str = the_job_status
+        # set by PipelineIndexStore, not written to TSV
+        self.index_row: Optional[int] = None
     # pylint: enable=too-many-arguments
 
     # pylint: disable=too-many-branches
@@ -204,32 +275,46 @@ class StandardizedData:
             data_list.append(getattr(self, attr))
         write_tsv_list(the_out_file, data_list, True, False)
 
-    def has_valid_data_p(self: 'StandardizedData', the_base_zip_dir: str) -> bool:
+    def has_valid_data_p(self: 'StandardizedData', the_base_zip_dir: str,
+                         the_manifest: Optional[Dict[str, dict]] = None) -> bool:
         """
         Check inside the ZIP archive at the_base_zip_dir/std_archive if version has a matrix.tsv file
         Check there is more than one Sample
         Check there is more than one feature
         :param the_base_zip_dir: base directory for paths to ZIP files
+        :param the_manifest: optional archive manifest from read_archive_manifest, to reuse and record probe results
         :return: True if there is a matrix file and it is larger than one in both directions
         """
-        is_good_data_p: bool = False
+        return self.probe_valid_data(the_base_zip_dir, the_manifest)['valid']
+
+    def probe_valid_data(self: 'StandardizedData', the_base_zip_dir: str,
+                         the_manifest: Optional[Dict[str, dict]] = None) -> Dict[str, Optional[int]]:
+        """
+        Probe matrix.tsv for this dataset version, see probe_matrix_stream.
+        With the_manifest, results are cached under the archive entry, which is
+        replaced (dropping cached probes) when the archive size or modification time changes.
+        :param the_base_zip_dir: base directory for paths to ZIP files
+        :param the_manifest: optional archive manifest from read_archive_manifest, updated in place
+        :return: dictionary with valid, samples and features, see probe_matrix_stream
+        """
         std_archive_full: str = os.path.join(the_base_zip_dir, self.std_archive)
+        probes: Optional[dict] = None
+        if the_manifest is not None:
+            get_archive_versions_cached(std_archive_full, self.std_archive, the_manifest)
+            probes = the_manifest[self.std_archive].setdefault('probes', {})
+            if self.version in probes:
+                return probes[self.version]
+        probe: Dict[str, Optional[int]] = {'valid': False, 'samples': None, 'features': None}
         # use manual / as it is ZIP file, not OS file
         my_filename: str = f"versions/DATA_{self.version}/matrix.tsv"
         zip_file: zipfile.ZipFile
-        read_zip_file: io.TextIOWrapper
         with zipfile.ZipFile(std_archive_full, 'r') as zip_file:
             if my_filename in zip_file.namelist():
                 with zip_file.open(my_filename, mode="r") as read_zip_file:
-                    # set no index column with index_col=False so my_batches['foo'] returns a column of data
-                    my_matrix: pandas.DataFrame = pandas.read_csv(read_zip_file, sep='\t', quoting=csv.QUOTE_NONE,
-                                                                  encoding='utf-8', index_col=False, dtype=str)
-                    col: int = my_matrix.shape[1]
-                    if col > 1:
-                        row: int = my_matrix.shape[0]
-                        if row > 1:
-                            is_good_data_p = True
-        return is_good_data_p
+                    probe = probe_matrix_stream(read_zip_file)
+        if probes is not None:
+            probes[self.version] = probe
+        return probe
 
     def has_batch_info_p(self: 'StandardizedData', the_base_zip_dir: str) -> bool:
         """
@@ -302,42 +387,53 @@ class StandardizedData:
         else:
             raise BaseException(f"queue_job error {response.status_code}")
 
-    def status_job(self: 'StandardizedData', the_url: str) -> bool:
+    def status_job(self: 'StandardizedData', the_url: str,
+                   the_statuses: Optional[Dict[str, Union[str, Exception]]] = None) -> bool:
         """
         Get the current status of the job for this dataset.
         Set status in instance, return True if status changed.
         :param the_url: BEI URL for make job requests
+        :param the_statuses: optional BEI status strings (or errors) already polled by job id,
+        usually from poll_job_status; job ids not in the dictionary are requested from BEI
         :return: Set status in instance, return True if status changed.
         """
         changed: bool = False
         if ('succeeded' != self.job_status) & ('failed' != self.job_status):
-            response: requests = requests.get(the_url + "JOBstatus?jobId=" + self.job_id, timeout=60, allow_redirects=True)
-            print(f"status_job response={response} for job_id={self.job_id}", flush=True)
-            # check response code
-            if response.ok:
-                # returned JSON. Turn into dict and look at "status"
-                my_status_str: str = response.text
-                my_status_dict: dict = json.loads(my_status_str)
-                my_status: str = my_status_dict['status']
-                # status_job -> created, running, succeeded, failed
-                if 'MBATCHRUN_RUNNING_WAIT' == my_status:
-                    if 'running' != self.job_status:
-                        self.job_status = 'running'
-                        changed = True
-                elif 'MBATCHRUN_END_SUCCESS' == my_status:
-                    if 'succeeded' != self.job_status:
-                        self.job_status = 'succeeded'
-                        changed = True
-                elif 'MBATCHRUN_END_COMPLETED' == my_status:
-                    if 'succeeded' != self.job_status:
-                        self.job_status = 'succeeded'
-                        changed = True
-                elif 'MBATCHRUN_END_FAILURE' == my_status:
-                    if 'failed' != self.job_status:
-                        self.job_status = 'failed'
-                        changed = True
+            my_status: Union[str, Exception]
+            if (the_statuses is not None) and (self.job_id in the_statuses):
+                my_status = the_statuses[self.job_id]
+                if isinstance(my_status, Exception):
+                    raise my_status
             else:
-                raise BaseException(f"status_job error {response.status_code} for job_id={self.job_id}")
+                my_status = get_job_status(the_url, self.job_id)
+            changed = self.update_status(my_status)
+        return changed
+
+    def update_status(self: 'StandardizedData', the_bei_status: str) -> bool:
+        """
+        Apply a BEI status string to this dataset.
+        Set status in instance, return True if status changed.
+        :param the_bei_status: status string returned by BEI JOBstatus
+        :return: Set status in instance, return True if status changed.
+        """
+        changed: bool = False
+        # status_job -> created, running, succeeded, failed
+        if 'MBATCHRUN_RUNNING_WAIT' == the_bei_status:
+            if 'running' != self.job_status:
+                self.job_status = 'running'
+                changed = True
+        elif 'MBATCHRUN_END_SUCCESS' == the_bei_status:
+            if 'succeeded' != self.job_status:
+                self.job_status = 'succeeded'
+                changed = True
+        elif 'MBATCHRUN_END_COMPLETED' == the_bei_status:
+            if 'succeeded' != self.job_status:
+                self.job_status = 'succeeded'
+                changed = True
+        elif 'MBATCHRUN_END_FAILURE' == the_bei_status:
+            if 'failed' != self.job_status:
+                self.job_status = 'failed'
+                changed = True
         return changed
 
     def make_fake_batch_info(self: 'StandardizedData', the_base_zip_dir: str, the_batch_file: str,
@@ -410,18 +506,23 @@ class StandardizedData:
 def write_std_pipeline_index(the_index_file: str, the_entries: List[StandardizedData]) -> None:
     """
     Write pipeline index file.
+    Written to a temporary file and then renamed, so a crash does not leave a truncated index.
     :param the_index_file: Full path to index file, including filename.
     :param the_entries: List of StandardizedData objects
     :return: Nothing
     """
     print(f"write_std_pipeline_index the_index_file={the_index_file}", flush=True)
     the_entries.sort(key=lambda my_std_data: (my_std_data.std_archive, my_std_data.version, my_std_data.job_id), reverse=False)
+    tmp_file: str = f"{the_index_file}.tmp"
     out_file: io.TextIOWrapper
-    with open(the_index_file, 'w', encoding='utf-8') as out_file:
+    with open(tmp_file, 'w', encoding='utf-8') as out_file:
         write_tsv_list(out_file, STD_HEADERS, True, False)
         my_entry: StandardizedData
         for my_entry in the_entries:
             my_entry.write_index_row(out_file)
+        out_file.flush()
+        os.fsync(out_file.fileno())
+    os.replace(tmp_file, the_index_file)
 
 
 # ########################################################
@@ -477,6 +578,69 @@ def get_archive_versions(the_archive_path: str) -> List[str]:
     return version_list
 
 
+def get_archive_manifest_file(the_index_file: str) -> str:
+    """
+    Get the archive manifest file kept next to a pipeline index file
+    :param the_index_file: full path including file name to pipeline index file
+    :return: full path to archive manifest JSON file
+    """
+    return f"{the_index_file}.manifest.json"
+
+
+def read_archive_manifest(the_manifest_file: str) -> Dict[str, dict]:
+    """
+    Read archive manifest, which remembers the version list of each standardized data archive
+    by archive sub-path, with the archive size and modification time it was read from.
+    A missing, unreadable or old format manifest gives an empty manifest.
+    :param the_manifest_file: full path to archive manifest JSON file
+    :return: dictionary of std_archive to dictionary with size, mtime_ns and versions
+    """
+    manifest: Dict[str, dict] = {}
+    if os.path.exists(the_manifest_file):
+        try:
+            in_file: io.TextIOWrapper
+            with open(the_manifest_file, 'r', encoding='utf-8') as in_file:
+                my_json: dict = json.load(in_file)
+            if ARCHIVE_MANIFEST_VERSION == my_json.get('manifest_version'):
+                manifest = my_json['archives']
+        except (OSError, ValueError, KeyError) as my_except:
+            print(f"read_archive_manifest ignoring {the_manifest_file} {my_except}", flush=True)
+    return manifest
+
+
+def write_archive_manifest(the_manifest_file: str, the_manifest: Dict[str, dict]) -> None:
+    """
+    Write archive manifest, to a temporary file that is then renamed.
+    :param the_manifest_file: full path to archive manifest JSON file
+    :param the_manifest: dictionary of std_archive to dictionary with size, mtime_ns and versions
+    :return: nothing
+    """
+    tmp_file: str = f"{the_manifest_file}.tmp"
+    out_file: io.TextIOWrapper
+    with open(tmp_file, 'w', encoding='utf-8') as out_file:
+        json.dump({'manifest_version': ARCHIVE_MANIFEST_VERSION, 'archives': the_manifest}, out_file, sort_keys=True)
+    os.replace(tmp_file, the_manifest_file)
+
+
+def get_archive_versions_cached(the_archive_path: str, the_std_archive: str, the_manifest: Dict[str, dict]) -> Tuple[List[str], bool]:
+    """
+    Get list of versions available for dataset, opening the ZIP only if it is new
+    or its size or modification time differ from the manifest entry.
+    :param the_archive_path: Full path, including filename to ZIP file archive.
+    :param the_std_archive: archive sub-path used as manifest key
+    :param the_manifest: archive manifest, updated in place for new or changed archives
+    :return: tuple of list of version timestamps for dataset, and True if the manifest was updated
+    """
+    stat: os.stat_result = os.stat(the_archive_path)
+    entry: Optional[dict] = the_manifest.get(the_std_archive)
+    if (entry is not None) and (stat.st_size == entry['size']) and (stat.st_mtime_ns == entry['mtime_ns']):
+        return entry['versions'], False
+    print(f"get_archive_versions_cached read {the_archive_path}", flush=True)
+    version_list: List[str] = get_archive_versions(the_archive_path)
+    the_manifest[the_std_archive] = {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns, 'versions': version_list}
+    return version_list, True
+
+
 # ########################################################
 # building index dictionary
 # ########################################################
@@ -523,9 +687,11 @@ def std_list_contains(the_std_list: List[StandardizedData], the_std_archive: str
 def build_std_pipeline_index(the_input_dir: str, the_index_file: str, the_write_flag: bool) -> List[StandardizedData]:
     """
     Build and save pipeline index file from current file and available datasets.
+    The archive manifest (see get_archive_manifest_file) is read to skip unchanged ZIP files,
+    and is only written with the index.
     :param the_input_dir: full directory path containing standardized data ZIP files (uses Standardized Data std_archive path)
     :param the_index_file: full path including file name to index file for MBatch index file
-    :param the_write_flag: if True, skip writing index. Used for checking new status of pipeline
+    :param the_write_flag: if False, skip writing index and manifest. Used for checking new status of pipeline
     :return: Dictionary with keys being tuples of std_archive and version, and values being StandardizedData
     """
     std_list: List[StandardizedData] = []
@@ -533,6 +699,13 @@ def build_std_pipeline_index(the_input_dir: str, the_index_file: str, the_write_
     if os.path.exists(the_index_file):
         print(f"read index {the_index_file}", flush=True)
         std_list = read_std_pipeline_index(the_index_file)
+    # (std_archive, version) pairs already in index, instead of searching std_list for each version
+    known: Set[Tuple[str, str]] = {(my_std.std_archive, my_std.version) for my_std in std_list}
+    # version lists of archives seen before, only new or changed ZIP files are opened
+    manifest_file: str = get_archive_manifest_file(the_index_file)
+    manifest: Dict[str, dict] = read_archive_manifest(manifest_file)
+    manifest_changed: bool = False
+    seen_archives: Set[str] = set()
     # check for unprocessed standardized data archives, add to std_list, write to pipeline index
     found: bool = False
     dir_path: str
@@ -547,18 +720,30 @@ def build_std_pipeline_index(the_input_dir: str, the_index_file: str, the_write_
                 std_archive: str = std_archive_full.replace(the_input_dir, '')
                 if std_archive.startswith(os.sep):
                     std_archive = std_archive[1:]
-                version_list: List[str] = get_archive_versions(std_archive_full)
+                seen_archives.add(std_archive)
+                version_list: List[str]
+                updated: bool
+                version_list, updated = get_archive_versions_cached(std_archive_full, std_archive, manifest)
+                manifest_changed = manifest_changed or updated
                 if version_list is not None:
                     my_version: str
                     for my_version in version_list:
                         print(f"Check version {my_version} and path {dir_path}", flush=True)
-                        if not std_list_contains(std_list, std_archive, my_version):
+                        if (std_archive, my_version) not in known:
                             found = True
+                            known.add((std_archive, my_version))
                             # the_std_archive, the_version, the_data_archive, the_result_archive
                             print(f"New archive {my_version} and path {dir_path}", flush=True)
                             std_list.append(StandardizedData(std_archive, my_version, '', '', '', ''))
     # pylint: enable=too-many-nested-blocks
+    # drop archives no longer present, then save manifest if anything changed
+    removed: List[str] = [my_archive for my_archive in manifest if my_archive not in seen_archives]
+    my_archive: str
+    for my_archive in removed:
+        del manifest[my_archive]
     if the_write_flag:
+        if manifest_changed or (len(removed) > 0):
+            write_archive_manifest(manifest_file, manifest)
         if found:
             print(f"write index {the_index_file}", flush=True)
             write_std_pipeline_index(the_index_file, std_list)
@@ -577,9 +762,11 @@ def build_update_pipeline_index(the_input_dir: str, the_index_file: str, the_wri
     print(f"read regular_index {regular_index}", flush=True)
     regular_list: List[StandardizedData] = read_std_pipeline_index(regular_index)
     # loop through existing datasets
+    known: Set[Tuple[str, str]] = set()
     std_data: StandardizedData
     for std_data in regular_list:
-        if not std_list_contains(std_list, std_data.std_archive, std_data.version):
+        if (std_data.std_archive, std_data.version) not in known:
+            known.add((std_data.std_archive, std_data.version))
             new_std: StandardizedData = StandardizedData(std_data.std_archive, std_data.version,
                                                          std_data.data_archive, std_data.result_archive,
                                                          "", "")
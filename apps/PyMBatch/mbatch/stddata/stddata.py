@@ -22,10 +22,55 @@ MD Anderson Cancer Center Bioinformatics at MDA <https://www.mdanderson.org/rese
 
 import csv
 import typing
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import zipfile
+import io
 import pandas
 import numpy
 
 
+# change when sidecar files change, so old sidecars are not used
+STDDATA_SIDECAR_VERSION: int = 1
+# bytes from start and end of source file used in sidecar hash
+STDDATA_SIDECAR_HASH_BLOCK: int = 2**20
+
+
+def get_sidecar_dir(the_file: str) -> str:
+    """
+    Directory for binary sidecar of a matrix file (see StdData.write_matrix_sidecar)
+    :param the_file: full path to matrix file
+    :return: full path to sidecar directory
+    """
+    return f"{the_file}.sidecar"
+
+
+def get_source_signature(the_file: str) -> typing.Dict[str, typing.Any]:
+    """
+    Values used to check a sidecar still matches its source file:
+    size, modification time, and a hash of the first and last blocks of the file.
+    The hash does not read the whole file, so checking a sidecar stays fast for large matrices.
+    :param the_file: full path to matrix file
+    :return: dictionary with version, size, mtime_ns, and hash
+    """
+    stat: os.stat_result = os.stat(the_file)
+    hasher: 'hashlib._Hash' = hashlib.blake2b(digest_size=32)
+    with open(the_file, 'rb') as in_file:
+        hasher.update(in_file.read(STDDATA_SIDECAR_HASH_BLOCK))
+        if stat.st_size > STDDATA_SIDECAR_HASH_BLOCK:
+            in_file.seek(max(STDDATA_SIDECAR_HASH_BLOCK, stat.st_size - STDDATA_SIDECAR_HASH_BLOCK))
+            hasher.update(in_file.read(STDDATA_SIDECAR_HASH_BLOCK))
+    return {
+        'version': STDDATA_SIDECAR_VERSION,
+        'size': stat.st_size,
+        'mtime_ns': stat.st_mtime_ns,
+        'hash': hasher.hexdigest()
+    }
+
+
 class StdData:
     """
     Class to hold StdData with row and column names.
@@ -34,7 +79,9 @@ class StdData:
     self.m_matrix: numpy.ndarray - floating point data
     self.m_samples: numpy.ndarray - sample ids
     self.m_features: numpy.ndarray - feature ids
-    self.m_batches: numpy.ndarray - batch data with each row is a sample
+    self.m_batch_codes: numpy.ndarray - int32 batch codes with each row is a sample and each column is a batch type
+    self.m_batch_levels: List[numpy.ndarray] - sorted batch ids for each batch type, code is index into levels
+    self.m_batches: numpy.ndarray - (property) batch ids as strings with each row is a sample
     self.m_columns: numpy.ndarray = column labels for batches. First column is Sample
     """
     # do not set method variables, as they should be initialized in the init function
@@ -43,7 +90,8 @@ class StdData:
     m_features: numpy.ndarray
     # Batch information - first column is Sample
     # rows are sorted by values in Sample column
-    m_batches: numpy.ndarray
+    m_batch_codes: numpy.ndarray
+    m_batch_levels: typing.List[numpy.ndarray]
     m_columns: numpy.ndarray
 
     def __init__(self: 'StdData', the_matrix: typing.Optional[pandas.DataFrame] = None) -> None:
@@ -64,13 +112,47 @@ class StdData:
         if the_matrix is not None:
             self.process_panda_matrix(the_matrix)
 
+    @property
+    def m_batches(self: 'StdData') -> numpy.ndarray:
+        """
+        batch ids as strings, from codes and levels
+        :return: numpy.ndarray of str with each row is a sample
+        """
+        if 0 == len(self.m_batch_levels):
+            return numpy.empty((self.m_batch_codes.shape[0], 0), str)
+        return numpy.column_stack([levels[self.m_batch_codes[:, index]]
+                                   for index, levels in enumerate(self.m_batch_levels)])
+
+    @m_batches.setter
+    def m_batches(self: 'StdData', the_values: numpy.ndarray) -> None:
+        """
+        set batch codes and levels from batch ids, each column factorized once
+        :param the_values: two dimensional array of batch ids with each row is a sample
+        """
+        the_values = numpy.asarray(the_values, dtype=str)
+        # Fortran order, so codes for one batch type are contiguous
+        self.m_batch_codes = numpy.empty(the_values.shape, dtype=numpy.int32, order='F')
+        self.m_batch_levels = []
+        index: int
+        for index in range(the_values.shape[1]):
+            levels: numpy.ndarray
+            codes: numpy.ndarray
+            levels, codes = numpy.unique(the_values[:, index], return_inverse=True)
+            self.m_batch_codes[:, index] = codes.reshape(-1)
+            self.m_batch_levels.append(levels)
+
     def process_panda_matrix(self: 'StdData', the_matrix: pandas.DataFrame) -> None:
         """
         Convert Pandas dataframe to numpy
         :param the_matrix: pandas DataFrame
         :return: nothing
         """
-        the_matrix.apply(pandas.to_numeric)
+        # only convert columns pandas did not read as numbers (raises ValueError for non-numeric values)
+        non_numeric: typing.List[str] = [column for column in the_matrix.columns
+                                         if not pandas.api.types.is_numeric_dtype(the_matrix[column])]
+        if len(non_numeric) > 0:
+            the_matrix = the_matrix.copy()
+            the_matrix[non_numeric] = the_matrix[non_numeric].apply(pandas.to_numeric)
         # print(f"the_matrix.shape={the_matrix.shape}", flush=True)
         # index_sort() sorts by row names
         # index_sort(axis=1) sorts by column names
@@ -80,16 +162,162 @@ class StdData:
         self.m_samples = the_matrix.columns.to_numpy(dtype=str)
         self.m_features = the_matrix.index.to_numpy(dtype=str)
 
-    def read_matrix_data(self: 'StdData', the_file: str) -> None:
+    @classmethod
+    def from_archive(cls, the_zip_path: str, the_version: str, the_float32_flag: bool = False,
+                     the_block_rows: int = 4096) -> 'StdData':
+        """
+        Read matrix and batches for a version directly from a standardized data ZIP archive
+        (versions/DATA_<version>/matrix.tsv and batches.tsv), without extracting files.
+        Matrix values are parsed in blocks of rows straight to floating point (see read_matrix_stream).
+        Batches are optional, and left empty if the version has no batches.tsv.
+        :param the_zip_path: full path to standardized data ZIP archive
+        :param the_version: data version, as in DATA_<version> directory name
+        :param the_float32_flag: if True, matrix values are float32 instead of float64
+        :param the_block_rows: number of matrix rows to parse at one time
+        :return: StdData with matrix (and batches) read, sorted as by read_matrix_data and read_batches_data
+        """
+        my_obj: StdData = cls()
+        # use manual / as it is ZIP file, not OS file
+        matrix_name: str = f"versions/DATA_{the_version}/matrix.tsv"
+        batches_name: str = f"versions/DATA_{the_version}/batches.tsv"
+        print(f"StdData::from_archive the_zip_path={the_zip_path} matrix_name={matrix_name}", flush=True)
+        zip_file: zipfile.ZipFile
+        with zipfile.ZipFile(the_zip_path, 'r') as zip_file:
+            with zip_file.open(matrix_name, mode="r") as in_file:
+                my_obj.read_matrix_stream(in_file, numpy.float32 if the_float32_flag else numpy.float64, the_block_rows)
+            if batches_name in zip_file.namelist():
+                with zip_file.open(batches_name, mode="r") as in_file:
+                    my_obj.read_batches_stream(in_file)
+        return my_obj
+
+    def read_matrix_stream(self: 'StdData', the_stream: typing.BinaryIO, the_dtype: type = numpy.float64,
+                           the_block_rows: int = 4096) -> None:
+        """
+        Load matrix from a binary stream (such as a ZIP member) in matrix file format.
+        Sample ids come from the header line, then rows are parsed the_block_rows at a time
+        with values read as the_dtype, so no DataFrame of strings is made.
+        Samples and features are sorted, as by process_panda_matrix. Feature ids that are all
+        numbers are sorted (and written) as numbers, since pandas reads them as a numeric index there.
+        :param the_stream: binary stream, samples as columns with leading tab, features as rows
+        :param the_dtype: numpy floating point type for values
+        :param the_block_rows: number of rows to parse at one time
+        :return: nothing
+        """
+        text_stream: io.TextIOWrapper = io.TextIOWrapper(the_stream, encoding='utf-8', newline='')
+        header: typing.List[str] = text_stream.readline().rstrip('\r\n').split('\t')
+        samples: numpy.ndarray = numpy.array(header[1:], dtype=str)
+        # integer column names, so sample ids are not parsed again
+        column_cnt: int = samples.size
+        dtypes: typing.Dict[int, type] = {index: the_dtype for index in range(1, column_cnt + 1)}
+        dtypes[0] = str
+        feature_blocks: typing.List[numpy.ndarray] = []
+        value_blocks: typing.List[numpy.ndarray] = []
+        block: pandas.DataFrame
+        with pandas.read_csv(text_stream, sep='\t', quoting=csv.QUOTE_NONE, header=None,
+                             names=list(range(column_cnt + 1)), index_col=0, dtype=dtypes,
+                             chunksize=the_block_rows) as reader:
+            for block in reader:
+                feature_blocks.append(block.index.to_numpy(dtype=str))
+                value_blocks.append(block.to_numpy(dtype=the_dtype))
+        features: numpy.ndarray = numpy.concatenate(feature_blocks) if len(feature_blocks) > 0 else numpy.empty(0, str)
+        values: numpy.ndarray = numpy.concatenate(value_blocks) if len(value_blocks) > 0 else numpy.empty((0, column_cnt), the_dtype)
+        # read_matrix_data lets pandas infer the row name type, so numeric ids sort as numbers
+        feature_keys: numpy.ndarray = features
+        try:
+            feature_keys = pandas.to_numeric(features)
+            features = feature_keys.astype(str)
+        except (ValueError, TypeError):
+            pass
+        # sort rows and columns, copying values only if not already sorted
+        feature_order: numpy.ndarray = numpy.argsort(feature_keys, kind='stable')
+        sample_order: numpy.ndarray = numpy.argsort(samples, kind='stable')
+        feature_sorted: bool = bool(numpy.all(feature_order == numpy.arange(feature_order.size)))
+        sample_sorted: bool = bool(numpy.all(sample_order == numpy.arange(sample_order.size)))
+        if not (feature_sorted and sample_sorted):
+            values = values[numpy.ix_(feature_order, sample_order)]
+        self.m_matrix = values
+        self.m_features = features[feature_order]
+        self.m_samples = samples[sample_order]
+
+    def read_batches_stream(self: 'StdData', the_stream: typing.BinaryIO) -> None:
+        """
+        Load batches from a binary stream (such as a ZIP member) in batches file format.
+        Read the same way as read_batches_data (batch files are small), so NA and empty values
+        become 'nan' in both. First column is sample id, and its header is used as the sample id column name.
+        :param the_stream: binary stream, with sample id as first column
+        :return: nothing
+        """
+        my_batches: pandas.DataFrame = pandas.read_csv(the_stream, sep='\t', quoting=csv.QUOTE_NONE,
+                                                       encoding='utf-8', index_col=0, dtype=str)
+        self.process_panda_batches(my_batches, str(my_batches.index.name))
+
+    def read_matrix_data(self: 'StdData', the_file: str, the_sidecar_flag: bool = False) -> None:
         """
         Load standardized data from file into StdData object.
         Uses Pandas for easy loading. But stores in numpy
         :param the_file: matrix file to load. Samples as columns with leading tab, features as rows
+        :param the_sidecar_flag: if True, load from binary sidecar if it matches the_file,
+                                 otherwise read the_file and write the sidecar (see write_matrix_sidecar)
         :return: nothing
         """
+        if the_sidecar_flag:
+            if self.read_matrix_sidecar(the_file):
+                return
         my_matrix: pandas.DataFrame = pandas.read_csv(the_file, sep='\t', quoting=csv.QUOTE_NONE,
                                                       encoding='utf-8', index_col=0)
         self.process_panda_matrix(my_matrix)
+        if the_sidecar_flag:
+            self.write_matrix_sidecar(the_file)
+
+    def write_matrix_sidecar(self: 'StdData', the_file: str) -> typing.Optional[str]:
+        """
+        Write binary sidecar for matrix file: matrix.npy (sorted values), features.npy, samples.npy,
+        and source.json (see get_source_signature). Written to a temporary directory and renamed,
+        so a partial sidecar is never read. Matrices that are not numeric are not written.
+        :param the_file: matrix file loaded into this object
+        :return: full path to sidecar directory, or None if not written
+        """
+        if self.m_matrix.dtype.kind not in ('f', 'i', 'u', 'b'):
+            print(f"write_matrix_sidecar skip non-numeric dtype={self.m_matrix.dtype}", flush=True)
+            return None
+        sidecar_dir: str = get_sidecar_dir(the_file)
+        temp_dir: str = tempfile.mkdtemp(prefix='tmp-', dir=os.path.dirname(os.path.abspath(the_file)))
+        try:
+            numpy.save(os.path.join(temp_dir, 'matrix.npy'), self.m_matrix)
+            numpy.save(os.path.join(temp_dir, 'features.npy'), self.m_features)
+            numpy.save(os.path.join(temp_dir, 'samples.npy'), self.m_samples)
+            with open(os.path.join(temp_dir, 'source.json'), 'w', encoding='utf-8') as out_file:
+                json.dump(get_source_signature(the_file), out_file)
+            if os.path.exists(sidecar_dir):
+                shutil.rmtree(sidecar_dir)
+            os.rename(temp_dir, sidecar_dir)
+        finally:
+            if os.path.exists(temp_dir):
+                shutil.rmtree(temp_dir, ignore_errors=True)
+        print(f"write_matrix_sidecar sidecar_dir={sidecar_dir}", flush=True)
+        return sidecar_dir
+
+    def read_matrix_sidecar(self: 'StdData', the_file: str) -> bool:
+        """
+        Load matrix from binary sidecar, if it exists and matches the_file.
+        Values are memory-mapped read-only (numpy.load mmap_mode='r'), so loading does not read the matrix.
+        :param the_file: matrix file to load
+        :return: True if loaded from sidecar, False if sidecar is missing or out of date
+        """
+        sidecar_dir: str = get_sidecar_dir(the_file)
+        source_file: str = os.path.join(sidecar_dir, 'source.json')
+        if not os.path.exists(source_file):
+            return False
+        with open(source_file, 'r', encoding='utf-8') as in_file:
+            signature: typing.Dict[str, typing.Any] = json.load(in_file)
+        if signature != get_source_signature(the_file):
+            print(f"read_matrix_sidecar out of date sidecar_dir={sidecar_dir}", flush=True)
+            return False
+        self.m_matrix = numpy.load(os.path.join(sidecar_dir, 'matrix.npy'), mmap_mode='r')
+        self.m_features = numpy.load(os.path.join(sidecar_dir, 'features.npy'))
+        self.m_samples = numpy.load(os.path.join(sidecar_dir, 'samples.npy'))
+        print(f"read_matrix_sidecar sidecar_dir={sidecar_dir}", flush=True)
+        return True
 
     def read_batches_data(self: 'StdData', the_file: str, the_sample_id_col: str = "Sample") -> None:
         """
@@ -101,11 +329,20 @@ class StdData:
         """
         my_batches: pandas.DataFrame = pandas.read_csv(the_file, sep='\t', quoting=csv.QUOTE_NONE,
                                                        encoding='utf-8', index_col=0, dtype=str)
-        my_batches = my_batches.sort_values(by=the_sample_id_col)
+        self.process_panda_batches(my_batches, the_sample_id_col)
+
+    def process_panda_batches(self: 'StdData', the_batches: pandas.DataFrame, the_sample_id_col: str) -> None:
+        """
+        Convert Pandas batches dataframe (sample id as index) to numpy, sorted by sample
+        :param the_batches: pandas DataFrame of strings, with sample id as index
+        :param the_sample_id_col: string name of sample id column
+        :return: nothing
+        """
+        my_batches: pandas.DataFrame = the_batches.sort_values(by=the_sample_id_col)
         self.m_batches = my_batches.to_numpy(dtype=str)
-        self.m_columns = my_batches.columns.to_numpy(dtype=str)
         # sample is not in .columns so needs to be added
-        self.m_columns = numpy.insert(self.m_columns, 0, the_sample_id_col)
+        # (build from list, since numpy.insert truncates to the width of existing labels)
+        self.m_columns = numpy.array([the_sample_id_col] + my_batches.columns.tolist(), dtype=str)
 
     def write_matrix_data(self: 'StdData', the_file: str) -> None:
         """
@@ -117,14 +354,37 @@ class StdData:
         my_matrix: pandas.DataFrame = pandas.DataFrame(self.m_matrix, self.m_features, self.m_samples)
         my_matrix.to_csv(the_file, sep='\t', encoding='utf-8')
 
-    def get_batch_data_for_column(self: 'StdData', the_value: str) -> numpy.array:
+    def get_batch_index_for_column(self: 'StdData', the_value: str) -> int:
         """
-        Batch type to get values for
+        Column of m_batch_codes (and m_batch_levels entry) for batch type
         :param the_value: batch type name
-        :return: numpy.ndarray of batch values
+        :return: index
         """
         index: int = numpy.where(self.m_columns == the_value)[0][0]
         # subtract one, since numpy doesn't use Sample as a "real" column
-        index = index - 1
-        values: numpy.ndarray = self.m_batches[:, index]
-        return values
+        return index - 1
+
+    def get_batch_data_for_column(self: 'StdData', the_value: str) -> numpy.array:
+        """
+        Batch type to get values for, as integer codes (see get_batch_levels_for_column)
+        :param the_value: batch type name
+        :return: numpy.ndarray of int32 batch codes
+        """
+        return self.m_batch_codes[:, self.get_batch_index_for_column(the_value)]
+
+    def get_batch_levels_for_column(self: 'StdData', the_value: str) -> numpy.array:
+        """
+        Batch ids for codes from get_batch_data_for_column
+        :param the_value: batch type name
+        :return: numpy.ndarray of sorted batch ids
+        """
+        return self.m_batch_levels[self.get_batch_index_for_column(the_value)]
+
+    def get_batch_strings_for_column(self: 'StdData', the_value: str) -> numpy.array:
+        """
+        Batch type to get values for, as batch id strings
+        :param the_value: batch type name
+        :return: numpy.ndarray of batch values
+        """
+        index: int = self.get_batch_index_for_column(the_value)
+        return self.m_batch_levels[index][self.m_batch_codes[:, index]]
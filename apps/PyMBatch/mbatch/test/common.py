@@ -21,7 +21,7 @@ MD Anderson Cancer Center Bioinformatics at MDA <https://www.mdanderson.org/rese
 
 
 from pathlib import Path
-from typing import List, Dict
+from typing import List, Dict, Tuple
 import typing
 import math
 import hashlib
@@ -29,9 +29,19 @@ import io
 import os
 import re
 import shutil
+import time
 import datetime
 import zipfile
 import pandas
+try:
+    import fcntl
+except ImportError:
+    # not available on Windows, clone_file falls back to copying
+    fcntl = None
+
+
+# Linux ioctl to make a copy-on-write clone of a file (btrfs, xfs, ...)
+FICLONE: int = 0x40049409
 
 
 def uniq_reduce_string_length(the_string: str, the_len: int) -> str:
@@ -550,6 +560,68 @@ def copy_archive_file_to_regular(the_zip_path: str, the_internal_file: str, the_
                     shutil.copyfileobj(read_zip_file, out_file)
 
 
+def clone_file(the_source_file: str, the_dest_file: str, the_hardlink_flag: bool = False) -> str:
+    """
+    Duplicate a regular file without reading it through Python.
+    Uses a copy-on-write reflink where the filesystem supports it, otherwise a kernel-side copy.
+    Hard links are only used when requested, since the two names then share one file,
+    and rewriting one in place changes the other.
+    :param the_source_file: full path of file to duplicate
+    :param the_dest_file: full path of duplicate to write (replaced if it exists)
+    :param the_hardlink_flag: if True, try a hard link first
+    :return: method used, one of hardlink, reflink or copy
+    """
+    if os.path.exists(the_dest_file):
+        os.remove(the_dest_file)
+    if the_hardlink_flag:
+        try:
+            os.link(the_source_file, the_dest_file)
+            return 'hardlink'
+        except OSError:
+            pass
+    if fcntl is not None:
+        try:
+            with open(the_source_file, 'rb') as in_file:
+                with open(the_dest_file, 'wb') as out_file:
+                    fcntl.ioctl(out_file.fileno(), FICLONE, in_file.fileno())
+            return 'reflink'
+        except OSError:
+            pass
+    shutil.copyfile(the_source_file, the_dest_file)
+    return 'copy'
+
+
+def stage_archive_files(the_zip_path: str, the_copies: List[Tuple[str, List[str]]],
+                        the_hardlink_flag: bool = False) -> Tuple[int, float]:
+    """
+    Copy files in the ZIP file to the outside, opening the ZIP file once.
+    Each member is decompressed once, to its first destination, and the other destinations
+    are made with clone_file. Members not in the ZIP file are skipped, like copy_archive_file_to_regular.
+    :param the_zip_path: Path to ZIP file (with name)
+    :param the_copies: list of tuples of internal path for file inside ZIP archive and
+    list of full paths and filenames for files to copy to
+    :param the_hardlink_flag: if True, duplicates may be hard links, see clone_file
+    :return: tuple of bytes written (counting each destination) and seconds taken
+    """
+    start: float = time.perf_counter()
+    total_bytes: int = 0
+    zip_file: zipfile.ZipFile
+    with zipfile.ZipFile(the_zip_path, 'r') as zip_file:
+        members: Dict[str, zipfile.ZipInfo] = {my_info.filename: my_info for my_info in zip_file.infolist()}
+        internal_file: str
+        external_files: List[str]
+        for internal_file, external_files in the_copies:
+            if (internal_file in members) and (len(external_files) > 0):
+                with zip_file.open(members[internal_file], mode="r") as read_zip_file:
+                    with open(external_files[0], 'wb') as out_file:
+                        shutil.copyfileobj(read_zip_file, out_file, 1024 * 1024)
+                my_file: str
+                for my_file in external_files[1:]:
+                    clone_file(external_files[0], my_file, the_hardlink_flag)
+                total_bytes += members[internal_file].file_size * len(external_files)
+    return total_bytes, time.perf_counter() - start
+
+
 def convert_int_to_str(the_int: int) -> str:
     """
     return string for int -- unless int is less than zero, then return empty string
@@ -20,16 +20,23 @@ MD Anderson Cancer Center Bioinformatics at MDA <https://www.mdanderson.org/rese
 """
 
 
-from typing import List
+from typing import List, Dict
 import unittest
 import shutil
 import os
 import pandas
 import numpy
+import scipy.sparse
 from mbatch.stddata.stddata import StdData
-from mbatch.dsc.dsc_info import DscInfo
-from mbatch.dsc.dsc_perm import DscPerm
-from mbatch.dsc.dsc_calc import dsc_calc
+from mbatch.dsc.dsc_info import DscInfo, write_dsc_info_list, read_dsc_info_list
+from mbatch.dsc.dsc_perm import DscPerm, dsc_perm_pvalue, dsc_perm_pvalue_codes, dsc_perm_calc_count, dsc_perm_calc_count_codes
+from mbatch.dsc.dsc_pvalue import DscPvalue
+from mbatch.dsc.dsc_chunked import dsc_calc_npy
+from mbatch.dsc.dsc_cache import dsc_calc_cached, dsc_perm_pvalue_cached, dsc_perm_calc_count_cached
+from mbatch.dsc.dsc_cache import dsc_calc_codes_cached, dsc_perm_calc_count_codes_cached
+from mbatch.cache.result_cache import ResultCache, make_cache_key
+from mbatch.dsc.dsc_stats import DscStats, dsc_update, dsc_stats_file
+from mbatch.dsc.dsc_calc import dsc_calc, dsc_calc_all_types, dsc_pairwise, dsc_calc_codes, factorize_batches
 from mbatch.test.common import generate_file_md5
 
 
@@ -92,6 +99,20 @@ M_TOY_PERM: pandas.DataFrame = pandas.DataFrame({
     index=['Feature1', 'Feature2', 'Feature3', 'Feature4'])
 
 
+def assert_dsc_close(the_expected: DscInfo, the_actual: DscInfo) -> None:
+    """
+    Check two DscInfo objects have the same values, within floating point tolerance
+    :param the_expected: DscInfo from dsc_calc
+    :param the_actual: DscInfo to compare
+    :return: nothing
+    """
+    assert numpy.allclose([the_expected.m_dsc, the_expected.m_db, the_expected.m_dw],
+                          [the_actual.m_dsc, the_actual.m_db, the_actual.m_dw], equal_nan=True), "Overall values differ"
+    assert numpy.allclose(the_expected.m_list_of_feature_dsc, the_actual.m_list_of_feature_dsc, equal_nan=True), "Feature DSC differ"
+    assert numpy.allclose(the_expected.m_list_of_feature_db, the_actual.m_list_of_feature_db, equal_nan=True), "Feature Db differ"
+    assert numpy.allclose(the_expected.m_list_of_feature_dw, the_actual.m_list_of_feature_dw, equal_nan=True), "Feature Dw differ"
+
+
 class TestDsc(unittest.TestCase):
     """
     Class for setting up Dsc testing - clear/make directory for output
@@ -231,7 +252,7 @@ class TestDsc(unittest.TestCase):
         mydata: StdData = StdData()
         mydata.read_matrix_data(the_matrix)
         mydata.read_batches_data(the_batches)
-        my_batch_list: numpy.ndarray = mydata.get_batch_data_for_column('ShipDate')
+        my_batch_list: numpy.ndarray = mydata.get_batch_strings_for_column('ShipDate')
         result: DscInfo = dsc_calc(mydata.m_matrix, my_batch_list)
         result.write_to_file(the_dyn_file)
         # print(result, flush=True)
@@ -243,6 +264,226 @@ class TestDsc(unittest.TestCase):
         assert dyn_md5 == sta_md5, "Calculated and historic have different values"
         print("test_dsc_calc_file passed", flush=True)
 
+    def test_dsc_vector_toy(self: 'TestDsc') -> None:
+        print("test_dsc_vector_toy", flush=True)
+        mydata: StdData = StdData(M_TOY_DATA)
+        my_batches: numpy.ndarray = M_TOY_BATCHES.to_numpy(dtype=str)
+        assert_dsc_close(dsc_calc(mydata.m_matrix, my_batches), dsc_calc(mydata.m_matrix, my_batches, the_engine='vector'))
+        # NaN in a single sample batch and in a larger batch
+        my_matrix: numpy.ndarray = mydata.m_matrix.copy()
+        my_batches = my_batches.copy()
+        my_batches[0] = 'd'
+        my_matrix[0, 0] = numpy.nan
+        my_matrix[1, 1] = numpy.nan
+        assert_dsc_close(dsc_calc(my_matrix, my_batches), dsc_calc(my_matrix, my_batches, the_engine='vector'))
+        print("test_dsc_vector_toy passed", flush=True)
+
+    def test_dsc_shared_toy(self: 'TestDsc') -> None:
+        print("test_dsc_shared_toy", flush=True)
+        mydata: StdData = StdData(M_TOY_DATA)
+        my_batches: numpy.ndarray = M_TOY_BATCHES.to_numpy(dtype=str)
+        # results depend on the seed, not on the number of cores
+        info_one: List[DscInfo] = DscPerm(mydata.m_matrix, my_batches, self.seed, 20, 1).perm_dsc_shared()
+        info_many: List[DscInfo] = DscPerm(mydata.m_matrix, my_batches, self.seed, 20, 4).perm_dsc_shared()
+        assert 20 == len(info_one), "Wrong number of permutations"
+        info: DscInfo
+        other: DscInfo
+        for info, other in zip(info_one, info_many):
+            assert_dsc_close(info, other)
+        print("test_dsc_shared_toy passed", flush=True)
+
+    def test_dsc_pvalue_toy(self: 'TestDsc') -> None:
+        print("test_dsc_pvalue_toy", flush=True)
+        mydata: StdData = StdData(M_TOY_DATA)
+        my_batches: numpy.ndarray = M_TOY_BATCHES.to_numpy(dtype=str)
+        observed: DscInfo = dsc_calc(mydata.m_matrix, my_batches)
+        # same child seeds, so reduced counts should match counts from full list
+        info_list: List[DscInfo] = DscPerm(mydata.m_matrix, my_batches, self.seed, 20, 2).perm_dsc_shared()
+        result: DscPvalue = DscPerm(mydata.m_matrix, my_batches, self.seed, 20, 3).perm_dsc_pvalue(observed, True)
+        assert 20 == result.m_perms, "Wrong number of permutations"
+        assert numpy.allclose(result.m_null_dsc, [info.m_dsc for info in info_list]), "Null distribution differs"
+        exceed: int = sum(1 for info in info_list if info.m_dsc >= observed.m_dsc)
+        assert exceed / 20 == result.m_pvalue, "Overall p-value differs"
+        feature_exceed: numpy.ndarray = sum(numpy.array(info.m_list_of_feature_dsc) >= numpy.array(observed.m_list_of_feature_dsc) for info in info_list)
+        assert numpy.allclose(feature_exceed / 20, result.m_list_of_feature_pvalue), "Feature p-values differ"
+        print("test_dsc_pvalue_toy passed", flush=True)
+
+    def test_dsc_sequential_toy(self: 'TestDsc') -> None:
+        print("test_dsc_sequential_toy", flush=True)
+        mydata: StdData = StdData(M_TOY_DATA)
+        my_batches: numpy.ndarray = M_TOY_BATCHES.to_numpy(dtype=str)
+        observed: DscInfo = dsc_calc(mydata.m_matrix, my_batches)
+        # toy data has no batch effect, so the p-value is large and stops early
+        result: DscPvalue = DscPerm(mydata.m_matrix, my_batches, self.seed, 200, 2).perm_dsc_sequential(observed, 5, 10)
+        assert result.m_perms < 200, "Sequential permutations did not stop early"
+        assert 0 == result.m_perms % 10, "Sequential permutations should stop between batches"
+        assert result.m_overall_exceed >= 5, "Sequential permutations stopped before exceed limit"
+        # permutations run are the first ones of the fixed count version
+        fixed: DscPvalue = DscPerm(mydata.m_matrix, my_batches, self.seed, result.m_perms, 3).perm_dsc_pvalue(observed)
+        assert fixed.m_overall_exceed == result.m_overall_exceed, "Sequential and fixed counts differ"
+        assert fixed.m_pvalue == result.m_pvalue, "Sequential and fixed p-values differ"
+        print("test_dsc_sequential_toy passed", flush=True)
+
+    def test_dsc_update_toy(self: 'TestDsc') -> None:
+        print("test_dsc_update_toy", flush=True)
+        mydata: StdData = StdData(M_TOY_DATA)
+        my_batches: numpy.ndarray = M_TOY_BATCHES.to_numpy(dtype=str)
+        # cached statistics for first 20 samples
+        my_stats: DscStats = DscStats.from_matrix(mydata.m_matrix[:, :20], my_batches[:20], mydata.m_features, mydata.m_samples[:20])
+        stats_file: str = my_stats.write_to_file(dsc_stats_file(os.path.dirname(self.dyn_toy), 'toy'))
+        new_file: str = os.path.join(os.path.dirname(self.dyn_toy), 'DscStats-toy-new.npz')
+        # new version adds last 5 samples (one in new batch d) and removes first 2
+        added_batches: numpy.ndarray = my_batches[20:].copy()
+        added_batches[0] = 'd'
+        result: DscInfo = dsc_update(stats_file, new_file,
+                                     mydata.m_matrix[:, 20:], added_batches, mydata.m_samples[20:],
+                                     mydata.m_matrix[:, :2], mydata.m_samples[:2])
+        new_batches: numpy.ndarray = numpy.concatenate((my_batches[2:20], added_batches))
+        assert_dsc_close(dsc_calc(mydata.m_matrix[:, 2:], new_batches), result)
+        new_stats: DscStats = DscStats()
+        new_stats.read_from_file(new_file)
+        assert 23 == new_stats.m_samples.size, "Wrong number of samples in updated statistics"
+        print("test_dsc_update_toy passed", flush=True)
+
+    def test_dsc_all_types_toy(self: 'TestDsc') -> None:
+        print("test_dsc_all_types_toy", flush=True)
+        mydata: StdData = StdData(M_TOY_DATA)
+        my_batches: numpy.ndarray = M_TOY_BATCHES.to_numpy(dtype=str)
+        # second batch type splits samples in half
+        mydata.m_batches = numpy.column_stack((my_batches, numpy.where(numpy.arange(25) < 12, 'x', 'y')))
+        mydata.m_columns = numpy.array(['Sample', 'Toy', 'Half'])
+        results: Dict[str, DscInfo] = dsc_calc_all_types(mydata)
+        batch_type: str
+        for batch_type in ['Toy', 'Half']:
+            assert_dsc_close(dsc_calc(mydata.m_matrix, mydata.get_batch_data_for_column(batch_type)), results[batch_type])
+        print("test_dsc_all_types_toy passed", flush=True)
+
+    def test_dsc_pairwise_toy(self: 'TestDsc') -> None:
+        print("test_dsc_pairwise_toy", flush=True)
+        mydata: StdData = StdData(M_TOY_DATA)
+        my_batches: numpy.ndarray = M_TOY_BATCHES.to_numpy(dtype=str)
+        levels: numpy.ndarray
+        dsc_matrix: numpy.ndarray
+        db_matrix: numpy.ndarray
+        dw_matrix: numpy.ndarray
+        levels, dsc_matrix, db_matrix, dw_matrix = dsc_pairwise(mydata.m_matrix, my_batches)
+        index_a: int
+        index_b: int
+        for index_a in range(levels.size):
+            self.assertTrue(numpy.isnan(dsc_matrix[index_a, index_a]), "diagonal should be NaN")
+            for index_b in range(index_a + 1, levels.size):
+                pair_mask: numpy.ndarray = numpy.isin(my_batches, [levels[index_a], levels[index_b]])
+                expected: DscInfo = dsc_calc(mydata.m_matrix[:, pair_mask], my_batches[pair_mask])
+                for actual in [(dsc_matrix, expected.m_dsc), (db_matrix, expected.m_db), (dw_matrix, expected.m_dw)]:
+                    self.assertTrue(numpy.allclose(actual[0][index_a, index_b], actual[1], equal_nan=True), "pairwise DSC differs")
+                    self.assertTrue(numpy.allclose(actual[0][index_b, index_a], actual[1], equal_nan=True), "pairwise DSC not symmetric")
+        print("test_dsc_pairwise_toy passed", flush=True)
+
+    def test_dsc_binary_toy(self: 'TestDsc') -> None:
+        print("test_dsc_binary_toy", flush=True)
+        mydata: StdData = StdData(M_TOY_DATA)
+        dpp: DscPerm = DscPerm(mydata.m_matrix, M_TOY_BATCHES.to_numpy(dtype=str), self.seed, 20, 1)
+        info_list: List[DscInfo] = [dpp.perm_dsc_once() for _ in range(20)]
+        binary_file: str = write_dsc_info_list(info_list, os.path.join(os.path.dirname(self.dyn_toy), 'perms.npy'))
+        read_list: List[DscInfo] = read_dsc_info_list(binary_file)
+        self.assertEqual(info_list, read_list, "DscInfo read from binary differs")
+        # text export is the same from either
+        text_file: str = os.path.join(os.path.dirname(self.dyn_toy), 'perms.txt')
+        read_list[0].write_to_file(text_file)
+        text_info: DscInfo = DscInfo()
+        text_info.read_from_file(text_file)
+        assert_dsc_close(info_list[0], text_info)
+        print("test_dsc_binary_toy passed", flush=True)
+
+    def test_dsc_chunked_toy(self: 'TestDsc') -> None:
+        print("test_dsc_chunked_toy", flush=True)
+        mydata: StdData = StdData(M_TOY_DATA)
+        my_batches: numpy.ndarray = M_TOY_BATCHES.to_numpy(dtype=str)
+        npy_file: str = os.path.join(os.path.dirname(self.dyn_toy), 'toy_matrix.npy')
+        numpy.save(npy_file, mydata.m_matrix)
+        expected: DscInfo = dsc_calc(mydata.m_matrix, my_batches)
+        # one row per block (toy matrix has 4 rows), so results are accumulated over blocks
+        self.assertGreater(mydata.m_matrix.shape[0], 1)
+        assert_dsc_close(expected, dsc_calc_npy(npy_file, my_batches, 1))
+        actual: DscInfo = dsc_calc_npy(npy_file, my_batches, 1, True)
+        self.assertTrue(numpy.isclose(expected.m_dsc, actual.m_dsc, rtol=1e-5), "float32 DSC differs")
+        self.assertTrue(numpy.allclose(expected.m_feature_dsc, actual.m_feature_dsc, rtol=1e-4, equal_nan=True), "float32 feature DSC differs")
+        print("test_dsc_chunked_toy passed", flush=True)
+
+    def test_dsc_codes_toy(self: 'TestDsc') -> None:
+        print("test_dsc_codes_toy", flush=True)
+        mydata: StdData = StdData(M_TOY_DATA)
+        my_batches: numpy.ndarray = M_TOY_BATCHES.to_numpy(dtype=str)
+        # column-major matrix and int32 codes, as passed from R
+        my_matrix: numpy.ndarray = numpy.asfortranarray(mydata.m_matrix, dtype=numpy.float64)
+        codes: numpy.ndarray
+        levels: numpy.ndarray
+        codes, levels = factorize_batches(my_batches)
+        codes = codes.astype(numpy.int32)
+        self.assertEqual(dsc_calc(my_matrix, my_batches, False, 'vector'), dsc_calc_codes(my_matrix, codes, levels))
+        expected: DscPvalue = dsc_perm_pvalue(my_matrix, my_batches, self.seed, 20, 2, False, 'vector')
+        actual: DscPvalue = dsc_perm_pvalue_codes(my_matrix, codes, levels, self.seed, 20, 2)
+        self.assertEqual(expected.m_pvalue, actual.m_pvalue, "p-value differs")
+        self.assertEqual(expected.m_list_of_feature_pvalue, actual.m_list_of_feature_pvalue, "feature p-values differ")
+        # permutation list, as used by doDscPerms in R
+        perm_list: List[DscInfo] = dsc_perm_calc_count(my_matrix, my_batches, self.seed, 5, 2, False, 'vector')
+        self.assertEqual(perm_list, dsc_perm_calc_count_codes(my_matrix, codes, levels, self.seed, 5, 2))
+        # cached, miss then hit
+        cache_dir: str = os.path.join(os.path.dirname(self.dyn_toy), 'cache_codes')
+        if os.path.exists(cache_dir):
+            shutil.rmtree(cache_dir)
+        for _ in range(2):
+            self.assertEqual(dsc_calc_codes(my_matrix, codes, levels), dsc_calc_codes_cached(cache_dir, my_matrix, codes, levels))
+            self.assertEqual(perm_list, dsc_perm_calc_count_codes_cached(cache_dir, my_matrix, codes, levels, self.seed, 5, 2))
+        self.assertEqual(2, len(os.listdir(cache_dir)), "Hit should not add cache entry")
+        print("test_dsc_codes_toy passed", flush=True)
+
+    def test_dsc_sparse_toy(self: 'TestDsc') -> None:
+        print("test_dsc_sparse_toy", flush=True)
+        mydata: StdData = StdData(M_TOY_DATA)
+        my_batches: numpy.ndarray = M_TOY_BATCHES.to_numpy(dtype=str)
+        # mostly zeros, like mutation counts
+        my_matrix: numpy.ndarray = numpy.where(numpy.abs(mydata.m_matrix) > 1.0, mydata.m_matrix, 0.0)
+        expected: DscInfo = dsc_calc(my_matrix, my_batches)
+        assert_dsc_close(expected, dsc_calc(scipy.sparse.csr_matrix(my_matrix), my_batches))
+        assert_dsc_close(expected, dsc_calc(scipy.sparse.csc_matrix(my_matrix), my_batches))
+        print("test_dsc_sparse_toy passed", flush=True)
+
+    def test_dsc_cache_toy(self: 'TestDsc') -> None:
+        print("test_dsc_cache_toy", flush=True)
+        mydata: StdData = StdData(M_TOY_DATA)
+        my_batches: numpy.ndarray = M_TOY_BATCHES.to_numpy(dtype=str)
+        cache_dir: str = os.path.join(os.path.dirname(self.dyn_toy), 'cache')
+        if os.path.exists(cache_dir):
+            shutil.rmtree(cache_dir)
+        expected: DscInfo = dsc_calc(mydata.m_matrix, my_batches)
+        # miss, then hit
+        self.assertEqual(expected, dsc_calc_cached(cache_dir, mydata.m_matrix, my_batches))
+        self.assertEqual(expected, dsc_calc_cached(cache_dir, mydata.m_matrix, my_batches))
+        self.assertEqual(1, len(os.listdir(cache_dir)), "Hit should not add cache entry")
+        # Fortran order is the same key, changed batches is a new key
+        self.assertEqual(make_cache_key(mydata.m_matrix), make_cache_key(numpy.asfortranarray(mydata.m_matrix)))
+        self.assertNotEqual(make_cache_key(my_batches), make_cache_key(my_batches[::-1]))
+        pvalue: DscPvalue = dsc_perm_pvalue(mydata.m_matrix, my_batches, self.seed, 20, 1, True)
+        cached: DscPvalue
+        for _ in range(2):
+            cached = dsc_perm_pvalue_cached(cache_dir, mydata.m_matrix, my_batches, self.seed, 20, 1, True)
+            self.assertEqual(pvalue.m_pvalue, cached.m_pvalue, "p-value differs")
+            self.assertEqual(pvalue.m_list_of_feature_pvalue, cached.m_list_of_feature_pvalue, "feature p-values differ")
+            self.assertEqual(pvalue.m_null_dsc, cached.m_null_dsc, "null distribution differs")
+        self.assertEqual(2, len(os.listdir(cache_dir)))
+        # permutation list, threads are not part of the key
+        perm_list: List[DscInfo] = dsc_perm_calc_count(mydata.m_matrix, my_batches, self.seed, 5, 1)
+        perm_threads: int
+        for perm_threads in [2, 1]:
+            self.assertEqual(perm_list, dsc_perm_calc_count_cached(cache_dir, mydata.m_matrix, my_batches, self.seed, 5, perm_threads))
+        self.assertEqual(3, len(os.listdir(cache_dir)))
+        # size limit of zero keeps only the entry just stored
+        small: ResultCache = ResultCache(cache_dir, 0)
+        small.store('newest', lambda the_dir: numpy.save(os.path.join(the_dir, 'x.npy'), numpy.zeros(4)))
+        self.assertEqual(['newest'], os.listdir(cache_dir))
+        print("test_dsc_cache_toy passed", flush=True)
+
     # noinspection DuplicatedCode
     def test_dsc_multi_toy(self: 'TestDsc') -> None:
         the_sta_toy: str = self.sta_count_toy
@@ -297,7 +538,7 @@ class TestDsc(unittest.TestCase):
         my_std_data.read_matrix_data(the_matrix)
         my_std_data.read_batches_data(the_batches)
         # build batch List
-        my_batch_list: numpy.ndarray = my_std_data.get_batch_data_for_column('ShipDate')
+        my_batch_list: numpy.ndarray = my_std_data.get_batch_strings_for_column('ShipDate')
         # call dsc permutations
         dpp: DscPerm = DscPerm(my_std_data.m_matrix, my_batch_list, the_seed, the_perms, 10)
         info_list: List[DscInfo] = dpp.perm_dsc_multi()
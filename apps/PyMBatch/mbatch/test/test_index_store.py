@@ -0,0 +1,233 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Copyright (c) 2011-2024 University of Texas MD Anderson Cancer Center
+
+This program is free software: you can redistribute it and/or modify it under the terms of the
+GNU General Public License as published by the Free Software Foundation, either version 2 of
+the License, or (at your option) any later version.
+
+This program is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY;
+without even the implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+See the GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License along with this program.
+If not, see <https://www.gnu.org/licenses/>.
+
+MD Anderson Cancer Center Bioinformatics on GitHub <https://github.com/MD-Anderson-Bioinformatics>
+MD Anderson Cancer Center Bioinformatics at MDA <https://www.mdanderson.org/research/departments-labs-institutes/departments-divisions/bioinformatics-and-computational-biology.html>
+@author: Tod Casasent
+"""
+
+
+import unittest
+import shutil
+import os
+import json
+import zipfile
+from typing import Dict, List, Optional
+from mbatch.pipeline.std_data import StandardizedData, write_std_pipeline_index, read_std_pipeline_index
+from mbatch.pipeline.std_data import build_std_pipeline_index, get_archive_manifest_file
+from mbatch.pipeline.std_data import read_archive_manifest, write_archive_manifest
+from mbatch.pipeline.index_store import PipelineIndexStore, get_index_store_file, recover_std_pipeline_index
+
+
+dynamic_test_index_store_dir: str = "/BEA/BatchEffectsPackage_data/testing_dynamic/PyMBatch/index_store"
+
+
+def make_toy_std_list() -> List[StandardizedData]:
+    """
+    Build pipeline index entries, out of order, with a correction job sharing archive and version
+    :return: list of StandardizedData
+    """
+    return [
+        StandardizedData('b/b.zip', '2024', '', '', '', ''),
+        StandardizedData('a/a.zip', '2024', '/out/a-data.zip', '/out/a-results.zip', 'JOB-1', 'succeeded'),
+        StandardizedData('a/a.zip', '2024', '', '', 'JOB-3', 'running'),
+        StandardizedData('c/c.zip', '2023', '', '', 'no-processing', 'no-processing')
+    ]
+
+
+def make_toy_archive(the_file: str, the_versions: List[str], the_matrices: Optional[Dict[str, str]] = None) -> None:
+    """
+    Write a standardized data ZIP with version directories
+    :param the_file: full path to ZIP file to write
+    :param the_versions: version timestamps to add
+    :param the_matrices: optional matrix.tsv contents by version
+    :return: nothing
+    """
+    os.makedirs(os.path.dirname(the_file), exist_ok=True)
+    with zipfile.ZipFile(the_file, 'w') as zip_file:
+        for my_version in the_versions:
+            zip_file.writestr(f"versions/DATA_{my_version}/", "")
+            if (the_matrices is not None) and (my_version in the_matrices):
+                zip_file.writestr(f"versions/DATA_{my_version}/matrix.tsv", the_matrices[my_version])
+
+
+def read_text(the_file: str) -> str:
+    """
+    Read text file contents
+    :param the_file: full path to file
+    :return: file contents
+    """
+    with open(the_file, 'r', encoding='utf-8') as in_file:
+        return in_file.read()
+
+
+class TestIndexStore(unittest.TestCase):
+    """
+    Class for setting up pipeline index store testing - clear/make directory for output
+    """
+    # do not set method variables, as they should be initialized in the init function
+    # No local method variables
+
+    def setUp(self: 'TestIndexStore') -> None:
+        """
+        setup script to clear and re-populate test directory
+        :return:
+        """
+        print(f"TestIndexStore::setUp dynamic_test_dir={dynamic_test_index_store_dir}", flush=True)
+        if os.path.exists(dynamic_test_index_store_dir):
+            shutil.rmtree(dynamic_test_index_store_dir)
+        os.makedirs(dynamic_test_index_store_dir)
+
+    def test_index_store_toy(self: 'TestIndexStore') -> None:
+        """
+        test per-entry saves give the same TSV as full rewrites,
+        and lookup by std_archive, version and job_id
+        :return: nothing
+        """
+        print("TestIndexStore:test_index_store_toy start", flush=True)
+        expected_file: str = os.path.join(dynamic_test_index_store_dir, "expected_index.tsv")
+        index_file: str = os.path.join(dynamic_test_index_store_dir, "pipline_index.tsv")
+        expected_list: List[StandardizedData] = make_toy_std_list()
+        expected_list[0].job_id = 'JOB-2'
+        expected_list[0].job_status = 'created'
+        expected_list.append(StandardizedData('b/b.zip', '2024', '', '', 'JOB-4', 'queued'))
+        write_std_pipeline_index(expected_file, expected_list)
+        std_list: List[StandardizedData] = make_toy_std_list()
+        store: PipelineIndexStore = PipelineIndexStore(index_file)
+        store.replace_entries(std_list)
+        self.assertEqual(4, store.count())
+        std_list[0].job_id = 'JOB-2'
+        std_list[0].job_status = 'created'
+        store.save_entry(std_list[0])
+        new_std: StandardizedData = StandardizedData('b/b.zip', '2024', '', '', 'JOB-4', 'queued')
+        store.save_entry(new_std)
+        self.assertIsNotNone(new_std.index_row)
+        self.assertEqual(5, store.count())
+        self.assertEqual(['JOB-1', 'JOB-3'], [my_std.job_id for my_std in store.find_entries('a/a.zip', '2024')])
+        found: List[StandardizedData] = store.find_entries('b/b.zip', '2024', 'JOB-2')
+        self.assertEqual(1, len(found))
+        self.assertEqual('created', found[0].job_status)
+        self.assertEqual(std_list[0].index_row, found[0].index_row)
+        self.assertEqual([], store.find_entries('b/b.zip', '2023'))
+        store.finish()
+        self.assertFalse(os.path.exists(get_index_store_file(index_file)))
+        self.assertEqual(read_text(expected_file), read_text(index_file))
+        print("TestIndexStore:test_index_store_toy done", flush=True)
+
+    def test_index_store_recover_toy(self: 'TestIndexStore') -> None:
+        """
+        test saves left in the store by an interrupted run are recovered into the TSV
+        :return: nothing
+        """
+        print("TestIndexStore:test_index_store_recover_toy start", flush=True)
+        index_file: str = os.path.join(dynamic_test_index_store_dir, "pipline_index.tsv")
+        std_list: List[StandardizedData] = make_toy_std_list()
+        write_std_pipeline_index(index_file, std_list)
+        store: PipelineIndexStore = PipelineIndexStore(index_file)
+        store.replace_entries(std_list)
+        # write_std_pipeline_index sorted std_list, so find the running correction job by id
+        running_std: StandardizedData = [my_std for my_std in std_list if 'JOB-3' == my_std.job_id][0]
+        running_std.job_status = 'succeeded'
+        store.save_entry(running_std)
+        # interrupted, TSV not exported
+        store.close()
+        self.assertEqual('running', read_std_pipeline_index(index_file)[1].job_status)
+        recover_std_pipeline_index(index_file)
+        recovered: List[StandardizedData] = read_std_pipeline_index(index_file)
+        self.assertEqual(['JOB-1', 'JOB-3', '', 'no-processing'], [my_std.job_id for my_std in recovered])
+        self.assertEqual('succeeded', recovered[1].job_status)
+        self.assertFalse(os.path.exists(f"{index_file}.tmp"))
+        print("TestIndexStore:test_index_store_recover_toy done", flush=True)
+
+    def test_archive_manifest_toy(self: 'TestIndexStore') -> None:
+        """
+        test unchanged archives are not opened again, and new or changed archives are
+        :return: nothing
+        """
+        print("TestIndexStore:test_archive_manifest_toy start", flush=True)
+        input_dir: str = os.path.join(dynamic_test_index_store_dir, "input")
+        index_file: str = os.path.join(dynamic_test_index_store_dir, "pipline_index.tsv")
+        zip_a: str = os.path.join(input_dir, "a", "a.zip")
+        zip_b: str = os.path.join(input_dir, "b", "b.zip")
+        make_toy_archive(zip_a, ['2024_01_01', '2024_02_01'])
+        make_toy_archive(zip_b, ['2024_01_01'])
+        std_list: List[StandardizedData] = build_std_pipeline_index(input_dir, index_file, True)
+        self.assertEqual([('a/a.zip', '2024_01_01'), ('a/a.zip', '2024_02_01'), ('b/b.zip', '2024_01_01')],
+                         [(my_std.std_archive, my_std.version) for my_std in std_list])
+        # same size and modification time, but no longer a ZIP: must come from the manifest
+        stat: os.stat_result = os.stat(zip_a)
+        with open(zip_a, 'wb') as out_file:
+            out_file.write(b'x' * stat.st_size)
+        os.utime(zip_a, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+        # changed and new archives are read
+        make_toy_archive(zip_b, ['2024_01_01', '2024_03_01'])
+        os.utime(zip_b, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1000000000))
+        make_toy_archive(os.path.join(input_dir, "c", "c.zip"), ['2023_12_01'])
+        std_list = build_std_pipeline_index(input_dir, index_file, True)
+        self.assertEqual([('a/a.zip', '2024_01_01'), ('a/a.zip', '2024_02_01'), ('b/b.zip', '2024_01_01'),
+                          ('b/b.zip', '2024_03_01'), ('c/c.zip', '2023_12_01')],
+                         [(my_std.std_archive, my_std.version) for my_std in std_list])
+        # removed archives are dropped from the manifest
+        os.remove(zip_a)
+        build_std_pipeline_index(input_dir, index_file, True)
+        with open(get_archive_manifest_file(index_file), 'r', encoding='utf-8') as in_file:
+            manifest: dict = json.load(in_file)
+        self.assertEqual(['b/b.zip', 'c/c.zip'], sorted(manifest['archives'].keys()))
+        self.assertEqual(['2024_01_01', '2024_03_01'], manifest['archives']['b/b.zip']['versions'])
+        # checking without the write flag writes neither index nor manifest
+        make_toy_archive(os.path.join(input_dir, "d", "d.zip"), ['2023_11_01'])
+        written: List[int] = [os.stat(index_file).st_mtime_ns, os.stat(get_archive_manifest_file(index_file)).st_mtime_ns]
+        std_list = build_std_pipeline_index(input_dir, index_file, False)
+        self.assertIn(('d/d.zip', '2023_11_01'), [(my_std.std_archive, my_std.version) for my_std in std_list])
+        self.assertEqual(written, [os.stat(index_file).st_mtime_ns, os.stat(get_archive_manifest_file(index_file)).st_mtime_ns])
+        print("TestIndexStore:test_archive_manifest_toy done", flush=True)
+
+    def test_matrix_probe_toy(self: 'TestIndexStore') -> None:
+        """
+        test matrix probe results, and that cached results are reused until the archive changes
+        :return: nothing
+        """
+        print("TestIndexStore:test_matrix_probe_toy start", flush=True)
+        input_dir: str = os.path.join(dynamic_test_index_store_dir, "input")
+        manifest_file: str = os.path.join(dynamic_test_index_store_dir, "manifest.json")
+        zip_a: str = os.path.join(input_dir, "a", "a.zip")
+        big: str = "Gene\tS1\tS2\tS3\n" + "".join([f"F{index}\t1\t2\t3\n" for index in range(100)])
+        make_toy_archive(zip_a, ['V1', 'V2', 'V3'], {'V1': big, 'V2': "Gene\tS1\tS2\nF1\t1\t2\n\n"})
+        manifest: Dict[str, dict] = {}
+        results: List[dict] = [StandardizedData('a/a.zip', my_version, '', '', '', '').probe_valid_data(input_dir, manifest)
+                               for my_version in ['V1', 'V2', 'V3']]
+        self.assertEqual([{'valid': True, 'samples': 3, 'features': None},
+                          {'valid': False, 'samples': 2, 'features': 1},
+                          {'valid': False, 'samples': None, 'features': None}], results)
+        write_archive_manifest(manifest_file, manifest)
+        # same size and modification time, but no longer a ZIP: must come from the manifest
+        stat: os.stat_result = os.stat(zip_a)
+        with open(zip_a, 'wb') as out_file:
+            out_file.write(b'x' * stat.st_size)
+        os.utime(zip_a, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+        manifest = read_archive_manifest(manifest_file)
+        self.assertTrue(StandardizedData('a/a.zip', 'V1', '', '', '', '').has_valid_data_p(input_dir, manifest))
+        self.assertFalse(StandardizedData('a/a.zip', 'V2', '', '', '', '').has_valid_data_p(input_dir, manifest))
+        # changed archive is probed again
+        make_toy_archive(zip_a, ['V1', 'V2'], {'V2': big})
+        self.assertFalse(StandardizedData('a/a.zip', 'V1', '', '', '', '').has_valid_data_p(input_dir, manifest))
+        self.assertTrue(StandardizedData('a/a.zip', 'V2', '', '', '', '').has_valid_data_p(input_dir, manifest))
+        self.assertEqual(['V1', 'V2'], manifest['a/a.zip']['versions'])
+        print("TestIndexStore:test_matrix_probe_toy done", flush=True)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -23,7 +23,10 @@ MD Anderson Cancer Center Bioinformatics at MDA <https://www.mdanderson.org/rese
 import unittest
 import shutil
 import os
+import zipfile
+from typing import List, Tuple
 from mbatch.pipeline.job import copy_json_original_files
+from mbatch.test.common import copy_archive_file_to_regular, stage_archive_files
 from mbatch.index.index_original_data import read_json_original_data
 
 
@@ -82,6 +85,49 @@ class TestJob(unittest.TestCase):
         """
         print("test_process_copy_original_data", flush=True)
         copy_original_data_wrapper(dynamic_test_job_dir, static_test_job_dir)
+
+    def test_stage_archive_files_toy(self: 'TestJob') -> None:
+        """
+        test staging from one open of the archive matches copying file by file,
+        and duplicates are independent files
+        :return: nothing
+        """
+        print("test_stage_archive_files_toy", flush=True)
+        stage_dir: str = os.path.join(dynamic_test_job_dir, "stage")
+        if os.path.exists(stage_dir):
+            shutil.rmtree(stage_dir)
+        os.makedirs(stage_dir)
+        zip_path: str = os.path.join(stage_dir, "std.zip")
+        matrix: bytes = b"Gene\tS1\tS2\n" + b"".join([f"F{index}\t{index}\t{index * 2}\n".encode('utf-8') for index in range(5000)])
+        batches: bytes = b"Sample\tBatch\nS1\tA\nS2\tB\n"
+        with zipfile.ZipFile(zip_path, 'w', zipfile.ZIP_DEFLATED) as zip_file:
+            zip_file.writestr("versions/DATA_V1/matrix.tsv", matrix)
+            zip_file.writestr("versions/DATA_V1/batches.tsv", batches)
+        copies: List[Tuple[str, List[str]]] = [
+            ("versions/DATA_V1/matrix.tsv", [os.path.join(stage_dir, "matrix_data.tsv"), os.path.join(stage_dir, "original_matrix_data.tsv")]),
+            ("versions/DATA_V1/clinical.tsv", [os.path.join(stage_dir, "clinical.tsv"), os.path.join(stage_dir, "original_clinical.tsv")]),
+            ("versions/DATA_V1/batches.tsv", [os.path.join(stage_dir, "original_batches.tsv")])
+        ]
+        staged_bytes: int
+        staged_seconds: float
+        staged_bytes, staged_seconds = stage_archive_files(zip_path, copies)
+        self.assertEqual(len(matrix) * 2 + len(batches), staged_bytes)
+        self.assertGreaterEqual(staged_seconds, 0.0)
+        self.assertFalse(os.path.exists(os.path.join(stage_dir, "clinical.tsv")))
+        my_name: str
+        for my_name in ["matrix_data.tsv", "original_matrix_data.tsv", "original_batches.tsv"]:
+            internal: str = "versions/DATA_V1/batches.tsv" if "batches" in my_name else "versions/DATA_V1/matrix.tsv"
+            expected_file: str = os.path.join(stage_dir, f"expected_{my_name}")
+            copy_archive_file_to_regular(zip_path, internal, expected_file)
+            with open(expected_file, 'rb') as in_file:
+                expected: bytes = in_file.read()
+            with open(os.path.join(stage_dir, my_name), 'rb') as in_file:
+                self.assertEqual(expected, in_file.read())
+        # rewriting the working copy in place leaves the original copy alone
+        with open(os.path.join(stage_dir, "matrix_data.tsv"), 'wb') as out_file:
+            out_file.write(b"changed\n")
+        with open(os.path.join(stage_dir, "original_matrix_data.tsv"), 'rb') as in_file:
+            self.assertEqual(matrix, in_file.read())
 # pylint: enable=too-many-instance-attributes
 
 
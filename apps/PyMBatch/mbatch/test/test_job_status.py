@@ -0,0 +1,197 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Copyright (c) 2011-2024 University of Texas MD Anderson Cancer Center
+
+This program is free software: you can redistribute it and/or modify it under the terms of the
+GNU General Public License as published by the Free Software Foundation, either version 2 of
+the License, or (at your option) any later version.
+
+This program is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY;
+without even the implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+See the GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License along with this program.
+If not, see <https://www.gnu.org/licenses/>.
+
+MD Anderson Cancer Center Bioinformatics on GitHub <https://github.com/MD-Anderson-Bioinformatics>
+MD Anderson Cancer Center Bioinformatics at MDA <https://www.mdanderson.org/research/departments-labs-institutes/departments-divisions/bioinformatics-and-computational-biology.html>
+@author: Tod Casasent
+"""
+
+
+import unittest
+import threading
+import time
+import json
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+from typing import Dict, List, Union
+from mbatch.pipeline.std_data import StandardizedData, JobStatusError
+from mbatch.pipeline.job_status import poll_job_status, RateLimiter
+
+
+# BEI status strings returned by the stand-in server, by job id
+# JOB-ERROR is not listed, and returns HTTP 500
+toy_bei_statuses: Dict[str, str] = {
+    'JOB-RUN': 'MBATCHRUN_RUNNING_WAIT',
+    'JOB-OK': 'MBATCHRUN_END_SUCCESS',
+    'JOB-DONE': 'MBATCHRUN_END_COMPLETED',
+    'JOB-FAIL': 'MBATCHRUN_END_FAILURE',
+    'JOB-SAME': 'MBATCHRUN_RUNNING_WAIT'
+}
+
+
+class ToyBeiHandler(BaseHTTPRequestHandler):
+    """
+    Stand-in for the BEI JOBstatus endpoint, recording the job ids requested
+    and the most requests in progress at once
+    """
+    requested: List[str] = []
+    in_flight: int = 0
+    peak_in_flight: int = 0
+    lock: threading.Lock = threading.Lock()
+
+    # pylint: disable=invalid-name
+    def do_GET(self: 'ToyBeiHandler') -> None:
+        """
+        answer JOBstatus requests from toy_bei_statuses
+        :return: nothing
+        """
+        job_id: str = parse_qs(urlparse(self.path).query)['jobId'][0]
+        with ToyBeiHandler.lock:
+            ToyBeiHandler.requested.append(job_id)
+            ToyBeiHandler.in_flight += 1
+            ToyBeiHandler.peak_in_flight = max(ToyBeiHandler.peak_in_flight, ToyBeiHandler.in_flight)
+        # slow enough that concurrent requests overlap
+        time.sleep(0.05)
+        with ToyBeiHandler.lock:
+            ToyBeiHandler.in_flight -= 1
+        if job_id in toy_bei_statuses:
+            body: bytes = json.dumps({'status': toy_bei_statuses[job_id]}).encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        else:
+            self.send_error(500)
+
+    # pylint: disable=redefined-builtin
+    def log_message(self: 'ToyBeiHandler', format: str, *args) -> None:
+        """
+        keep test output quiet
+        :return: nothing
+        """
+
+
+def make_toy_std_list() -> List[StandardizedData]:
+    """
+    Build pipeline index entries covering each job state
+    :return: list of StandardizedData
+    """
+    return [
+        StandardizedData('a.zip', '2024', '', '', 'JOB-RUN', 'queued'),
+        StandardizedData('b.zip', '2024', '', '', 'JOB-OK', 'running'),
+        StandardizedData('c.zip', '2024', '', '', 'JOB-DONE', 'created'),
+        StandardizedData('d.zip', '2024', '', '', 'JOB-FAIL', 'running'),
+        StandardizedData('e.zip', '2024', '', '', 'JOB-SAME', 'running'),
+        StandardizedData('f.zip', '2024', '', '', 'JOB-FINISHED', 'succeeded'),
+        StandardizedData('g.zip', '2024', '', '', 'no-processing', 'no-processing'),
+        StandardizedData('h.zip', '2024', '', '', '', '')
+    ]
+
+
+class TestJobStatus(unittest.TestCase):
+    """
+    Class for testing concurrent BEI job status polling against a local stand-in BEI server
+    """
+    # do not set method variables, as they should be initialized in the init function
+    # No local method variables
+    server: ThreadingHTTPServer
+    thread: threading.Thread
+    url: str
+
+    def setUp(self: 'TestJobStatus') -> None:
+        """
+        start stand-in BEI server on a free local port
+        :return:
+        """
+        ToyBeiHandler.requested = []
+        ToyBeiHandler.in_flight = 0
+        ToyBeiHandler.peak_in_flight = 0
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), ToyBeiHandler)
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}/BEI/"
+        print(f"TestJobStatus::setUp url={self.url}", flush=True)
+
+    def tearDown(self: 'TestJobStatus') -> None:
+        """
+        stop stand-in BEI server
+        :return:
+        """
+        self.server.shutdown()
+        self.server.server_close()
+        self.thread.join()
+
+    def test_job_status_poll_toy(self: 'TestJobStatus') -> None:
+        """
+        test concurrent polling gives the same transitions as serial status_job calls,
+        and only unfinished jobs are requested
+        :return: nothing
+        """
+        print("TestJobStatus:test_job_status_poll_toy start", flush=True)
+        serial_list: List[StandardizedData] = make_toy_std_list()
+        serial_changed: List[bool] = [my_std.status_job(self.url) for my_std in serial_list[:5]]
+        self.assertEqual([True, True, True, True, False], serial_changed)
+        # serial calls never overlap
+        self.assertEqual(1, ToyBeiHandler.peak_in_flight)
+        ToyBeiHandler.requested = []
+        poll_list: List[StandardizedData] = make_toy_std_list()
+        statuses: Dict[str, Union[str, Exception]] = poll_job_status(poll_list, self.url, 5)
+        self.assertEqual(['JOB-DONE', 'JOB-FAIL', 'JOB-OK', 'JOB-RUN', 'JOB-SAME'], sorted(ToyBeiHandler.requested))
+        self.assertGreater(ToyBeiHandler.peak_in_flight, 1, "Polled requests did not overlap")
+        poll_changed: List[bool] = [my_std.status_job(self.url, statuses) for my_std in poll_list[:6]]
+        self.assertEqual(serial_changed + [False], poll_changed)
+        self.assertEqual([my_std.job_status for my_std in serial_list], [my_std.job_status for my_std in poll_list])
+        self.assertEqual(['running', 'succeeded', 'succeeded', 'failed', 'running'],
+                         [my_std.job_status for my_std in poll_list[:5]])
+        # no further requests were made when applying the polled statuses
+        self.assertEqual(5, len(ToyBeiHandler.requested))
+        print("TestJobStatus:test_job_status_poll_toy done", flush=True)
+
+    def test_job_status_error_toy(self: 'TestJobStatus') -> None:
+        """
+        test a failed status request is raised only when that entry is applied
+        :return: nothing
+        """
+        print("TestJobStatus:test_job_status_error_toy start", flush=True)
+        poll_list: List[StandardizedData] = [
+            StandardizedData('a.zip', '2024', '', '', 'JOB-OK', 'running'),
+            StandardizedData('b.zip', '2024', '', '', 'JOB-ERROR', 'running')
+        ]
+        statuses: Dict[str, Union[str, Exception]] = poll_job_status(poll_list, self.url, 2)
+        self.assertTrue(poll_list[0].status_job(self.url, statuses))
+        with self.assertRaises(JobStatusError):
+            poll_list[1].status_job(self.url, statuses)
+        self.assertEqual('running', poll_list[1].job_status)
+        print("TestJobStatus:test_job_status_error_toy done", flush=True)
+
+    def test_job_status_rate_toy(self: 'TestJobStatus') -> None:
+        """
+        test rate limiter spaces requests
+        :return: nothing
+        """
+        print("TestJobStatus:test_job_status_rate_toy start", flush=True)
+        limiter: RateLimiter = RateLimiter(20.0)
+        start: float = time.monotonic()
+        for _ in range(5):
+            limiter.wait()
+        # first request is immediate, the other four are 0.05 seconds apart
+        self.assertGreaterEqual(time.monotonic() - start, 0.19)
+        print("TestJobStatus:test_job_status_rate_toy done", flush=True)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -104,7 +104,7 @@ class TestPls(unittest.TestCase):
         mydata: StdData = StdData()
         mydata.read_matrix_data(the_matrix)
         mydata.read_batches_data(the_batches)
-        my_batch_list: numpy.ndarray = mydata.get_batch_data_for_column('ShipDate')
+        my_batch_list: numpy.ndarray = mydata.get_batch_strings_for_column('ShipDate')
         pls_decomp = pls_calc(mydata.m_matrix, my_batch_list)
         print(pls_decomp, flush=True)
         # result: PlsInfo = pls_calc(mydata.m_matrix, my_batch_list)
@@ -0,0 +1,193 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Copyright (c) 2011-2024 University of Texas MD Anderson Cancer Center
+
+This program is free software: you can redistribute it and/or modify it under the terms of the
+GNU General Public License as published by the Free Software Foundation, either version 2 of
+the License, or (at your option) any later version.
+
+This program is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY;
+without even the implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+See the GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License along with this program.
+If not, see <https://www.gnu.org/licenses/>.
+
+MD Anderson Cancer Center Bioinformatics on GitHub <https://github.com/MD-Anderson-Bioinformatics>
+MD Anderson Cancer Center Bioinformatics at MDA <https://www.mdanderson.org/research/departments-labs-institutes/departments-divisions/bioinformatics-and-computational-biology.html>
+@author: Tod Casasent
+"""
+
+
+import unittest
+import shutil
+import os
+import time
+import zipfile
+import pandas
+import numpy
+from mbatch.stddata.stddata import StdData, get_sidecar_dir
+
+
+dynamic_test_stddata_dir: str = "/BEA/BatchEffectsPackage_data/testing_dynamic/PyMBatch/stddata"
+
+
+def make_toy_matrix_file(the_file: str) -> pandas.DataFrame:
+    """
+    Write a small matrix file, with rows and columns out of order
+    :param the_file: full path to matrix file to write
+    :return: matrix written
+    """
+    rng: numpy.random.Generator = numpy.random.default_rng(314)
+    my_matrix: pandas.DataFrame = pandas.DataFrame(rng.normal(size=(6, 5)),
+                                                   index=['F6', 'F2', 'F4', 'F1', 'F5', 'F3'],
+                                                   columns=['S3', 'S1', 'S5', 'S2', 'S4'])
+    my_matrix.iloc[2, 3] = numpy.nan
+    my_matrix.to_csv(the_file, sep='\t', encoding='utf-8')
+    return my_matrix
+
+
+class TestStdData(unittest.TestCase):
+    """
+    Class for setting up StdData testing - clear/make directory for output
+    """
+    # do not set method variables, as they should be initialized in the init function
+    # No local method variables
+
+    def setUp(self: 'TestStdData') -> None:
+        """
+        setup script to clear and re-populate test directory
+        :return:
+        """
+        print(f"TestStdData::setUp dynamic_test_dir={dynamic_test_stddata_dir}", flush=True)
+        if os.path.exists(dynamic_test_stddata_dir):
+            shutil.rmtree(dynamic_test_stddata_dir)
+        os.makedirs(dynamic_test_stddata_dir)
+
+    def test_stddata_sidecar_toy(self: 'TestStdData') -> None:
+        """
+        test matrix loaded from binary sidecar matches matrix read from TSV,
+        and that a changed matrix file is read again
+        :return: nothing
+        """
+        print("TestStdData:test_stddata_sidecar_toy start", flush=True)
+        matrix_file: str = os.path.join(dynamic_test_stddata_dir, "matrix_data.tsv")
+        make_toy_matrix_file(matrix_file)
+        expected: StdData = StdData()
+        expected.read_matrix_data(matrix_file)
+        self.assertEqual(['S1', 'S2', 'S3', 'S4', 'S5'], expected.m_samples.tolist())
+        self.assertEqual(['F1', 'F2', 'F3', 'F4', 'F5', 'F6'], expected.m_features.tolist())
+        self.assertFalse(os.path.exists(get_sidecar_dir(matrix_file)), "Sidecar written without flag")
+        written: StdData = StdData()
+        written.read_matrix_data(matrix_file, True)
+        self.assertTrue(os.path.exists(get_sidecar_dir(matrix_file)), "Sidecar not written")
+        loaded: StdData = StdData()
+        self.assertTrue(loaded.read_matrix_sidecar(matrix_file), "Sidecar not used")
+        self.assertIsInstance(loaded.m_matrix, numpy.memmap)
+        self.assertTrue(numpy.array_equal(expected.m_matrix, loaded.m_matrix, equal_nan=True))
+        self.assertTrue(numpy.array_equal(expected.m_samples, loaded.m_samples))
+        self.assertTrue(numpy.array_equal(expected.m_features, loaded.m_features))
+        # changed source file is not loaded from old sidecar
+        time.sleep(0.01)
+        changed: pandas.DataFrame = make_toy_matrix_file(matrix_file) * 2.0
+        changed.to_csv(matrix_file, sep='\t', encoding='utf-8')
+        self.assertFalse(StdData().read_matrix_sidecar(matrix_file), "Out of date sidecar used")
+        reread: StdData = StdData()
+        reread.read_matrix_data(matrix_file, True)
+        self.assertTrue(numpy.allclose(expected.m_matrix * 2.0, reread.m_matrix, equal_nan=True))
+        print("TestStdData:test_stddata_sidecar_toy done", flush=True)
+
+    def test_stddata_batch_codes_toy(self: 'TestStdData') -> None:
+        """
+        test batches read from file are integer coded, with string batch ids still available
+        :return: nothing
+        """
+        print("TestStdData:test_stddata_batch_codes_toy start", flush=True)
+        batches_file: str = os.path.join(dynamic_test_stddata_dir, "batches.tsv")
+        my_batches: pandas.DataFrame = pandas.DataFrame({'Sample': ['S3', 'S1', 'S5', 'S2', 'S4'],
+                                                         'Plate': ['p2', 'p1', 'p2', 'p3', 'p1'],
+                                                         'Site': ['b', 'a', 'b', 'a', 'b']})
+        my_batches.to_csv(batches_file, sep='\t', encoding='utf-8', index=False)
+        mydata: StdData = StdData()
+        mydata.read_batches_data(batches_file)
+        self.assertEqual(['Sample', 'Plate', 'Site'], mydata.m_columns.tolist())
+        codes: numpy.ndarray = mydata.get_batch_data_for_column('Plate')
+        self.assertEqual(numpy.int32, codes.dtype)
+        # rows sorted by sample, levels sorted
+        self.assertEqual([0, 2, 1, 0, 1], codes.tolist())
+        self.assertEqual(['p1', 'p2', 'p3'], mydata.get_batch_levels_for_column('Plate').tolist())
+        self.assertEqual(['p1', 'p3', 'p2', 'p1', 'p2'], mydata.get_batch_strings_for_column('Plate').tolist())
+        self.assertEqual(['a', 'a', 'b', 'b', 'b'], mydata.get_batch_strings_for_column('Site').tolist())
+        self.assertEqual([['p1', 'a'], ['p3', 'a'], ['p2', 'b'], ['p1', 'b'], ['p2', 'b']], mydata.m_batches.tolist())
+        print("TestStdData:test_stddata_batch_codes_toy done", flush=True)
+
+    def test_stddata_archive_toy(self: 'TestStdData') -> None:
+        """
+        test StdData read from ZIP archive matches StdData read from extracted files
+        :return: nothing
+        """
+        print("TestStdData:test_stddata_archive_toy start", flush=True)
+        matrix_file: str = os.path.join(dynamic_test_stddata_dir, "matrix.tsv")
+        batches_file: str = os.path.join(dynamic_test_stddata_dir, "batches.tsv")
+        make_toy_matrix_file(matrix_file)
+        my_batches: pandas.DataFrame = pandas.DataFrame({'Sample': ['S3', 'S1', 'S5', 'S2', 'S4'],
+                                                         'Plate': ['p2', 'p1', 'p2', 'p3', 'p1']})
+        my_batches.to_csv(batches_file, sep='\t', encoding='utf-8', index=False)
+        zip_path: str = os.path.join(dynamic_test_stddata_dir, "archive.zip")
+        zip_file: zipfile.ZipFile
+        with zipfile.ZipFile(zip_path, 'w', zipfile.ZIP_DEFLATED) as zip_file:
+            zip_file.write(matrix_file, "versions/DATA_2024-01-01-0000/matrix.tsv")
+            zip_file.write(batches_file, "versions/DATA_2024-01-01-0000/batches.tsv")
+        expected: StdData = StdData()
+        expected.read_matrix_data(matrix_file)
+        expected.read_batches_data(batches_file)
+        # blocks smaller than the matrix
+        actual: StdData = StdData.from_archive(zip_path, "2024-01-01-0000", the_block_rows=4)
+        self.assertEqual(numpy.float64, actual.m_matrix.dtype)
+        self.assertTrue(numpy.array_equal(expected.m_matrix, actual.m_matrix, equal_nan=True))
+        self.assertTrue(numpy.array_equal(expected.m_samples, actual.m_samples))
+        self.assertTrue(numpy.array_equal(expected.m_features, actual.m_features))
+        self.assertTrue(numpy.array_equal(expected.m_columns, actual.m_columns))
+        self.assertTrue(numpy.array_equal(expected.m_batch_codes, actual.m_batch_codes))
+        self.assertTrue(numpy.array_equal(expected.get_batch_strings_for_column('Plate'), actual.get_batch_strings_for_column('Plate')))
+        single: StdData = StdData.from_archive(zip_path, "2024-01-01-0000", True)
+        self.assertEqual(numpy.float32, single.m_matrix.dtype)
+        self.assertTrue(numpy.allclose(expected.m_matrix, single.m_matrix, rtol=1e-6, equal_nan=True))
+        print("TestStdData:test_stddata_archive_toy done", flush=True)
+
+    def test_stddata_archive_numeric_toy(self: 'TestStdData') -> None:
+        """
+        test StdData read from ZIP archive matches extracted files with numeric feature ids
+        (sorted as numbers) and NA or empty batch values
+        :return: nothing
+        """
+        print("TestStdData:test_stddata_archive_numeric_toy start", flush=True)
+        matrix_file: str = os.path.join(dynamic_test_stddata_dir, "matrix.tsv")
+        batches_file: str = os.path.join(dynamic_test_stddata_dir, "batches.tsv")
+        with open(matrix_file, 'w', encoding='utf-8') as out_file:
+            out_file.write("\tS2\tS1\n10\t1.5\t2.5\n9\t3.5\t4.5\n100\t5.5\t6.5\n")
+        with open(batches_file, 'w', encoding='utf-8') as out_file:
+            out_file.write("Sample\tPlate\tCenter\nS2\tNA\tc1\nS1\tp1\t\n")
+        zip_path: str = os.path.join(dynamic_test_stddata_dir, "archive.zip")
+        zip_file: zipfile.ZipFile
+        with zipfile.ZipFile(zip_path, 'w', zipfile.ZIP_DEFLATED) as zip_file:
+            zip_file.write(matrix_file, "versions/DATA_2024-01-01-0000/matrix.tsv")
+            zip_file.write(batches_file, "versions/DATA_2024-01-01-0000/batches.tsv")
+        expected: StdData = StdData()
+        expected.read_matrix_data(matrix_file)
+        expected.read_batches_data(batches_file)
+        actual: StdData = StdData.from_archive(zip_path, "2024-01-01-0000", the_block_rows=2)
+        self.assertEqual(['9', '10', '100'], expected.m_features.tolist())
+        self.assertTrue(numpy.array_equal(expected.m_features, actual.m_features))
+        self.assertTrue(numpy.array_equal(expected.m_samples, actual.m_samples))
+        self.assertTrue(numpy.array_equal(expected.m_matrix, actual.m_matrix))
+        self.assertTrue(numpy.array_equal(expected.m_columns, actual.m_columns))
+        self.assertEqual(['p1', 'nan'], actual.get_batch_strings_for_column('Plate').tolist())
+        self.assertTrue(numpy.array_equal(expected.get_batch_strings_for_column('Plate'), actual.get_batch_strings_for_column('Plate')))
+        self.assertTrue(numpy.array_equal(expected.get_batch_strings_for_column('Center'), actual.get_batch_strings_for_column('Center')))
+        print("TestStdData:test_stddata_archive_numeric_toy done", flush=True)
+
+
+if __name__ == '__main__':
+    unittest.main()
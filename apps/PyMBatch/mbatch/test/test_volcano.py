@@ -20,7 +20,7 @@ MD Anderson Cancer Center Bioinformatics at MDA <https://www.mdanderson.org/rese
 """
 
 
-from typing import List
+from typing import List, Dict, Tuple
 import unittest
 import os
 import shutil
@@ -28,7 +28,11 @@ import csv
 import pandas
 import numpy
 import scanpy
-from mbatch.volcano.api import volcano_calc_plot
+from mbatch.volcano.api import volcano_calc_plot, volcano_calc_cached
+from mbatch.volcano.calc import volcano_calc, read_volcano_data, VolcanoData
+from mbatch.volcano.plot import volcano_data, volcano_data_filename, volcano_plot_obj, VolcanoRenderer
+from mbatch.index.index_entry import find_volcano_data_file
+from mbatch.test.common import generate_file_md5
 
 
 dynamic_test_volcano_dir: str = "/BEA/BatchEffectsPackage_data/testing_dynamic/PyMBatch/volcano"
@@ -36,6 +40,29 @@ dynamic_test_volcano_onebatch_dir: str = "/BEA/BatchEffectsPackage_data/testing_
 dynamic_test_volcano_ov_dir: str = "/BEA/BatchEffectsPackage_data/testing_dynamic/PyMBatch/volcano_ov"
 dynamic_test_volcano_tumor_dir_linear: str = "/BEA/BatchEffectsPackage_data/testing_dynamic/PyMBatch/volcano_tumor_linear"
 dynamic_test_volcano_tumor_dir_logframe: str = "/BEA/BatchEffectsPackage_data/testing_dynamic/PyMBatch/volcano_tumor_logframe"
+dynamic_test_volcano_parallel_dir: str = "/BEA/BatchEffectsPackage_data/testing_dynamic/PyMBatch/volcano_parallel"
+dynamic_test_volcano_format_dir: str = "/BEA/BatchEffectsPackage_data/testing_dynamic/PyMBatch/volcano_format"
+dynamic_test_volcano_render_dir: str = "/BEA/BatchEffectsPackage_data/testing_dynamic/PyMBatch/volcano_render"
+dynamic_test_volcano_cache_dir: str = "/BEA/BatchEffectsPackage_data/testing_dynamic/PyMBatch/volcano_cache"
+
+
+def make_toy_volcano() -> Tuple[pandas.DataFrame, pandas.DataFrame]:
+    """
+    Make a small matrix and batches for volcano tests, with all zero, NaN, infinite, and constant rows
+    :return: tuple of matrix (features x samples) and batches (Sample plus two batch types)
+    """
+    random_num: numpy.random.Generator = numpy.random.default_rng(314)
+    samples: List[str] = [f"S{index:02d}" for index in range(30)]
+    values: numpy.ndarray = numpy.abs(random_num.normal(size=(40, 30))) * 5.0
+    values[0:4, :] = 0.0
+    values[4:8, 0:15] = numpy.nan
+    values[8:10, 3] = numpy.inf
+    values[10:12, :] = 2.0
+    my_matrix: pandas.DataFrame = pandas.DataFrame(values, index=[f"F{index:02d}" for index in range(40)], columns=samples)
+    my_batches: pandas.DataFrame = pandas.DataFrame({'Sample': samples,
+                                                     'Toy': random_num.choice(['x', 'y', 'z'], 30),
+                                                     'Plate': [f"P{index % 7}" for index in range(30)]})
+    return my_matrix, my_batches
 
 
 # pylint: disable=too-many-instance-attributes
@@ -78,6 +105,26 @@ class TestVolcano(unittest.TestCase):
             if os.path.exists(dynamic_test_volcano_tumor_dir_logframe):
                 shutil.rmtree(dynamic_test_volcano_tumor_dir_logframe)
             os.makedirs(dynamic_test_volcano_tumor_dir_logframe)
+        if self._testMethodName == 'test_volcano_parallel_toy':
+            print(f"TestJob::setUp dynamic_test_dir={dynamic_test_volcano_parallel_dir}", flush=True)
+            if os.path.exists(dynamic_test_volcano_parallel_dir):
+                shutil.rmtree(dynamic_test_volcano_parallel_dir)
+            os.makedirs(dynamic_test_volcano_parallel_dir)
+        if self._testMethodName == 'test_volcano_format_toy':
+            print(f"TestJob::setUp dynamic_test_dir={dynamic_test_volcano_format_dir}", flush=True)
+            if os.path.exists(dynamic_test_volcano_format_dir):
+                shutil.rmtree(dynamic_test_volcano_format_dir)
+            os.makedirs(dynamic_test_volcano_format_dir)
+        if self._testMethodName == 'test_volcano_render_toy':
+            print(f"TestJob::setUp dynamic_test_dir={dynamic_test_volcano_render_dir}", flush=True)
+            if os.path.exists(dynamic_test_volcano_render_dir):
+                shutil.rmtree(dynamic_test_volcano_render_dir)
+            os.makedirs(dynamic_test_volcano_render_dir)
+        if self._testMethodName == 'test_volcano_cache_toy':
+            print(f"TestJob::setUp dynamic_test_dir={dynamic_test_volcano_cache_dir}", flush=True)
+            if os.path.exists(dynamic_test_volcano_cache_dir):
+                shutil.rmtree(dynamic_test_volcano_cache_dir)
+            os.makedirs(dynamic_test_volcano_cache_dir)
         #############################
         print("TestVolcano:setUp done", flush=True)
 
@@ -205,6 +252,189 @@ class TestVolcano(unittest.TestCase):
         volcano_calc_plot("Example Title", sample_id_col, my_matrix, my_batches, ['TSS', 'BatchId'],
                           dynamic_test_volcano_tumor_dir_logframe, True)
         print("TestVolcano:test_volcano_tumor_calc_logframe done", flush=True)
+
+    def test_volcano_engine_toy(self: 'TestVolcano') -> None:
+        """
+        test the vector engine gives the same results as the loop engine
+        (rows with NaN are summed in a different order, so p-values can differ in the last bits)
+        :return: nothing
+        """
+        print("TestVolcano:test_volcano_engine_toy start", flush=True)
+        my_matrix: pandas.DataFrame
+        my_batches: pandas.DataFrame
+        my_matrix, my_batches = make_toy_volcano()
+        log_flag: bool
+        for log_flag in [True, False]:
+            loop_list: List[VolcanoData] = volcano_calc('Sample', my_matrix.copy(), my_batches, log_flag, 'loop')
+            vector_list: List[VolcanoData] = volcano_calc('Sample', my_matrix.copy(), my_batches, log_flag, 'vector')
+            self.assertEqual(len(loop_list), len(vector_list))
+            loop_data: VolcanoData
+            vector_data: VolcanoData
+            for loop_data, vector_data in zip(loop_list, vector_list):
+                self.assertEqual(loop_data.m_batch_a, vector_data.m_batch_a)
+                self.assertTrue(numpy.allclose(numpy.array(loop_data.m_pvalues, dtype=float), vector_data.m_pvalues, rtol=1e-12, atol=0.0))
+                self.assertTrue(numpy.allclose(numpy.array(loop_data.m_trans_pvalues, dtype=float), vector_data.m_trans_pvalues, rtol=1e-12, atol=1e-12))
+                self.assertTrue(numpy.array_equal(loop_data.m_fold_change, vector_data.m_fold_change, equal_nan=True))
+        print("TestVolcano:test_volcano_engine_toy done", flush=True)
+
+    def test_volcano_stats_toy(self: 'TestVolcano') -> None:
+        """
+        test the stats engine (rest of samples from totals) is close to the vector engine
+        :return: nothing
+        """
+        print("TestVolcano:test_volcano_stats_toy start", flush=True)
+        my_matrix: pandas.DataFrame
+        my_batches: pandas.DataFrame
+        my_matrix, my_batches = make_toy_volcano()
+        log_flag: bool
+        for log_flag in [True, False]:
+            vector_list: List[VolcanoData] = volcano_calc('Sample', my_matrix.copy(), my_batches, log_flag, 'vector')
+            stats_list: List[VolcanoData] = volcano_calc('Sample', my_matrix.copy(), my_batches, log_flag, 'stats')
+            self.assertEqual(len(vector_list), len(stats_list))
+            vector_data: VolcanoData
+            stats_data: VolcanoData
+            for vector_data, stats_data in zip(vector_list, stats_list):
+                self.assertEqual(vector_data.m_batch_a, stats_data.m_batch_a)
+                self.assertTrue(numpy.allclose(vector_data.m_pvalues, stats_data.m_pvalues, rtol=1e-6, atol=1e-12))
+                self.assertTrue(numpy.allclose(vector_data.m_fold_change, stats_data.m_fold_change, equal_nan=True))
+        print("TestVolcano:test_volcano_stats_toy done", flush=True)
+
+    def test_volcano_parallel_toy(self: 'TestVolcano') -> None:
+        """
+        test parallel volcano_calc_plot writes the same files as serial
+        :return: nothing
+        """
+        print("TestVolcano:test_volcano_parallel_toy start", flush=True)
+        my_matrix: pandas.DataFrame
+        my_batches: pandas.DataFrame
+        my_matrix, my_batches = make_toy_volcano()
+        md5_by_workers: List[Dict[str, str]] = []
+        workers: int
+        for workers in [1, 3]:
+            out_dir: str = os.path.join(dynamic_test_volcano_parallel_dir, f"workers_{workers}")
+            # 'Missing' batch type is not in batches, and gets error.log
+            volcano_calc_plot("Example Title", 'Sample', my_matrix.copy(), my_batches, ['Toy', 'Plate', 'Missing'],
+                              out_dir, False, the_workers=workers)
+            md5_dict: Dict[str, str] = {}
+            for root, _, files in os.walk(out_dir):
+                for file_name in files:
+                    md5_dict[os.path.relpath(os.path.join(root, file_name), out_dir)] = generate_file_md5(os.path.join(root, file_name))
+            md5_by_workers.append(md5_dict)
+        self.assertTrue(len(md5_by_workers[0]) > 0, "No files written")
+        self.assertEqual(md5_by_workers[0], md5_by_workers[1], "Parallel output differs from serial")
+        print("TestVolcano:test_volcano_parallel_toy done", flush=True)
+
+    def test_volcano_format_toy(self: 'TestVolcano') -> None:
+        """
+        test compact volcano data files read back the same values as the original JSON,
+        and that the index finds the compact file
+        :return: nothing
+        """
+        print("TestVolcano:test_volcano_format_toy start", flush=True)
+        my_matrix: pandas.DataFrame
+        my_batches: pandas.DataFrame
+        my_matrix, my_batches = make_toy_volcano()
+        data_list: List[VolcanoData] = volcano_calc('Sample', my_matrix, my_batches, False, 'vector')
+        my_entry: VolcanoData = [entry for entry in data_list if 'Toy' == entry.m_batch_type][0]
+        data_format: str
+        gzip_flag: bool
+        for data_format in ['json', 'columns', 'binary']:
+            for gzip_flag in [False, True]:
+                out_dir: str = os.path.join(dynamic_test_volcano_format_dir, f"{data_format}_{gzip_flag}")
+                volcano_data(out_dir, ['Toy'], data_list, False, the_data_format=data_format, the_gzip_flag=gzip_flag)
+                sub_dir: str = os.path.join(out_dir, 'Toy')
+                file_name: str = volcano_data_filename(my_entry.m_batch_a, data_format, gzip_flag)
+                found_file: str
+                found_format: str
+                found_file, found_format = find_volcano_data_file(sub_dir, my_entry.m_batch_a)
+                self.assertEqual(file_name, found_file)
+                self.assertEqual(found_format, f"{data_format}-gz" if gzip_flag else data_format)
+                read_entry: VolcanoData = read_volcano_data(os.path.join(sub_dir, file_name))
+                self.assertEqual(my_entry.m_batch_type, read_entry.m_batch_type)
+                self.assertEqual(my_entry.m_batch_a, read_entry.m_batch_a)
+                self.assertEqual([str(feature) for feature in my_entry.m_features], list(read_entry.m_features))
+                # JSON values are rounded to 4 places, binary values are float32
+                tolerance: float = 1e-6 if 'binary' == data_format else 5e-5
+                self.assertTrue(numpy.allclose(my_entry.m_fold_change, read_entry.m_fold_change,
+                                               rtol=tolerance, atol=tolerance, equal_nan=True))
+                self.assertTrue(numpy.allclose(my_entry.m_pvalues, read_entry.m_pvalues, rtol=tolerance, atol=tolerance))
+                self.assertTrue(numpy.allclose(my_entry.m_trans_pvalues, read_entry.m_trans_pvalues, rtol=tolerance, atol=tolerance))
+        print("TestVolcano:test_volcano_format_toy done", flush=True)
+
+    def test_volcano_render_toy(self: 'TestVolcano') -> None:
+        """
+        test the reused canvas renderer writes the same PNG as volcano_plot_obj,
+        and that density mode writes a PNG
+        :return: nothing
+        """
+        print("TestVolcano:test_volcano_render_toy start", flush=True)
+        my_matrix: pandas.DataFrame
+        my_batches: pandas.DataFrame
+        my_matrix, my_batches = make_toy_volcano()
+        data_list: List[VolcanoData] = volcano_calc('Sample', my_matrix, my_batches, True, 'vector')
+        renderer: VolcanoRenderer = VolcanoRenderer(True)
+        density: VolcanoRenderer = VolcanoRenderer(True, True)
+        index: int
+        my_entry: VolcanoData
+        for index, my_entry in enumerate(data_list):
+            obj_png: str = os.path.join(dynamic_test_volcano_render_dir, f"obj_{index}.png")
+            render_png: str = os.path.join(dynamic_test_volcano_render_dir, f"render_{index}.png")
+            density_png: str = os.path.join(dynamic_test_volcano_render_dir, f"density_{index}.png")
+            volcano_plot_obj(obj_png, os.path.join(dynamic_test_volcano_render_dir, f"obj_{index}.txt"), my_entry, "Example Title", True)
+            renderer.render(render_png, os.path.join(dynamic_test_volcano_render_dir, f"render_{index}.txt"), my_entry, "Example Title")
+            density.render(density_png, os.path.join(dynamic_test_volcano_render_dir, f"density_{index}.txt"), my_entry, "Example Title")
+            self.assertEqual(generate_file_md5(obj_png), generate_file_md5(render_png), f"Renderer PNG differs for {my_entry.m_batch_a}")
+            self.assertTrue(os.path.getsize(density_png) > 0)
+        renderer.close()
+        density.close()
+        print("TestVolcano:test_volcano_render_toy done", flush=True)
+
+    def test_volcano_cache_toy(self: 'TestVolcano') -> None:
+        """
+        test cached volcano results are the same as calculated ones,
+        and that plots from a cache hit match plots without a cache,
+        including a parallel miss that stores results and a parallel hit
+        :return: nothing
+        """
+        print("TestVolcano:test_volcano_cache_toy start", flush=True)
+        my_matrix: pandas.DataFrame
+        my_batches: pandas.DataFrame
+        my_matrix, my_batches = make_toy_volcano()
+        cache_dir: str = os.path.join(dynamic_test_volcano_cache_dir, "cache")
+        expected: List[VolcanoData] = volcano_calc('Sample', my_matrix.copy(), my_batches, False, 'vector')
+        cache_list: List[VolcanoData]
+        for _ in range(2):
+            cache_list = volcano_calc_cached(cache_dir, 'Sample', my_matrix.copy(), my_batches, False, 'vector')
+            self.assertEqual(len(expected), len(cache_list))
+            expected_data: VolcanoData
+            cache_data: VolcanoData
+            for expected_data, cache_data in zip(expected, cache_list):
+                self.assertEqual(expected_data.m_batch_type, cache_data.m_batch_type)
+                self.assertEqual(expected_data.m_batch_a, cache_data.m_batch_a)
+                self.assertEqual(list(expected_data.m_features), list(cache_data.m_features))
+                self.assertTrue(numpy.array_equal(expected_data.m_fold_change, cache_data.m_fold_change, equal_nan=True))
+                self.assertTrue(numpy.array_equal(expected_data.m_pvalues, cache_data.m_pvalues, equal_nan=True))
+                self.assertTrue(numpy.array_equal(expected_data.m_trans_pvalues, cache_data.m_trans_pvalues, equal_nan=True))
+        self.assertEqual(1, len(os.listdir(cache_dir)), "Hit should not add cache entry")
+        md5_by_run: List[Dict[str, str]] = []
+        workers_cache_dir: str = os.path.join(dynamic_test_volcano_cache_dir, "workers_cache")
+        run_dir: str
+        run_workers: int
+        for run_dir, run_cache, run_workers in [("no_cache", None, 1), ("cache", cache_dir, 1),
+                                                ("workers_miss", workers_cache_dir, 2), ("workers_hit", workers_cache_dir, 2)]:
+            out_dir: str = os.path.join(dynamic_test_volcano_cache_dir, f"out_{run_dir}")
+            volcano_calc_plot("Example Title", 'Sample', my_matrix.copy(), my_batches, ['Toy', 'Plate'],
+                              out_dir, False, the_workers=run_workers, the_cache_dir=run_cache)
+            md5_dict: Dict[str, str] = {}
+            for root, _, files in os.walk(out_dir):
+                for file_name in files:
+                    md5_dict[os.path.relpath(os.path.join(root, file_name), out_dir)] = generate_file_md5(os.path.join(root, file_name))
+            md5_by_run.append(md5_dict)
+        self.assertEqual(1, len(os.listdir(workers_cache_dir)), "Parallel miss should add one cache entry")
+        md5_run: Dict[str, str]
+        for md5_run in md5_by_run[1:]:
+            self.assertEqual(md5_by_run[0], md5_run, "Output from cache differs")
+        print("TestVolcano:test_volcano_cache_toy done", flush=True)
 # pylint: enable=too-many-instance-attributes
 
 
@@ -19,33 +19,295 @@ MD Anderson Cancer Center Bioinformatics at MDA <https://www.mdanderson.org/rese
 @author: Tod Casasent
 """
 
-from typing import List, Optional
+from typing import List, Optional, Dict, Tuple
+from multiprocessing import shared_memory
+import typing
+import multiprocessing
+import os
+import json
 import pandas
 import numpy
-from mbatch.volcano.calc import volcano_calc, VolcanoData
-from mbatch.volcano.plot import volcano_plot, volcano_data
+from mbatch.cache.result_cache import ResultCache, make_cache_key, DEFAULT_CACHE_BYTES
+from mbatch.volcano.calc import volcano_calc, volcano_prepare, volcano_calc_batch_type, VolcanoData
+from mbatch.volcano.plot import volcano_plot, volcano_data, volcano_sub_dir, volcano_data_entry, volcano_calc_file, volcano_error_file
+
+
+# change when volcano results change, so old cache entries are not used
+VOLCANO_CACHE_VERSION: str = 'volcano-1'
+
+
+def write_volcano_cache(the_dir: str, the_data_list: List[VolcanoData]) -> None:
+    """
+    Write volcano results for a ResultCache entry.
+    volcano.json has batch type, batch, and feature list index for each result
+    (results usually share one feature list), volcano.npz has float64 values.
+    :param the_dir: cache entry directory
+    :param the_data_list: volcano results to write
+    :return: nothing
+    """
+    feature_lists: List[List[str]] = []
+    entries: List[List[typing.Any]] = []
+    arrays: Dict[str, numpy.ndarray] = {}
+    index: int
+    my_entry: VolcanoData
+    for index, my_entry in enumerate(the_data_list):
+        features: List[str] = list(my_entry.m_features)
+        if features not in feature_lists:
+            feature_lists.append(features)
+        entries.append([my_entry.m_batch_type, my_entry.m_batch_a, feature_lists.index(features)])
+        arrays[f'fold_change_{index}'] = numpy.asarray(my_entry.m_fold_change, dtype=numpy.float64)
+        arrays[f'pvalue_{index}'] = numpy.asarray(my_entry.m_pvalues, dtype=numpy.float64)
+        arrays[f'trans_pvalue_{index}'] = numpy.asarray(my_entry.m_trans_pvalues, dtype=numpy.float64)
+    with open(os.path.join(the_dir, 'volcano.json'), 'w', encoding='utf-8') as out_file:
+        json.dump({'feature_lists': feature_lists, 'entries': entries}, out_file)
+    numpy.savez(os.path.join(the_dir, 'volcano.npz'), **arrays)
+
+
+def read_volcano_cache(the_dir: str) -> List[VolcanoData]:
+    """
+    Read volcano results written by write_volcano_cache
+    :param the_dir: cache entry directory
+    :return: volcano results, in the order written
+    """
+    with open(os.path.join(the_dir, 'volcano.json'), 'r', encoding='utf-8') as in_file:
+        meta: Dict[str, typing.Any] = json.load(in_file)
+    data_list: List[VolcanoData] = []
+    with numpy.load(os.path.join(the_dir, 'volcano.npz'), allow_pickle=False) as arrays:
+        index: int
+        entry: List[typing.Any]
+        for index, entry in enumerate(meta['entries']):
+            data_list.append(VolcanoData(entry[0], entry[1], meta['feature_lists'][entry[2]],
+                                         arrays[f'fold_change_{index}'], arrays[f'pvalue_{index}'],
+                                         arrays[f'trans_pvalue_{index}']))
+    return data_list
+
+
+# pylint: disable=too-many-arguments
+def volcano_calc_cached(the_cache_dir: str, the_sample_id_col: str, the_matrix: pandas.DataFrame, the_batches: pandas.DataFrame,
+                        the_log_frame_flag: bool, the_engine: str = 'vector',
+                        the_cache_bytes: int = DEFAULT_CACHE_BYTES) -> List[VolcanoData]:
+    """
+    volcano_calc with results kept in a ResultCache, keyed on matrix values and labels,
+    batches, sample column, log-frame flag, and engine.
+    On a cache hit, the stored results are returned without calculation.
+    :param the_cache_dir: directory for ResultCache
+    :param the_sample_id_col: name of sample id column in the_batches
+    :param the_matrix: features x samples data
+    :param the_batches: sample id column and batch type columns
+    :param the_log_frame_flag: True if data is log transformed
+    :param the_engine: 'loop', 'vector', or 'stats' (see volcano_calc)
+    :param the_cache_bytes: size limit for cache directory
+    :return: volcano results
+    """
+    cache: ResultCache = ResultCache(the_cache_dir, the_cache_bytes)
+    key: str = volcano_cache_key(the_sample_id_col, the_matrix, the_batches, the_log_frame_flag, the_engine)
+    entry: Optional[str] = cache.fetch(key)
+    if entry is not None:
+        return read_volcano_cache(entry)
+    data_list: List[VolcanoData] = volcano_calc(the_sample_id_col, the_matrix, the_batches, the_log_frame_flag, the_engine)
+    cache.store(key, lambda the_dir: write_volcano_cache(the_dir, data_list))
+    return data_list
+# pylint: enable=too-many-arguments
+
+
+def volcano_cache_key(the_sample_id_col: str, the_matrix: pandas.DataFrame, the_batches: pandas.DataFrame,
+                      the_log_frame_flag: bool, the_engine: str) -> str:
+    """
+    ResultCache key for volcano results (see volcano_calc_cached)
+    :param the_sample_id_col: name of sample id column in the_batches
+    :param the_matrix: features x samples data
+    :param the_batches: sample id column and batch type columns
+    :param the_log_frame_flag: True if data is log transformed
+    :param the_engine: 'loop', 'vector', or 'stats' (see volcano_calc)
+    :return: cache key
+    """
+    return make_cache_key('volcano_calc', VOLCANO_CACHE_VERSION, the_matrix, the_batches,
+                          the_sample_id_col, the_log_frame_flag, the_engine)
+
+
+# per worker process state for volcano_calc_plot_parallel, set by init_volcano_worker
+# keeps the SharedMemory object so the matrix buffer stays valid
+VOLCANO_WORKER_STATE: Dict[str, typing.Any] = {}
+
+
+def init_volcano_worker(the_shm_name: str, the_shape: Tuple[int, int], the_dtype: str,
+                        the_settings: Dict[str, typing.Any]) -> None:
+    """
+    Pool initializer for volcano_calc_plot_parallel. Attach to the prepared matrix in shared memory.
+    :param the_shm_name: name of SharedMemory block holding matrix values
+    :param the_shape: shape of matrix
+    :param the_dtype: dtype string of matrix
+    :param the_settings: dictionary with features, samples, batches, sample_col, engine, log_frame_flag,
+                         output_dir, title, batch_types, sub_dir_a, sub_dir_b, data_format, gzip_flag, and density_flag
+    :return: nothing
+    """
+    # pylint: disable=global-variable-not-assigned
+    global VOLCANO_WORKER_STATE
+    # pylint: enable=global-variable-not-assigned
+    shm: shared_memory.SharedMemory = shared_memory.SharedMemory(name=the_shm_name)
+    VOLCANO_WORKER_STATE['shm'] = shm
+    values: numpy.ndarray = numpy.ndarray(the_shape, dtype=the_dtype, buffer=shm.buf)
+    VOLCANO_WORKER_STATE['matrix'] = pandas.DataFrame(values, index=the_settings['features'],
+                                                      columns=the_settings['samples'], copy=False)
+    VOLCANO_WORKER_STATE.update(the_settings)
+
+
+def volcano_worker_task(the_task: Tuple[int, str, List[str]]) -> Tuple[int, List[VolcanoData]]:
+    """
+    Worker for volcano_calc_plot_parallel. Calculate, write data files, and plot, for some batches of one batch type.
+    :param the_task: tuple of task index, batch type and batch ids
+    :return: tuple of task index and volcano results for the batches
+    """
+    task_index: int
+    batch_type: str
+    batch_values: List[str]
+    task_index, batch_type, batch_values = the_task
+    state: Dict[str, typing.Any] = VOLCANO_WORKER_STATE
+    data_list: List[VolcanoData] = volcano_calc_batch_type(batch_type, batch_values, state['matrix'], state['batches'],
+                                                           state['sample_col'], state['log_frame_flag'], state['engine'])
+    if batch_type in state['batch_types']:
+        sub_dir: str = volcano_sub_dir(state['output_dir'], batch_type, state['sub_dir_a'], state['sub_dir_b'])
+        my_entry: VolcanoData
+        for my_entry in data_list:
+            volcano_data_entry(sub_dir, my_entry, state['data_format'], state['gzip_flag'])
+    volcano_plot(state['output_dir'], data_list, state['title'], state['log_frame_flag'], state['sub_dir_a'], state['sub_dir_b'],
+                 state['density_flag'])
+    return task_index, data_list
 
 
 # pylint: disable=too-many-arguments
 def volcano_calc_plot(the_title: str, the_sample_id_col: str, the_matrix: pandas.DataFrame, the_batches: pandas.DataFrame,
                       the_batch_types: List[str], the_output_dir: str, the_log_frame_flag: bool,
-                      the_sub_dir_a: Optional[str] = None, the_sub_dir_b: Optional[str] = None) -> None:
-    print("volcano_calc_plot perform calculations", flush=True)
-    volcano_list: List[VolcanoData] = volcano_calc(the_sample_id_col, the_matrix, the_batches, the_log_frame_flag)
+                      the_sub_dir_a: Optional[str] = None, the_sub_dir_b: Optional[str] = None,
+                      the_engine: str = 'vector', the_workers: int = 1,
+                      the_data_format: str = 'json', the_gzip_flag: bool = False,
+                      the_density_flag: bool = False,
+                      the_cache_dir: Optional[str] = None, the_cache_bytes: int = DEFAULT_CACHE_BYTES) -> None:
+    """
+    Calculate volcano results, write data files, and plot.
+    With the_cache_dir, results come from (or are added to) a ResultCache (see volcano_calc_cached).
+    On a cache hit, data files and plots are written from the stored results in this process.
+    On a miss, results are calculated with the_workers processes as usual, and then stored.
+    """
+    cache: Optional[ResultCache] = None
+    key: str = ''
+    volcano_list: Optional[List[VolcanoData]] = None
+    if the_cache_dir is not None:
+        cache = ResultCache(the_cache_dir, the_cache_bytes)
+        key = volcano_cache_key(the_sample_id_col, the_matrix, the_batches, the_log_frame_flag, the_engine)
+        entry: Optional[str] = cache.fetch(key)
+        if entry is not None:
+            print(f"volcano_calc_plot cache hit {entry}", flush=True)
+            volcano_list = read_volcano_cache(entry)
+    if volcano_list is None:
+        if the_workers > 1:
+            volcano_list = volcano_calc_plot_parallel(the_title, the_sample_id_col, the_matrix, the_batches, the_batch_types,
+                                                      the_output_dir, the_log_frame_flag, the_sub_dir_a, the_sub_dir_b, the_engine,
+                                                      the_workers, the_data_format, the_gzip_flag, the_density_flag)
+        else:
+            print("volcano_calc_plot perform calculations", flush=True)
+            volcano_list = volcano_calc(the_sample_id_col, the_matrix, the_batches, the_log_frame_flag, the_engine)
+        if cache is not None:
+            stored_list: List[VolcanoData] = volcano_list
+            cache.store(key, lambda the_dir: write_volcano_cache(the_dir, stored_list))
+        if the_workers > 1:
+            # workers already wrote data files and plots
+            return
     print("volcano_calc_plot write data", flush=True)
-    volcano_data(the_output_dir, the_batch_types, volcano_list, the_log_frame_flag, the_sub_dir_a, the_sub_dir_b)
+    volcano_data(the_output_dir, the_batch_types, volcano_list, the_log_frame_flag, the_sub_dir_a, the_sub_dir_b,
+                 the_data_format, the_gzip_flag)
     print("volcano_calc_plot plot data", flush=True)
-    volcano_plot(the_output_dir, volcano_list, the_title, the_log_frame_flag, the_sub_dir_a, the_sub_dir_b)
+    volcano_plot(the_output_dir, volcano_list, the_title, the_log_frame_flag, the_sub_dir_a, the_sub_dir_b, the_density_flag)
     print("volcano_calc_plot done", flush=True)
 # pylint: enable=too-many-arguments
 
 
+# pylint: disable=too-many-arguments,too-many-locals
+def volcano_calc_plot_parallel(the_title: str, the_sample_id_col: str, the_matrix: pandas.DataFrame, the_batches: pandas.DataFrame,
+                               the_batch_types: List[str], the_output_dir: str, the_log_frame_flag: bool,
+                               the_sub_dir_a: Optional[str], the_sub_dir_b: Optional[str],
+                               the_engine: str, the_workers: int,
+                               the_data_format: str = 'json', the_gzip_flag: bool = False,
+                               the_density_flag: bool = False) -> List[VolcanoData]:
+    """
+    volcano_calc_plot with the_workers processes. The prepared matrix is copied once into shared memory,
+    and each worker calculates, writes data files, and plots for some batches of one batch type.
+    Per batch type files (Volcano-Calc.txt and error.log) are written here, so no two workers write the same file.
+    Output files are the same as from volcano_calc_plot with one worker.
+    Returns the volcano results of all workers, in task order (batch type, then batch).
+    """
+    print(f"volcano_calc_plot_parallel the_workers={the_workers}", flush=True)
+    print(f"volcano_calc {the_sample_id_col}", flush=True)
+    prepared: pandas.DataFrame = volcano_prepare(the_matrix)
+    values: numpy.ndarray = numpy.ascontiguousarray(prepared.to_numpy(dtype=numpy.float64))
+    # tasks are up to the_workers groups of batches for each batch type
+    tasks: List[Tuple[int, str, List[str]]] = []
+    calc_types: List[str] = []
+    column_names: List[str] = list(the_batches.columns.values)
+    column_names.remove(the_sample_id_col)
+    name_group: str
+    for name_group in column_names:
+        batch_values: List[str] = list(set(the_batches[name_group]))
+        print(f"Batch Type {name_group} has {len(batch_values)} values {batch_values}", flush=True)
+        if len(batch_values) > 1:
+            calc_types.append(name_group)
+            chunk_size: int = -(-len(batch_values) // the_workers)
+            index: int
+            for index in range(0, len(batch_values), chunk_size):
+                tasks.append((len(tasks), name_group, batch_values[index:index + chunk_size]))
+    batch_type: str
+    for batch_type in the_batch_types:
+        sub_dir: str = volcano_sub_dir(the_output_dir, batch_type, the_sub_dir_a, the_sub_dir_b)
+        if batch_type in calc_types:
+            volcano_calc_file(sub_dir, the_log_frame_flag)
+        else:
+            volcano_error_file(sub_dir)
+    settings: Dict[str, typing.Any] = {
+        'features': prepared.index.values.tolist(),
+        'samples': prepared.columns.values.tolist(),
+        'batches': the_batches,
+        'sample_col': the_sample_id_col,
+        'engine': the_engine,
+        'log_frame_flag': the_log_frame_flag,
+        'output_dir': the_output_dir,
+        'title': the_title,
+        'batch_types': the_batch_types,
+        'sub_dir_a': the_sub_dir_a,
+        'sub_dir_b': the_sub_dir_b,
+        'data_format': the_data_format,
+        'gzip_flag': the_gzip_flag,
+        'density_flag': the_density_flag
+    }
+    shm: shared_memory.SharedMemory = shared_memory.SharedMemory(create=True, size=max(1, values.nbytes))
+    try:
+        shared_values: numpy.ndarray = numpy.ndarray(values.shape, dtype=values.dtype, buffer=shm.buf)
+        shared_values[...] = values
+        # release view before closing shared memory
+        del shared_values
+        pool: multiprocessing.Pool
+        with multiprocessing.Pool(processes=the_workers, initializer=init_volcano_worker,
+                                  initargs=(shm.name, values.shape, values.dtype.str, settings)) as pool:
+            task_results: List[Tuple[int, List[VolcanoData]]] = list(pool.imap_unordered(volcano_worker_task, tasks))
+    finally:
+        shm.close()
+        shm.unlink()
+    task_results.sort(key=lambda my_result: my_result[0])
+    volcano_list: List[VolcanoData] = [my_data for my_result in task_results for my_data in my_result[1]]
+    print(f"volcano_calc_plot_parallel done {len(volcano_list)} batches", flush=True)
+    return volcano_list
+# pylint: enable=too-many-arguments,too-many-locals
+
+
 # pylint: disable=too-many-arguments
 def volcano_calc_plot_from_r(the_title: str, the_sample_id_col: str,
                              the_matrix: numpy.ndarray, the_features: List[str], the_samples: List[str],
                              the_batches: numpy.ndarray,
                              the_batch_types: List[str], the_output_dir: str, the_log_frame_flag: bool,
-                             the_sub_dir_a: Optional[str] = None, the_sub_dir_b: Optional[str] = None) -> None:
+                             the_sub_dir_a: Optional[str] = None, the_sub_dir_b: Optional[str] = None,
+                             the_engine: str = 'vector', the_workers: int = 1,
+                             the_data_format: str = 'json', the_gzip_flag: bool = False,
+                             the_density_flag: bool = False,
+                             the_cache_dir: Optional[str] = None, the_cache_bytes: int = DEFAULT_CACHE_BYTES) -> None:
     print("volcano_calc_plot_from_r make matrix", flush=True)
     my_matrix: pandas.DataFrame = pandas.DataFrame(the_matrix, index=the_features, columns=the_samples)
     print("volcano_calc_plot_from_r make batches", flush=True)
@@ -53,5 +315,6 @@ def volcano_calc_plot_from_r(the_title: str, the_sample_id_col: str,
     my_batches: pandas.DataFrame = pandas.DataFrame(data=the_batches, dtype=str)
     print("volcano_calc_plot_from_r call plot", flush=True)
     volcano_calc_plot(the_title, the_sample_id_col, my_matrix, my_batches, the_batch_types,
-                      the_output_dir, the_log_frame_flag, the_sub_dir_a, the_sub_dir_b)
+                      the_output_dir, the_log_frame_flag, the_sub_dir_a, the_sub_dir_b, the_engine, the_workers,
+                      the_data_format, the_gzip_flag, the_density_flag, the_cache_dir, the_cache_bytes)
 # pylint: enable=too-many-arguments
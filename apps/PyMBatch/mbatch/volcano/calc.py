@@ -19,14 +19,20 @@ MD Anderson Cancer Center Bioinformatics at MDA <https://www.mdanderson.org/rese
 @author: Tod Casasent
 """
 
-from typing import List
+from typing import List, Tuple
 import io
 import json
+import gzip
+import struct
 import pandas
 import numpy
 import scipy
 
 
+# value columns in compact volcano files, in order for binary files
+VOLCANO_COLUMNS: List[str] = ['fold_change', 'pvalue', 'trans_pvalue']
+
+
 # pylint: disable=too-many-arguments,too-many-instance-attributes,too-few-public-methods
 class VolcanoData:
     """
@@ -94,12 +100,271 @@ class VolcanoData:
         the_out.write(my_str)
         written = True
         return written
+
+    def write_columns_json(self: 'VolcanoData', the_out: io.TextIOWrapper) -> bool:
+        """
+        Write compact column oriented JSON, one list per value instead of one dict per feature.
+        Fields are batch_type, batch_name, features, fold_change, pvalue, and trans_pvalue.
+        Values are rounded as in write_json.
+        :param the_out: text stream to which to write
+        :return: True if written
+        """
+        written: bool = False
+        batch_dict: dict = {
+            'batch_type': self.m_batch_type,
+            'batch_name': self.m_batch_a,
+            'features': [str(feature) for feature in self.m_features],
+            'fold_change': [round(float(value), 4) for value in self.m_fold_change],
+            'pvalue': [round(float(value), 4) for value in self.m_pvalues],
+            'trans_pvalue': [round(float(value), 4) for value in self.m_trans_pvalues]
+        }
+        # no indent or spaces, for size
+        the_out.write(json.dumps(batch_dict, separators=(',', ':')))
+        written = True
+        return written
+
+    def write_columns_binary(self: 'VolcanoData', the_out: io.BufferedIOBase) -> bool:
+        """
+        Write column oriented binary data with float32 values.
+        Layout is a little-endian uint32 header size, then a UTF-8 JSON header
+        (batch_type, batch_name, features, count, dtype, columns) padded with spaces
+        to a multiple of 4 bytes, then count float32 values for each column in columns order.
+        Values start on a 4 byte boundary, so may be read as typed arrays without copying.
+        :param the_out: binary stream to which to write
+        :return: True if written
+        """
+        written: bool = False
+        values: numpy.ndarray = numpy.array([self.m_fold_change, self.m_pvalues, self.m_trans_pvalues], dtype='<f4')
+        header_dict: dict = {
+            'batch_type': self.m_batch_type,
+            'batch_name': self.m_batch_a,
+            'features': [str(feature) for feature in self.m_features],
+            'count': len(self.m_features),
+            'dtype': '<f4',
+            'columns': VOLCANO_COLUMNS
+        }
+        header: bytes = json.dumps(header_dict, separators=(',', ':')).encode('utf-8')
+        header += b' ' * (-len(header) % 4)
+        the_out.write(struct.pack('<I', len(header)))
+        the_out.write(header)
+        the_out.write(values.tobytes(order='C'))
+        written = True
+        return written
 # pylint: enable=too-many-arguments,too-many-instance-attributes,too-few-public-methods
 
 
-# pylint: disable=too-many-locals
-def volcano_calc(the_sample_col: str, the_data: pandas.DataFrame, the_batches: pandas.DataFrame, the_log_frame_flag: bool) -> List[VolcanoData]:
-    print(f"volcano_calc {the_sample_col}", flush=True)
+def read_volcano_data(the_file: str) -> VolcanoData:
+    """
+    Read a volcano data file written by write_json, write_columns_json, or write_columns_binary.
+    Files ending in .gz are decompressed, files ending in .bin (or .bin.gz) are binary.
+    :param the_file: full path to volcano data file
+    :return: VolcanoData (binary values are float32 arrays, others are lists)
+    """
+    raw: bytes
+    if the_file.endswith('.gz'):
+        with gzip.open(the_file, 'rb') as in_file:
+            raw = in_file.read()
+    else:
+        with open(the_file, 'rb') as in_file:
+            raw = in_file.read()
+    if the_file.endswith('.bin') or the_file.endswith('.bin.gz'):
+        header_size: int = struct.unpack_from('<I', raw, 0)[0]
+        header: dict = json.loads(raw[4:4 + header_size].decode('utf-8'))
+        values: numpy.ndarray = numpy.frombuffer(raw, dtype=header['dtype'], offset=4 + header_size,
+                                                 count=len(header['columns']) * header['count'])
+        values = values.reshape(len(header['columns']), header['count'])
+        columns: dict = dict(zip(header['columns'], values))
+        return VolcanoData(header['batch_type'], header['batch_name'], header['features'],
+                           columns['fold_change'], columns['pvalue'], columns['trans_pvalue'])
+    batch_dict: dict = json.loads(raw.decode('utf-8'))
+    if 'values' in batch_dict:
+        my_values: List[dict] = batch_dict['values']
+        return VolcanoData(batch_dict['batch_type'], batch_dict['batch_name'],
+                           [value['feature'] for value in my_values],
+                           [value['fold_change'] for value in my_values],
+                           [value['pvalue'] for value in my_values],
+                           [value['trans_pvalue'] for value in my_values])
+    return VolcanoData(batch_dict['batch_type'], batch_dict['batch_name'], batch_dict['features'],
+                       batch_dict['fold_change'], batch_dict['pvalue'], batch_dict['trans_pvalue'])
+
+
+def volcano_pvalues(the_values_a: numpy.ndarray, the_values_b: numpy.ndarray) -> numpy.ndarray:
+    """
+    T-test p-values for every feature (row) at once, the same as scipy.stats.ttest_ind with nan_policy='omit' on each row.
+    Rows without NaN are tested with one vectorized call.
+    Rows with NaN are tested with one scipy.stats.ttest_ind_from_stats call, from counts, means and variances
+    of the non-NaN values of each row (two-pass, like numpy.var), so no row is tested on its own.
+    NaN (or masked) p-values are 1, to mean "ignore".
+    :param the_values_a: features x samples in batch
+    :param the_values_b: features x samples not in batch (same features)
+    :return: numpy.ndarray of p-values for features
+    """
+    # rows contiguous, so sums are done in the same order as for one row
+    the_values_a = numpy.ascontiguousarray(the_values_a, dtype=numpy.float64)
+    the_values_b = numpy.ascontiguousarray(the_values_b, dtype=numpy.float64)
+    pvalues: numpy.ndarray = numpy.ones(the_values_a.shape[0], dtype=numpy.float64)
+    nan_rows: numpy.ndarray = numpy.isnan(the_values_a).any(axis=1) | numpy.isnan(the_values_b).any(axis=1)
+    with numpy.errstate(divide='ignore', invalid='ignore'):
+        if (~nan_rows).any():
+            pvalues[~nan_rows] = scipy.stats.ttest_ind(the_values_a[~nan_rows], the_values_b[~nan_rows], axis=1).pvalue
+        if nan_rows.any():
+            count_a: numpy.ndarray
+            mean_a: numpy.ndarray
+            var_a: numpy.ndarray
+            count_b: numpy.ndarray
+            mean_b: numpy.ndarray
+            var_b: numpy.ndarray
+            count_a, mean_a, var_a = volcano_nan_stats(the_values_a[nan_rows])
+            count_b, mean_b, var_b = volcano_nan_stats(the_values_b[nan_rows])
+            pvalues[nan_rows] = scipy.stats.ttest_ind_from_stats(mean_a, numpy.sqrt(var_a), count_a,
+                                                                 mean_b, numpy.sqrt(var_b), count_b).pvalue
+    # use 1 as default to mean "ignore"
+    # prevents divide by zero error during log10
+    pvalues[numpy.isnan(pvalues)] = 1.0
+    return pvalues
+
+
+def volcano_nan_stats(the_values: numpy.ndarray) -> Tuple[numpy.ndarray, numpy.ndarray, numpy.ndarray]:
+    """
+    Per row count, mean and sample variance (ddof=1) of the non-NaN values.
+    Rows with fewer than two values get NaN variance, so their t-test p-value is NaN.
+    :param the_values: features x samples, NaN for missing values
+    :return: tuple of counts, means and variances by feature
+    """
+    finite_mask: numpy.ndarray = ~numpy.isnan(the_values)
+    counts: numpy.ndarray = finite_mask.sum(axis=1).astype(numpy.float64)
+    means: numpy.ndarray = numpy.nansum(the_values, axis=1) / counts
+    deviations: numpy.ndarray = numpy.where(finite_mask, the_values - means[:, numpy.newaxis], 0.0)
+    variances: numpy.ndarray = numpy.sum(deviations * deviations, axis=1) / (counts - 1.0)
+    variances[counts < 2.0] = numpy.nan
+    return counts, means, variances
+
+
+def volcano_group_stats(the_values: numpy.ndarray, the_codes: numpy.ndarray,
+                        the_levels_cnt: int) -> Tuple[numpy.ndarray, numpy.ndarray, numpy.ndarray, numpy.ndarray]:
+    """
+    Per-feature, per-batch count of non-NaN values, sum, and sum of squares, with one pass over the matrix.
+    Columns are grouped by batch with a stable sort and summed with numpy.add.reduceat,
+    so the cost does not grow with the number of batches.
+    Values are centered on the feature mean (of non-NaN values) first, to keep sums of squares well conditioned.
+    An extra last column has the totals over all samples (including samples with code -1, in no batch).
+    :param the_values: features x samples, NaN for missing values
+    :param the_codes: integer batch code for each sample, -1 if sample is not in a batch
+    :param the_levels_cnt: number of batches (levels)
+    :return: tuple of feature centers, and counts, centered sums, and centered sums of squares (features x batches+1)
+    """
+    finite_mask: numpy.ndarray = ~numpy.isnan(the_values)
+    with numpy.errstate(divide='ignore', invalid='ignore'):
+        centers: numpy.ndarray = numpy.where(finite_mask, the_values, 0.0).sum(axis=1) / finite_mask.sum(axis=1)
+    centered: numpy.ndarray = numpy.where(finite_mask, the_values - centers[:, numpy.newaxis], 0.0)
+    counts: numpy.ndarray = numpy.zeros((the_values.shape[0], the_levels_cnt + 1), numpy.float64)
+    sums: numpy.ndarray = numpy.zeros((the_values.shape[0], the_levels_cnt + 1), numpy.float64)
+    squares: numpy.ndarray = numpy.zeros((the_values.shape[0], the_levels_cnt + 1), numpy.float64)
+    counts[:, -1] = finite_mask.sum(axis=1)
+    sums[:, -1] = centered.sum(axis=1)
+    squares[:, -1] = (centered * centered).sum(axis=1)
+    # group sample columns by batch, batches without samples stay zero
+    order: numpy.ndarray = numpy.argsort(the_codes, kind='stable')
+    order = order[the_codes[order] >= 0]
+    if order.size > 0:
+        sorted_codes: numpy.ndarray = the_codes[order]
+        present: numpy.ndarray = numpy.unique(sorted_codes)
+        starts: numpy.ndarray = numpy.searchsorted(sorted_codes, present)
+        grouped: numpy.ndarray = centered[:, order]
+        counts[:, present] = numpy.add.reduceat(finite_mask[:, order].astype(numpy.float64), starts, axis=1)
+        sums[:, present] = numpy.add.reduceat(grouped, starts, axis=1)
+        numpy.multiply(grouped, grouped, out=grouped)
+        squares[:, present] = numpy.add.reduceat(grouped, starts, axis=1)
+    return centers, counts, sums, squares
+
+
+def volcano_stats_pvalues(the_count_a: numpy.ndarray, the_sum_a: numpy.ndarray, the_square_a: numpy.ndarray,
+                          the_count_b: numpy.ndarray, the_sum_b: numpy.ndarray, the_square_b: numpy.ndarray) -> numpy.ndarray:
+    """
+    T-test (equal variance, as scipy.stats.ttest_ind) p-values from count, sum, and sum of squares of each group,
+    with NaN values already left out of the statistics. NaN p-values are 1, to mean "ignore".
+    :param the_count_a: by feature, count of values in batch
+    :param the_sum_a: by feature, sum of values in batch
+    :param the_square_a: by feature, sum of squared values in batch
+    :param the_count_b: by feature, count of values not in batch
+    :param the_sum_b: by feature, sum of values not in batch
+    :param the_square_b: by feature, sum of squared values not in batch
+    :return: numpy.ndarray of p-values for features
+    """
+    with numpy.errstate(divide='ignore', invalid='ignore'):
+        mean_a: numpy.ndarray = the_sum_a / the_count_a
+        mean_b: numpy.ndarray = the_sum_b / the_count_b
+        # removing rounding can leave tiny negative values
+        var_a: numpy.ndarray = numpy.maximum(the_square_a - the_sum_a * mean_a, 0.0) / (the_count_a - 1)
+        var_b: numpy.ndarray = numpy.maximum(the_square_b - the_sum_b * mean_b, 0.0) / (the_count_b - 1)
+        pvalues: numpy.ndarray = numpy.asarray(scipy.stats.ttest_ind_from_stats(mean_a, numpy.sqrt(var_a), the_count_a,
+                                                                                mean_b, numpy.sqrt(var_b), the_count_b).pvalue,
+                                               dtype=numpy.float64)
+    pvalues[numpy.isnan(pvalues)] = 1.0
+    return pvalues
+
+
+# pylint: disable=too-many-arguments
+def volcano_calc_stats(the_batch_type: str, the_batch_values: List[str], the_data: pandas.DataFrame,
+                       the_batches: pandas.DataFrame, the_sample_col: str, the_log_frame_flag: bool) -> List[VolcanoData]:
+    """
+    volcano_calc for one batch type, from per-batch statistics (see volcano_group_stats),
+    with statistics for the rest of the samples as totals minus the batch.
+    Fold changes and p-values match the other engines within floating point tolerance.
+    :param the_batch_type: batch type (column in the_batches)
+    :param the_batch_values: batch ids to compare, in output order
+    :param the_data: features x samples matrix, with infinite values already NaN
+    :param the_batches: batch information, sample id column and one column per batch type
+    :param the_sample_col: name of sample id column in the_batches
+    :param the_log_frame_flag: True if data is already log transformed (otherwise log2 of means is used)
+    :return: list of VolcanoData, one per batch
+    """
+    results: List['VolcanoData'] = []
+    feature_list: List[str] = the_data.index.values.tolist()
+    sample_batch: pandas.Series = pandas.Series(the_batches[the_batch_type].to_numpy(), index=the_batches[the_sample_col].to_numpy())
+    levels: pandas.Index = pandas.Index(the_batch_values)
+    codes: numpy.ndarray = levels.get_indexer(sample_batch.reindex(the_data.columns).to_numpy())
+    values: numpy.ndarray = the_data.to_numpy(dtype=numpy.float64)
+    centers: numpy.ndarray
+    counts: numpy.ndarray
+    sums: numpy.ndarray
+    squares: numpy.ndarray
+    centers, counts, sums, squares = volcano_group_stats(values, codes, levels.size)
+    batch_sizes: numpy.ndarray = numpy.bincount(codes[codes >= 0], minlength=levels.size)
+    sample_cnt: int = values.shape[1]
+    index_a: int
+    batch_a: str
+    for index_a, batch_a in enumerate(the_batch_values):
+        print(f"Batch Type {the_batch_type} - {batch_a}", flush=True)
+        count_b: numpy.ndarray = counts[:, -1] - counts[:, index_a]
+        sum_b: numpy.ndarray = sums[:, -1] - sums[:, index_a]
+        square_b: numpy.ndarray = squares[:, -1] - squares[:, index_a]
+        # means include NaN values, as in the other engines (mean is NaN if any value is NaN)
+        with numpy.errstate(divide='ignore', invalid='ignore'):
+            means_a: numpy.ndarray = numpy.where(counts[:, index_a] == batch_sizes[index_a],
+                                                 centers + sums[:, index_a] / counts[:, index_a], numpy.nan)
+            means_b: numpy.ndarray = numpy.where(count_b == (sample_cnt - batch_sizes[index_a]),
+                                                 centers + sum_b / count_b, numpy.nan)
+        if not the_log_frame_flag:
+            # out and where makes sure that NaNs and infinities become zero
+            means_a = numpy.log2(means_a, out=numpy.zeros_like(means_a), where=means_a > 0)
+            means_b = numpy.log2(means_b, out=numpy.zeros_like(means_b), where=means_b > 0)
+        # since everything is log2 can now subtract
+        foldchanges: List[float] = list(means_b - means_a)
+        pvalues: numpy.ndarray = volcano_stats_pvalues(counts[:, index_a], sums[:, index_a], squares[:, index_a],
+                                                       count_b, sum_b, square_b)
+        transformed_pvals: List[float] = list(-1 * numpy.log10(pvalues.size * pvalues))
+        results.append(VolcanoData(the_batch_type, batch_a, feature_list, foldchanges, pvalues.tolist(), transformed_pvals))
+    return results
+# pylint: enable=too-many-arguments
+
+
+def volcano_prepare(the_data: pandas.DataFrame) -> pandas.DataFrame:
+    """
+    Remove features (rows) that are all zero, and make infinite values NaN, then remove rows that are all NaN
+    :param the_data: features x samples matrix
+    :return: features x samples matrix used for volcano calculations
+    """
     print(f"volcano_calc size = {the_data.shape}", flush=True)
     # remove rows that are all zero
     the_data = the_data[~(the_data == 0.0).all(axis=1)]
@@ -110,10 +375,94 @@ def volcano_calc(the_sample_col: str, the_data: pandas.DataFrame, the_batches: p
     # drop rows with all NaN values
     the_data.dropna(axis=0, how='all', inplace=True)
     print(f"volcano_calc removed +/- inf = {the_data.shape}", flush=True)
+    return the_data
+
+
+# pylint: disable=too-many-locals,too-many-arguments
+def volcano_calc_batch_type(the_batch_type: str, the_batch_values: List[str], the_data: pandas.DataFrame,
+                            the_batches: pandas.DataFrame, the_sample_col: str, the_log_frame_flag: bool,
+                            the_engine: str = 'vector') -> List[VolcanoData]:
+    """
+    volcano_calc for the given batches of one batch type, on data from volcano_prepare
+    :param the_batch_type: batch type (column in the_batches)
+    :param the_batch_values: batch ids to compare, in output order
+    :param the_data: features x samples matrix, from volcano_prepare
+    :param the_batches: batch information, sample id column and one column per batch type
+    :param the_sample_col: name of sample id column in the_batches
+    :param the_log_frame_flag: True if data is already log transformed (otherwise log2 of means is used)
+    :param the_engine: 'loop', 'vector', or 'stats' (see volcano_calc)
+    :return: list of VolcanoData, one per batch
+    """
+    if 'stats' == the_engine:
+        return volcano_calc_stats(the_batch_type, the_batch_values, the_data, the_batches, the_sample_col, the_log_frame_flag)
+    results: List['VolcanoData'] = []
+    feature_list: List[str] = the_data.index.values.tolist()
+    index_a: int = 0
+    while index_a < len(the_batch_values):
+        # get the batch to compare
+        batch_a: str = the_batch_values[index_a]
+        # get list of samples for each batch
+        samples_a: List[str] = (the_batches[the_batches[the_batch_type] == batch_a][the_sample_col]).to_list()
+        samples_b: List[str] = the_data.columns.difference(samples_a).tolist()
+        # get batch dataframes
+        batch_df_a: pandas.DataFrame = the_data[samples_a]
+        batch_df_b: pandas.DataFrame = the_data[samples_b]
+        print(f"Batch Type {the_batch_type} - {batch_a}", flush=True)
+        # calculate fold changes
+        means_a: numpy.ndarray = batch_df_a.to_numpy().mean(axis=1)
+        means_b: numpy.ndarray = batch_df_b.to_numpy().mean(axis=1)
+        # reviewed by rehan!
+        if not the_log_frame_flag:
+            # out and where makes sure that NaNs and infinities become zero
+            means_a = numpy.log2(means_a, out=numpy.zeros_like(means_a), where=means_a > 0)
+            means_b = numpy.log2(means_b, out=numpy.zeros_like(means_b), where=means_b > 0)
+        # since everything is log2 can now subtract
+        foldchanges: List[float] = list(means_b - means_a)
+        # calculate p-values
+        num_values: int = means_a.shape[0]
+        row_int: int
+        pvalue_list: List[float] = []
+        if 'vector' == the_engine:
+            pvalue_list = volcano_pvalues(batch_df_a.to_numpy(), batch_df_b.to_numpy()).tolist()
+        else:
+            for row_int in range(0, num_values):
+                row_a: numpy.ndarray = batch_df_a.to_numpy()[row_int, :]
+                row_b: numpy.ndarray = batch_df_b.to_numpy()[row_int, :]
+                ttest_result = scipy.stats.ttest_ind(row_a, row_b, nan_policy='omit')
+                pvalue: float = ttest_result.pvalue
+                if numpy.isnan(pvalue):
+                    # use 1 as default to mean "ignore"
+                    # prevents divide by zero error during log10
+                    pvalue = 1
+                if numpy.ma.is_masked(pvalue):
+                    pvalue = 1
+                pvalue_list.append(pvalue)
+        transformed_pvals: List[float] = list(-1 * numpy.log10(num_values * numpy.array(pvalue_list)))
+        results.append(VolcanoData(the_batch_type, batch_a, feature_list, foldchanges, pvalue_list, transformed_pvals))
+        # go to next batch a
+        index_a += 1
+    return results
+# pylint: enable=too-many-locals,too-many-arguments
+
+
+def volcano_calc(the_sample_col: str, the_data: pandas.DataFrame, the_batches: pandas.DataFrame, the_log_frame_flag: bool,
+                 the_engine: str = 'vector') -> List[VolcanoData]:
+    """
+    Calculate fold change and t-test p-values for each batch against the rest of the samples, for each batch type.
+    :param the_sample_col: name of sample id column in the_batches
+    :param the_data: features x samples matrix
+    :param the_batches: batch information, sample id column and one column per batch type
+    :param the_log_frame_flag: True if data is already log transformed (otherwise log2 of means is used)
+    :param the_engine: 'loop' for one t-test per feature, 'vector' for all features at once (see volcano_pvalues),
+                       'stats' for all batches of a batch type from one pass (see volcano_calc_stats)
+    :return: list of VolcanoData, one per batch
+    """
+    assert the_engine in ('loop', 'vector', 'stats'), "Volcano engine should be 'loop', 'vector', or 'stats'"
+    print(f"volcano_calc {the_sample_col}", flush=True)
+    the_data = volcano_prepare(the_data)
     results: List['VolcanoData'] = []
     column_names: List[str] = list(the_batches.columns.values)
     column_names.remove(the_sample_col)
-    feature_list: List[str] = the_data.index.values.tolist()
     name_group: str
     for name_group in column_names:
         # get list of batch values
@@ -122,51 +471,6 @@ def volcano_calc(the_sample_col: str, the_data: pandas.DataFrame, the_batches: p
         print(f"Batch Type {name_group} has {values_length} values {batch_values}", flush=True)
         if values_length > 1:
             # process batch types with more than one batch
-            index_a: int = 0
-            while index_a < values_length:
-                # get the batch to compare
-                batch_a: str = batch_values[index_a]
-                # get list of samples for each batch
-                samples_a: List[str] = (the_batches[the_batches[name_group] == batch_a][the_sample_col]).to_list()
-                samples_b: List[str] = the_data.columns.difference(samples_a).tolist()
-                # get batch dataframes
-                batch_df_a: pandas.DataFrame = the_data[samples_a]
-                batch_df_b: pandas.DataFrame = the_data[samples_b]
-                print(f"Batch Type {name_group} - {batch_a}", flush=True)
-                # calculate fold changes
-                means_a: numpy.ndarray = batch_df_a.to_numpy().mean(axis=1)
-                means_b: numpy.ndarray = batch_df_b.to_numpy().mean(axis=1)
-                # reviewed by rehan!
-                if not the_log_frame_flag:
-                    # out and where makes sure that NaNs and infinities become zero
-                    means_a = numpy.log2(means_a, out=numpy.zeros_like(means_a), where=means_a > 0)
-                    means_b = numpy.log2(means_b, out=numpy.zeros_like(means_b), where=means_b > 0)
-                # since everything is log2 can now subtract
-                foldchanges: List[float] = list(means_b - means_a)
-                # calculate p-values
-                # pvals: List[float] = []
-                num_values: int = means_a.shape[0]
-                row_int: int
-                pvalue_list: List[float] = []
-                for row_int in range(0, num_values):
-                    # print(f"Batch Type {name_group}: {batch_a} vs {batch_b} for {batch_df_a.index[row_int]}", flush=True)
-                    row_a: numpy.ndarray = batch_df_a.to_numpy()[row_int, :]
-                    row_b: numpy.ndarray = batch_df_b.to_numpy()[row_int, :]
-                    # print(f"min={row_a.min()}|{row_b.min()} max={row_a.max()}|{row_b.max()} ")
-                    # TODO: any checks before T-Test?
-                    ttest_result = scipy.stats.ttest_ind(row_a, row_b, nan_policy='omit')
-                    pvalue: float = ttest_result.pvalue
-                    if numpy.isnan(pvalue):
-                        # use 1 as default to mean "ignore"
-                        # prevents divide by zero error during log10
-                        pvalue = 1
-                    if numpy.ma.is_masked(pvalue):
-                        pvalue = 1
-                    pvalue_list.append(pvalue)
-                transformed_pvals: List[float] = list(-1 * numpy.log10(num_values * numpy.array(pvalue_list)))
-                results.append(VolcanoData(name_group, batch_a, feature_list, foldchanges, pvalue_list, transformed_pvals))
-                # go to next batch a
-                index_a += 1
-                # print("--------------------------------------------------", flush=True)
+            results.extend(volcano_calc_batch_type(name_group, batch_values, the_data, the_batches,
+                                                   the_sample_col, the_log_frame_flag, the_engine))
     return results
-# pylint: enable=too-many-locals
@@ -20,77 +20,171 @@ MD Anderson Cancer Center Bioinformatics at MDA <https://www.mdanderson.org/rese
 """
 
 import os
-from typing import List, Optional
+from typing import List, Optional, Tuple
 import io
+import gzip
+import numpy
 import matplotlib.pylab
 import matplotlib.pyplot
+import matplotlib.collections
+import matplotlib.image
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
 from mbatch.test.common import convert_to_filename
 from mbatch.volcano.calc import VolcanoData
 
 
+def volcano_sub_dir(the_file_path: str, the_batch_type: str,
+                    the_sub_dir_a: Optional[str] = None, the_sub_dir_b: Optional[str] = None) -> str:
+    """
+    Directory for volcano output for a batch type, created if needed
+    :param the_file_path: output directory
+    :param the_batch_type: batch type
+    :param the_sub_dir_a: optional sub-directory under batch type
+    :param the_sub_dir_b: optional sub-directory under the_sub_dir_a
+    :return: full path to directory
+    """
+    sub_dir: str = os.path.join(the_file_path, the_batch_type)
+    if the_sub_dir_a is not None:
+        sub_dir = os.path.join(sub_dir, the_sub_dir_a)
+    if the_sub_dir_b is not None:
+        sub_dir = os.path.join(sub_dir, the_sub_dir_b)
+    # exist_ok, since parallel workers may create the same directory
+    os.makedirs(sub_dir, exist_ok=True)
+    return sub_dir
+
+
+def volcano_data_filename(the_batch_a: str, the_data_format: str = 'json', the_gzip_flag: bool = False) -> str:
+    """
+    File name for volcano data for one batch
+    :param the_batch_a: batch id
+    :param the_data_format: 'json' for Volcano-Data (one dict per feature),
+                            'columns' for Volcano-Columns (JSON lists per value),
+                            'binary' for Volcano-Binary (float32 values, see VolcanoData.write_columns_binary)
+    :param the_gzip_flag: if True, add .gz for gzip compressed file
+    :return: file name (no directory)
+    """
+    file_name: str
+    if 'json' == the_data_format:
+        file_name = f'Volcano-Data-{convert_to_filename(the_batch_a)}.json'
+    elif 'columns' == the_data_format:
+        file_name = f'Volcano-Columns-{convert_to_filename(the_batch_a)}.json'
+    elif 'binary' == the_data_format:
+        file_name = f'Volcano-Binary-{convert_to_filename(the_batch_a)}.bin'
+    else:
+        raise ValueError(f"Unknown volcano data format {the_data_format}")
+    if the_gzip_flag:
+        file_name = file_name + '.gz'
+    return file_name
+
+
+def volcano_data_entry(the_sub_dir: str, the_entry: VolcanoData,
+                       the_data_format: str = 'json', the_gzip_flag: bool = False) -> str:
+    """
+    Write volcano data file for one batch
+    :param the_sub_dir: directory for batch type (see volcano_sub_dir)
+    :param the_entry: VolcanoData for batch
+    :param the_data_format: 'json', 'columns', or 'binary' (see volcano_data_filename)
+    :param the_gzip_flag: if True, gzip compress file
+    :return: full path to file written
+    """
+    batch_data_file: str = os.path.join(the_sub_dir, volcano_data_filename(the_entry.m_batch_a, the_data_format, the_gzip_flag))
+    print(f"volcano_data batch_data_file={batch_data_file}", flush=True)
+    with open(batch_data_file, 'wb') as raw_file:
+        # mtime zero, so the same data gives the same file
+        out_file: io.BufferedIOBase = raw_file
+        if the_gzip_flag:
+            out_file = gzip.GzipFile(filename='', mode='wb', fileobj=raw_file, mtime=0)
+        try:
+            if 'binary' == the_data_format:
+                the_entry.write_columns_binary(out_file)
+            else:
+                text_file: io.TextIOWrapper = io.TextIOWrapper(out_file, encoding='utf-8')
+                if 'columns' == the_data_format:
+                    the_entry.write_columns_json(text_file)
+                else:
+                    the_entry.write_json(text_file)
+                # flush and detach, so closing the wrapper does not close out_file
+                text_file.flush()
+                text_file.detach()
+        finally:
+            if the_gzip_flag:
+                out_file.close()
+    return batch_data_file
+
+
+def volcano_calc_file(the_sub_dir: str, the_log_frame_flag: bool) -> None:
+    """
+    Write Volcano-Calc.txt file for a batch type, noting log-frame or linear data
+    :param the_sub_dir: directory for batch type (see volcano_sub_dir)
+    :param the_log_frame_flag: True if data is log transformed
+    :return: nothing
+    """
+    calc_file: str = os.path.join(the_sub_dir, 'Volcano-Calc.txt')
+    out_file: io.TextIOWrapper
+    with open(calc_file, 'w', encoding='utf-8') as out_file:
+        if the_log_frame_flag:
+            out_file.write("log-frame-data")
+        else:
+            out_file.write("linear-data")
+
+
+def volcano_error_file(the_sub_dir: str) -> None:
+    """
+    Write error.log for a batch type with no volcano results
+    :param the_sub_dir: directory for batch type (see volcano_sub_dir)
+    :return: nothing
+    """
+    # write error.log Unable to calculate volcano plot results\n
+    error_file: str = os.path.join(the_sub_dir, 'error.log')
+    print(f"volcano_data error_file={error_file}", flush=True)
+    out_file: io.TextIOWrapper
+    with open(error_file, 'w', encoding='utf-8') as out_file:
+        out_file.write('Unable to calculate volcano plot results\n')
+
+
 # pylint: disable=too-many-arguments
 def volcano_data(the_file_path: str, the_batch_type_list: List[str], the_data_list: List[VolcanoData],
-                 the_log_frame_flag: bool, the_sub_dir_a: Optional[str] = None, the_sub_dir_b: Optional[str] = None) -> None:
+                 the_log_frame_flag: bool, the_sub_dir_a: Optional[str] = None, the_sub_dir_b: Optional[str] = None,
+                 the_data_format: str = 'json', the_gzip_flag: bool = False) -> None:
     print(f"volcano_data the_file_path={the_file_path}", flush=True)
     batch_type: str
     for batch_type in the_batch_type_list:
         written: bool = False
-        sub_dir: str = os.path.join(the_file_path, batch_type)
-        if the_sub_dir_a is not None:
-            sub_dir = os.path.join(sub_dir, the_sub_dir_a)
-        if the_sub_dir_b is not None:
-            sub_dir = os.path.join(sub_dir, the_sub_dir_b)
-        if not os.path.exists(sub_dir):
-            os.makedirs(sub_dir)
+        sub_dir: str = volcano_sub_dir(the_file_path, batch_type, the_sub_dir_a, the_sub_dir_b)
         print(f"volcano_data batch type dir={sub_dir}", flush=True)
         data_found: bool = False
         my_entry: VolcanoData
         for my_entry in the_data_list:
             if batch_type == my_entry.m_batch_type:
                 data_found = True
-                my_batch: str = my_entry.m_batch_a
-                batch_data_file: str = os.path.join(sub_dir, f'Volcano-Data-{convert_to_filename(my_batch)}.json')
-                print(f"volcano_data batch_data_file={batch_data_file}", flush=True)
-                out_file: io.TextIOWrapper
-                with open(batch_data_file, 'w', encoding='utf-8') as out_file:
-                    my_entry.write_json(out_file)
+                volcano_data_entry(sub_dir, my_entry, the_data_format, the_gzip_flag)
                 if not written:
-                    calc_file: str = os.path.join(sub_dir, 'Volcano-Calc.txt')
-                    with open(calc_file, 'w', encoding='utf-8') as out_file:
-                        if the_log_frame_flag:
-                            out_file.write("log-frame-data")
-                        else:
-                            out_file.write("linear-data")
+                    volcano_calc_file(sub_dir, the_log_frame_flag)
                 written = True
         if not data_found:
-            # write error.log Unable to calculate volcano plot results\n
-            error_file: str = os.path.join(sub_dir, 'error.log')
-            print(f"volcano_data error_file={error_file}", flush=True)
-            out_file: io.TextIOWrapper
-            with open(error_file, 'w', encoding='utf-8') as out_file:
-                out_file.write('Unable to calculate volcano plot results\n')
+            volcano_error_file(sub_dir)
 # pylint: enable=too-many-arguments
 
 
 # pylint: disable=too-many-arguments
 def volcano_plot(the_out_dir: str, the_data_list: List[VolcanoData], the_title: str, the_log_frame_flag: bool,
-                 the_sub_dir_a: Optional[str] = None, the_sub_dir_b: Optional[str] = None) -> None:
+                 the_sub_dir_a: Optional[str] = None, the_sub_dir_b: Optional[str] = None,
+                 the_density_flag: bool = False) -> None:
     print(f"volcano_plot the_out_dir={the_out_dir}", flush=True)
-    my_entry: VolcanoData
-    for my_entry in the_data_list:
-        my_batch_type: str = my_entry.m_batch_type
-        base_path: str = os.path.join(the_out_dir, my_batch_type)
-        if the_sub_dir_a is not None:
-            base_path = os.path.join(base_path, the_sub_dir_a)
-        if the_sub_dir_b is not None:
-            base_path = os.path.join(base_path, the_sub_dir_b)
-        if not os.path.exists(base_path):
-            os.makedirs(base_path)
-        png_path: str = os.path.join(base_path, f"Volcano-Diagram-{convert_to_filename(my_entry.m_batch_a)}.png")
-        title_path: str = os.path.join(base_path, f"Volcano-Title-{convert_to_filename(my_entry.m_batch_a)}.txt")
-        print(f"volcano_plot png_path={png_path}", flush=True)
-        print(f"volcano_plot title_path={title_path}", flush=True)
-        volcano_plot_obj(png_path, title_path, my_entry, the_title, the_log_frame_flag)
+    # one figure and canvas for all batches
+    renderer: VolcanoRenderer = VolcanoRenderer(the_log_frame_flag, the_density_flag)
+    try:
+        my_entry: VolcanoData
+        for my_entry in the_data_list:
+            base_path: str = volcano_sub_dir(the_out_dir, my_entry.m_batch_type, the_sub_dir_a, the_sub_dir_b)
+            png_path: str = os.path.join(base_path, f"Volcano-Diagram-{convert_to_filename(my_entry.m_batch_a)}.png")
+            title_path: str = os.path.join(base_path, f"Volcano-Title-{convert_to_filename(my_entry.m_batch_a)}.txt")
+            print(f"volcano_plot png_path={png_path}", flush=True)
+            print(f"volcano_plot title_path={title_path}", flush=True)
+            renderer.render(png_path, title_path, my_entry, the_title)
+    finally:
+        renderer.close()
 # pylint: enable=too-many-arguments
 
 
@@ -126,3 +220,111 @@ def volcano_plot_obj(the_png_path: str, the_title_path: str, the_data: VolcanoDa
     figure.savefig(the_png_path)
     matplotlib.pyplot.close(figure)
     print("volcano_plot done", flush=True)
+
+
+# pylint: disable=too-many-instance-attributes
+class VolcanoRenderer:
+    """
+    Render many volcano plots with one Agg canvas. The figure, axes, threshold lines,
+    and scatter are made once, and only the points, limits, and title change between batches.
+    PNG files match those from volcano_plot_obj.
+    With m_density_flag, points are binned into a rasterized 2D histogram image instead of a scatter,
+    for very large feature counts.
+    MEMBER VALUES
+    m_log_frame_flag: bool - True if data is log transformed (used in title)
+    m_density_flag: bool - True to draw binned density image instead of points
+    m_density_bins: Tuple[int, int] - number of x and y bins for density image
+    m_figure: Figure - figure reused for all plots
+    m_canvas: FigureCanvasAgg - Agg canvas for figure
+    m_axes: matplotlib.pylab.Axes - axes reused for all plots
+    m_points: matplotlib.collections.PathCollection - scatter points (not density)
+    m_density: matplotlib.image.AxesImage - density image (density)
+    """
+    # do not set method variables, as they should be initialized in the init function
+    m_log_frame_flag: bool
+    m_density_flag: bool
+    m_density_bins: Tuple[int, int]
+    m_figure: Figure
+    m_canvas: FigureCanvasAgg
+    m_axes: matplotlib.pylab.Axes
+    m_points: Optional[matplotlib.collections.PathCollection]
+    m_density: Optional[matplotlib.image.AxesImage]
+
+    def __init__(self: 'VolcanoRenderer', the_log_frame_flag: bool, the_density_flag: bool = False,
+                 the_density_bins: Tuple[int, int] = (320, 240)) -> None:
+        """
+        init figure and artists, in the same order as volcano_plot_obj.
+        Members described at class level
+        :param the_log_frame_flag: True if data is log transformed
+        :param the_density_flag: True to draw binned density image instead of points
+        :param the_density_bins: number of x and y bins for density image
+        """
+        super().__init__()
+        self.m_log_frame_flag = the_log_frame_flag
+        self.m_density_flag = the_density_flag
+        self.m_density_bins = the_density_bins
+        # same size and style as matplotlib.pyplot.subplots, without pyplot figure management
+        self.m_figure = Figure()
+        self.m_canvas = FigureCanvasAgg(self.m_figure)
+        self.m_axes = self.m_figure.add_subplot()
+        self.m_points = None
+        self.m_density = None
+        if self.m_density_flag:
+            self.m_density = self.m_axes.imshow(numpy.ma.masked_all((2, 2)), origin='lower', aspect='auto',
+                                                interpolation='nearest', cmap='Blues', extent=(-3.0, 3.0, -3.0, 3.0))
+        else:
+            self.m_points = self.m_axes.scatter(x=[], y=[], s=1)
+        self.m_axes.set_xlabel("Log2 Fold Change")
+        self.m_axes.set_ylabel("-Log10 Adjusted P-Value")
+        self.m_axes.axvline(-2, color="grey", linestyle="--")
+        self.m_axes.axvline(2, color="grey", linestyle="--")
+        self.m_axes.axhline(2, color="grey", linestyle="--")
+
+    def render(self: 'VolcanoRenderer', the_png_path: str, the_title_path: str, the_data: VolcanoData, the_title: str) -> None:
+        """
+        Write title file and PNG for one batch
+        :param the_png_path: full path for PNG file
+        :param the_title_path: full path for title file
+        :param the_data: VolcanoData for batch
+        :param the_title: title for dataset
+        :return: nothing
+        """
+        my_title: str = f"{the_title} - {the_data.m_batch_type} - {the_data.m_batch_a}"
+        print(f"VolcanoRenderer::render the_png_path={the_png_path}", flush=True)
+        out_file: io.TextIOWrapper
+        with open(the_title_path, 'w', encoding='utf-8') as out_file:
+            out_file.write(my_title)
+        # limits computed as in volcano_plot_obj
+        # pylint: disable=nested-min-max
+        x_lim: Tuple[float, float] = (min(-3.0, min(the_data.m_fold_change)), max(3.0, max(the_data.m_fold_change)))
+        y_lim: Tuple[float, float] = (min(-3.0, min(the_data.m_trans_pvalues)), max(3.0, max(the_data.m_trans_pvalues)))
+        # pylint: enable=nested-min-max
+        x_values: numpy.ndarray = numpy.asarray(the_data.m_fold_change, dtype=numpy.float64)
+        y_values: numpy.ndarray = numpy.asarray(the_data.m_trans_pvalues, dtype=numpy.float64)
+        if self.m_density_flag:
+            finite: numpy.ndarray = numpy.isfinite(x_values) & numpy.isfinite(y_values)
+            counts: numpy.ndarray
+            counts, _, _ = numpy.histogram2d(x_values[finite], y_values[finite], bins=self.m_density_bins,
+                                             range=[list(x_lim), list(y_lim)])
+            # log scale counts, empty bins are transparent
+            image: numpy.ma.MaskedArray = numpy.ma.masked_equal(numpy.log1p(counts.T), 0.0)
+            self.m_density.set_data(image)
+            self.m_density.set_extent((x_lim[0], x_lim[1], y_lim[0], y_lim[1]))
+            self.m_density.set_clim(0.0, max(1.0, float(numpy.log1p(counts.max(initial=0.0)))))
+        else:
+            self.m_points.set_offsets(numpy.column_stack((x_values, y_values)))
+        self.m_axes.set_xlim(x_lim[0], x_lim[1])
+        self.m_axes.set_ylim(y_lim[0], y_lim[1])
+        if self.m_log_frame_flag:
+            self.m_axes.set_title(f"{my_title} (log-frame-data)")
+        else:
+            self.m_axes.set_title(f"{my_title} (linear-data)")
+        self.m_figure.savefig(the_png_path)
+
+    def close(self: 'VolcanoRenderer') -> None:
+        """
+        Release figure resources
+        :return: nothing
+        """
+        self.m_figure.clear()
+# pylint: enable=too-many-instance-attributes